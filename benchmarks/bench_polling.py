@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Benchmark SpellClient polling against a local fake Spell API
+
+Drives N concurrent ``SpellClient.wait_for_run`` (or ``SpellRunOperator``)
+instances and reports wall time, API calls per run, the lag between a run
+reaching a final status and its waiter noticing, and CPU / memory use.
+Results are appended to a JSON lines file and compared with the previous
+result for the same scenario, so regressions show up.
+
+    $ python benchmarks/bench_polling.py --concurrency 1 100 1000
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import logging
+import os
+from statistics import median
+import sys
+from time import process_time, time
+from typing import Any, Dict, List
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_spell_api import DEFAULT_TIMELINE, FakeSpellApi  # noqa: E402
+
+from airflow_spell import SpellClient, SpellRunOperator  # noqa: E402
+from airflow_spell.hooks.spell_client import (  # noqa: E402
+    SpellHook,
+    SpellRunStatusPoller,
+)
+from airflow_spell.hooks.spell_errors import SpellCircuitBreaker  # noqa: E402
+from airflow_spell.hooks.spell_polling import ExponentialPollingPolicy  # noqa: E402
+
+
+CONN_ID = "spell_bench"
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results", "polling.jsonl")
+
+
+def run_scenario(
+    mode: str,
+    concurrency: int,
+    latency: float,
+    throttle_rate: float,
+    batch_polling: bool,
+    max_interval: float,
+) -> Dict[str, Any]:
+    # clients, pollers and circuits of the connection are shared per process;
+    # each scenario starts a new fake API, so none may outlive its scenario
+    SpellHook._clients.clear()
+    SpellRunStatusPoller._pollers.clear()
+    SpellCircuitBreaker._breakers.clear()
+    with FakeSpellApi(latency=latency, throttle_rate=throttle_rate) as api:
+        os.environ["AIRFLOW_CONN_%s" % CONN_ID.upper()] = json.dumps(
+            {
+                "conn_type": "spell",
+                "host": "bench",
+                "password": "bench-token",
+                "extra": {"base_url": api.url},
+            }
+        )
+
+        def wait(index: int) -> Dict[str, Any]:
+            try:
+                return {"run_id": int(submit_and_wait(index)), "detected_at": time()}
+            except Exception as e:
+                return {"run_id": None, "detected_at": None, "error": str(e)}
+
+        def submit_and_wait(index: int) -> int:
+            policy = ExponentialPollingPolicy(max_interval=max_interval)
+            if mode == "operator":
+                operator = SpellRunOperator(
+                    task_id="bench-%d" % index,
+                    spell_conn_id=CONN_ID,
+                    batch_polling=batch_polling,
+                    polling_policy=policy,
+                    reattach=False,
+                    command="echo %d" % index,
+                )
+                run_id = operator.execute({})
+            else:
+                run_id = api.create_run(command="echo %d" % index)
+                client = SpellClient(
+                    spell_conn_id=CONN_ID,
+                    batch_polling=batch_polling,
+                    polling_policy=policy,
+                )
+                client.wait_for_run(run_id, delay=0)
+            return run_id
+
+        started_at = time()
+        cpu_started_at = process_time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            waits = list(executor.map(wait, range(concurrency)))
+        wall_time = time() - started_at
+        cpu_time = process_time() - cpu_started_at
+
+    lags = sorted(
+        waited["detected_at"] - api.runs[waited["run_id"]].final_at
+        for waited in waits
+        if waited["run_id"] is not None
+    ) or [0.0]
+    calls = sum(count for name, count in api.calls.items() if name != "throttled")
+    return {
+        "wall_time": wall_time,
+        "failed_runs": sum(1 for waited in waits if waited["run_id"] is None),
+        "api_calls_per_run": calls / concurrency,
+        "throttled_responses": api.calls["throttled"],
+        "detection_lag_p50": median(lags),
+        "detection_lag_p95": lags[int(0.95 * (len(lags) - 1))],
+        "detection_lag_max": lags[-1],
+        "cpu_time": cpu_time,
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def report(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    lines = []
+    for metric, value in current.items():
+        line = "    %-22s %10.3f" % (metric, value)
+        before = previous.get(metric)
+        if before:
+            line += " (%+.1f%% vs previous)" % (100 * (value - before) / before)
+        lines.append(line)
+    return lines
+
+
+def load_previous(path: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    previous: Dict[str, Any] = {}
+    if not os.path.exists(path):
+        return previous
+    with open(path) as results:
+        for line in results:
+            result = json.loads(line)
+            if result["scenario"] == scenario:
+                previous = result["results"]
+    return previous
+
+
+def _max_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--mode", choices=["client", "operator"], default="client")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--batch-polling", action="store_true")
+    parser.add_argument("--max-interval", type=float, default=5.0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    # status lines from thousands of waiters would dominate the measurement
+    logging.disable(logging.INFO)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+    for concurrency in args.concurrency:
+        scenario = {
+            "mode": args.mode,
+            "concurrency": concurrency,
+            "latency": args.latency,
+            "throttle_rate": args.throttle_rate,
+            "batch_polling": args.batch_polling,
+            "max_interval": args.max_interval,
+            "timeline": DEFAULT_TIMELINE,
+        }
+        previous = load_previous(args.output, json.loads(json.dumps(scenario)))
+        results = run_scenario(
+            args.mode,
+            concurrency,
+            args.latency,
+            args.throttle_rate,
+            args.batch_polling,
+            args.max_interval,
+        )
+
+        print("%s x %d" % (args.mode, concurrency))
+        print("\n".join(report(previous, results)))
+
+        with open(args.output, "a") as output:
+            output.write(
+                json.dumps(
+                    {
+                        "recorded_at": datetime.now(timezone.utc).isoformat(),
+                        "scenario": scenario,
+                        "results": results,
+                    }
+                )
+                + "\n"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+A local stand-in for the subset of the Spell API used by airflow-spell, with
+scripted run-status timelines, injected latency and HTTP 429 throttling
+"""
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from random import random
+import re
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+# (status, seconds in that status); the run is "complete" afterwards
+DEFAULT_TIMELINE = [
+    ("machine_requested", 1.0),
+    ("building", 1.0),
+    ("running", 3.0),
+    ("saving", 0.5),
+]
+
+RUN_URL = re.compile(r"^/v1/runs/(?P<owner>[^/]+)/(?P<run_id>\d+)(?P<action>/\w+)?$")
+RUNS_URL = re.compile(r"^/v1/runs/(?P<owner>[^/]+)$")
+
+
+class FakeRun:
+    def __init__(
+        self,
+        run_id: int,
+        timeline: List[Tuple[str, float]],
+        final_status: str,
+        fields: Dict[str, Any],
+    ):
+        self.run_id = run_id
+        self.timeline = timeline
+        self.final_status = final_status
+        self.fields = fields
+        self.created_at = time()
+        self.final_at = self.created_at + sum(seconds for _, seconds in timeline)
+        self.stopped_at: Optional[float] = None
+
+    def status(self, now: float) -> str:
+        if self.stopped_at is not None and now >= self.stopped_at:
+            return "stopped"
+        elapsed = now - self.created_at
+        for status, seconds in self.timeline:
+            if elapsed < seconds:
+                return status
+            elapsed -= seconds
+        return self.final_status
+
+    def document(self, now: float) -> Dict[str, Any]:
+        status = self.status(now)
+        final = status in ("complete", "failed", "stopped", "killed", "interrupted")
+        ended_at = self.stopped_at if status == "stopped" else self.final_at
+        return {
+            "id": self.run_id,
+            "status": status,
+            "command": self.fields.get("command", ""),
+            "creator": None,
+            "gpu": self.fields.get("machine_type", "CPU"),
+            "git_commit_hash": None,
+            "description": self.fields.get("description"),
+            "framework": None,
+            "docker_image": self.fields.get("docker_image"),
+            "created_at": _isoformat(self.created_at),
+            "ended_at": _isoformat(ended_at) if final else None,
+            "user_exit_code": 0 if status == "complete" else None,
+        }
+
+
+class FakeSpellApi:
+    """
+    Serve fake spell runs on ``http://127.0.0.1:<port>``; pass :attr:`url` as
+    the ``base_url`` extra of the spell connection
+
+    :param timeline: the statuses every run moves through, and for how long
+    :param latency: seconds added to every response
+    :param throttle_rate: the fraction of requests answered with HTTP 429
+    :param retry_after: the ``Retry-After`` seconds of throttled responses
+    """
+
+    def __init__(
+        self,
+        timeline: Optional[List[Tuple[str, float]]] = None,
+        latency: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+    ):
+        self.timeline = timeline if timeline is not None else DEFAULT_TIMELINE
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.runs: Dict[int, FakeRun] = {}
+        # requests per endpoint ("get_run", "list_runs", ...) and per run
+        self.calls: Counter = Counter()
+        self.run_calls: Counter = Counter()
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 1024
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def start(self) -> "FakeSpellApi":
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeSpellApi":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def create_run(self, final_status: str = "complete", **fields) -> int:
+        with self._lock:
+            run_id = len(self.runs) + 1
+            self.runs[run_id] = FakeRun(run_id, self.timeline, final_status, fields)
+        return run_id
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                api._respond(self, "GET")
+
+            def do_POST(self):
+                api._respond(self, "POST")
+
+        return Handler
+
+    def _respond(self, request: BaseHTTPRequestHandler, method: str):
+        if self.latency:
+            sleep(self.latency)
+
+        length = int(request.headers.get("Content-Length") or 0)
+        body = json.loads(request.rfile.read(length) or b"{}") if length else {}
+
+        if self.throttle_rate and random() < self.throttle_rate:
+            self.calls["throttled"] += 1
+            return _send(request, 429, {}, {"Retry-After": str(self.retry_after)})
+
+        url = urlparse(request.path)
+        now = time()
+        run_match = RUN_URL.match(url.path)
+        runs_match = RUNS_URL.match(url.path)
+
+        if run_match and run_match.group("run_id"):
+            run_id = int(run_match.group("run_id"))
+            run = self.runs.get(run_id)
+            if run is None:
+                return _send(request, 404, {"errors": ["run not found"]})
+            action = (run_match.group("action") or "").strip("/")
+            self.calls[action or "get_run"] += 1
+            self.run_calls[run_id] += 1
+
+            if action in ("stop", "kill"):
+                run.stopped_at = now
+                return _send(request, 200, {})
+            if action == "logs":
+                return _send_lines(request, [{"finished": True}])
+            return _send(request, 200, {"run": run.document(now)})
+
+        if runs_match and method == "POST":
+            self.calls["new_run"] += 1
+            run_id = self.create_run(**body)
+            return _send(request, 200, {"run": self.runs[run_id].document(now)})
+
+        if runs_match:
+            self.calls["list_runs"] += 1
+            page_size = int(parse_qs(url.query).get("page_size", ["100"])[0])
+            run_ids = sorted(self.runs, reverse=True)[:page_size]
+            return _send(
+                request, 200, {"runs": [self.runs[i].document(now) for i in run_ids]}
+            )
+
+        return _send(request, 404, {"errors": ["unknown resource"]})
+
+
+def _send(
+    request: BaseHTTPRequestHandler,
+    status: int,
+    payload: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None,
+):
+    body = json.dumps(payload).encode()
+    request.send_response(status)
+    request.send_header("Content-Type", "application/json")
+    request.send_header("Content-Length", str(len(body)))
+    for name, value in (headers or {}).items():
+        request.send_header(name, value)
+    request.end_headers()
+    request.wfile.write(body)
+
+
+def _send_lines(request: BaseHTTPRequestHandler, lines: List[Dict[str, Any]]):
+    body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+    request.send_response(200)
+    request.send_header("Content-Type", "application/json")
+    request.send_header("Content-Length", str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
@@ -12,4 +12,11 @@ setup(
         "apache-airflow>=2.0,<3.0",
         "spell>=0.38.4,<1.0",
     ],
+    entry_points={
+        "console_scripts": [
+            "airflow-spell-bulk-submit=airflow_spell.cli.bulk_submit:main",
+            "airflow-spell-phase-report=airflow_spell.cli.phase_report:main",
+            "airflow-spell-webhook-receiver=airflow_spell.cli.webhook_receiver:main",
+        ],
+    },
 )
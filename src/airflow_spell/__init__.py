@@ -1,8 +1,14 @@
 from airflow_spell.hooks.spell_client import SpellClient
 from airflow_spell.operators.spell_run import SpellRunOperator
+from airflow_spell.operators.spell_run_batch import SpellRunBatchOperator
+from airflow_spell.operators.spell_run_outputs import SpellRunOutputsOperator
+from airflow_spell.operators.spell_run_sweep import SpellRunSweepOperator
 
 
 __all__ = [
     "SpellClient",
+    "SpellRunBatchOperator",
     "SpellRunOperator",
+    "SpellRunOutputsOperator",
+    "SpellRunSweepOperator",
 ]
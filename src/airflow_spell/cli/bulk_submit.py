@@ -0,0 +1,296 @@
+"""
+Submit the spell runs of a JSONL manifest, one ``runs.new`` keyword
+arguments object per line, and wait for all of them, outside of any DAG
+
+    $ airflow-spell-bulk-submit runs.jsonl --conn-id spell_default --workers 16
+
+Progress is appended to a checkpoint file (``<manifest>.checkpoint`` by
+default), so an interrupted job started again with the same manifest
+resumes: runs already submitted are monitored rather than submitted again,
+and runs already finished are only counted in the summary. Runs that failed
+submission are submitted again, and runs whose status could not be checked
+are checked again.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+import json
+import os
+import sys
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Dict, List, Optional, Sequence, TextIO
+
+from airflow_spell.hooks.spell_client import SpellClient, SpellRunStatus
+
+
+# the status recorded for runs that failed submission, or their status check
+SUBMIT_FAILED = "submit_failed"
+CHECK_FAILED = "check_failed"
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    The run arguments of every non-empty line of a JSONL manifest
+
+    :rtype: List[Dict[str, Any]]
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def spec_hash(run_spec: Dict[str, Any]) -> str:
+    return sha256(json.dumps(run_spec, sort_keys=True).encode()).hexdigest()
+
+
+def load_checkpoint(path: str) -> Dict[int, Dict[str, Any]]:
+    """
+    The progress of each manifest entry (by index) recorded in a checkpoint
+    file: its ``spell_run_id`` once submitted, and ``status`` and
+    ``user_exit_code`` once finished. A line cut short by an interruption is
+    ignored
+
+    :rtype: Dict[int, Dict[str, Any]]
+    """
+    progress: Dict[int, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return progress
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            progress.setdefault(record.pop("index"), {}).update(record)
+    return progress
+
+
+class Checkpoint:
+    """
+    Append-only JSONL record of the progress of a bulk submission, written
+    through to disk one line at a time
+
+    :param f: the checkpoint file, opened for appending
+    :type f: TextIO
+    """
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self._lock = Lock()
+
+    def record(self, index: int, **progress: Any):
+        line = json.dumps(dict(progress, index=index), default=str)
+        with self._lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+
+def submit_runs(
+    client: SpellClient,
+    manifest: List[Dict[str, Any]],
+    progress: Dict[int, Dict[str, Any]],
+    checkpoint: Checkpoint,
+    workers: int,
+) -> int:
+    """
+    Submit the manifest entries without a run yet, ``workers`` at a time
+
+    :return: the number of submissions attempted
+    :rtype: int
+    """
+    # runs that failed submission are submitted again on resume
+    pending = [
+        index
+        for index in range(len(manifest))
+        if progress.get(index, {}).get("spell_run_id") is None
+    ]
+
+    def submit(index: int):
+        try:
+            run = client.client.runs.new(**manifest[index])
+        except Exception as e:
+            print("Run %d failed submission: %s" % (index, e), file=sys.stderr)
+            entry = {"status": SUBMIT_FAILED, "error": str(e)}
+        else:
+            entry = {
+                "spell_run_id": run.id,
+                "spec_hash": spec_hash(manifest[index]),
+                "status": None,
+                "error": None,
+            }
+        checkpoint.record(index, **entry)
+        progress.setdefault(index, {}).update(entry)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(submit, pending))
+    return len(pending)
+
+
+def monitor_runs(
+    client: SpellClient,
+    progress: Dict[int, Dict[str, Any]],
+    checkpoint: Checkpoint,
+    poll_interval: float,
+):
+    """
+    Check every submitted run that has not finished, a round of status
+    checks (shared through the connection's status poller) every
+    ``poll_interval`` seconds, until all of them reach a final status; a run
+    whose status check fails is recorded as ``check_failed`` and no longer
+    checked
+    """
+    # runs that failed their status check are checked again on resume
+    pending = [
+        index
+        for index, entry in progress.items()
+        if entry.get("spell_run_id") is not None
+        and entry.get("status") in (None, CHECK_FAILED)
+    ]
+    while pending:
+        for index in list(pending):
+            spell_run_id = progress[index]["spell_run_id"]
+            try:
+                run = client._check_run(spell_run_id)
+            except Exception as e:
+                print(
+                    "Run %d (%s) status check failed: %s" % (index, spell_run_id, e),
+                    file=sys.stderr,
+                )
+                entry = {"status": CHECK_FAILED, "error": str(e)}
+            else:
+                if run.status not in SpellRunStatus.FINAL:
+                    continue
+                entry = {
+                    "status": run.status,
+                    "user_exit_code": run.user_exit_code,
+                    "error": None,
+                }
+            checkpoint.record(index, **entry)
+            progress[index].update(entry)
+            pending.remove(index)
+        if pending:
+            print("%d of %d runs still running" % (len(pending), len(progress)))
+            sleep(poll_interval)
+
+
+def succeeded(entry: Dict[str, Any]) -> bool:
+    return entry.get("status") == SpellRunStatus.COMPLETE and (
+        entry.get("user_exit_code") in (None, 0, "0")
+    )
+
+
+def format_submit_summary(
+    progress: Dict[int, Dict[str, Any]], submitted: int, submit_seconds: float
+) -> str:
+    """
+    The summary of the submissions alone, for a job that does not wait for
+    its runs
+    """
+    lines = [_submit_rate(submitted, submit_seconds)]
+    failed = sorted(
+        index
+        for index, entry in progress.items()
+        if entry.get("status") == SUBMIT_FAILED
+    )
+    if failed:
+        lines.append("Failed submissions of manifest entries: %s" % failed)
+    return "\n".join(lines)
+
+
+def format_summary(
+    progress: Dict[int, Dict[str, Any]],
+    submitted: int,
+    submit_seconds: float,
+    total_seconds: float,
+) -> str:
+    statuses: Dict[str, int] = {}
+    for entry in progress.values():
+        status = str(entry.get("status") or "unfinished")
+        statuses[status] = statuses.get(status, 0) + 1
+    failed = sorted(index for index, entry in progress.items() if not succeeded(entry))
+    lines = [
+        _submit_rate(submitted, submit_seconds),
+        "%d of %d runs succeeded in %.1f seconds"
+        % (len(progress) - len(failed), len(progress), total_seconds),
+    ]
+    lines.extend(
+        "  %-16s %d" % (status, count) for status, count in sorted(statuses.items())
+    )
+    if failed:
+        lines.append("Failed manifest entries: %s" % failed)
+    return "\n".join(lines)
+
+
+def _submit_rate(submitted: int, submit_seconds: float) -> str:
+    return "Submitted %d runs in %.1f seconds (%.2f runs/second)" % (
+        submitted,
+        submit_seconds,
+        submitted / submit_seconds if submit_seconds else 0,
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("manifest", help="JSONL file of runs.new keyword arguments")
+    parser.add_argument("--conn-id", help="Airflow connection id for spell")
+    parser.add_argument("--owner", help="Spell owner (if different from user account)")
+    parser.add_argument(
+        "--workers", type=int, default=8, help="runs submitted at the same time"
+    )
+    parser.add_argument(
+        "--checkpoint", help="the checkpoint file (default: <manifest>.checkpoint)"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=30.0, help="seconds between checks"
+    )
+    parser.add_argument(
+        "--no-wait", action="store_true", help="submit the runs without monitoring"
+    )
+    args = parser.parse_args(argv)
+
+    manifest = load_manifest(args.manifest)
+    checkpoint_path = args.checkpoint or args.manifest + ".checkpoint"
+    progress = load_checkpoint(checkpoint_path)
+    changed = [
+        index
+        for index, entry in progress.items()
+        if "spec_hash" in entry
+        and (index >= len(manifest) or entry["spec_hash"] != spec_hash(manifest[index]))
+    ]
+    if changed:
+        parser.error(
+            "manifest entries %s changed since the checkpoint %s was written"
+            % (changed, checkpoint_path)
+        )
+    if progress:
+        print(
+            "Resuming from %s: %d of %d runs already submitted"
+            % (
+                checkpoint_path,
+                sum(1 for entry in progress.values() if entry.get("spell_run_id")),
+                len(manifest),
+            )
+        )
+
+    client = SpellClient(
+        spell_conn_id=args.conn_id, spell_owner=args.owner, batch_polling=True
+    )
+    started_at = monotonic()
+    with open(checkpoint_path, "a") as f:
+        checkpoint = Checkpoint(f)
+        submitted = submit_runs(client, manifest, progress, checkpoint, args.workers)
+        submit_seconds = monotonic() - started_at
+        if not args.no_wait:
+            monitor_runs(client, progress, checkpoint, args.poll_interval)
+
+    if args.no_wait:
+        print(format_submit_summary(progress, submitted, submit_seconds))
+        return
+    print(format_summary(progress, submitted, submit_seconds, monotonic() - started_at))
+    if not all(succeeded(entry) for entry in progress.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
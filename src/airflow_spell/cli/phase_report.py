@@ -0,0 +1,59 @@
+"""
+Report the mean time spell runs spent in each phase (queued, building,
+pushing, running, saving), grouped by machine type and docker image, from the
+run profiles recorded by SpellRunOperator on this host
+
+    $ airflow-spell-phase-report --days 7 --group-by machine_type docker_image
+"""
+import argparse
+from time import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from airflow_spell.hooks.spell_profile import PHASES, REPORT_GROUPS, SpellRunProfiles
+
+
+def format_report(report: List[Dict[str, Any]], group_by: Sequence[str]) -> str:
+    phases = sorted(set(PHASES.values()))
+    widths = [
+        max([len(column)] + [len(str(group[column] or "-")) for group in report])
+        for column in group_by
+    ]
+    header = "  ".join(
+        [column.ljust(width) for column, width in zip(group_by, widths)]
+        + ["runs".rjust(6)]
+        + [phase.rjust(10) for phase in phases]
+    )
+    lines = [header, "-" * len(header)]
+    for group in report:
+        lines.append(
+            "  ".join(
+                [
+                    str(group[column] or "-").ljust(width)
+                    for column, width in zip(group_by, widths)
+                ]
+                + ["%6d" % group["runs"]]
+                + ["%10.0f" % group[phase] for phase in phases]
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--path", help="the profile store (default: spell_profiles.db)")
+    parser.add_argument("--days", type=float, help="only runs of the last days")
+    parser.add_argument(
+        "--group-by",
+        nargs="+",
+        choices=REPORT_GROUPS,
+        default=["machine_type", "docker_image"],
+    )
+    args = parser.parse_args(argv)
+
+    since = time() - args.days * 24 * 3600 if args.days else None
+    report = SpellRunProfiles(path=args.path).report(args.group_by, since)
+    print(format_report(report, args.group_by))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Receive spell run status notifications (webhooks) on this host and wake the
+SpellRunOperator tasks and triggers waiting for those runs with
+``wait_for_webhooks``; run it alongside the triggerer and workers
+
+    $ airflow-spell-webhook-receiver --host 0.0.0.0 --port 8787
+
+Notifications are JSON objects ``{"run_id": 42, "status": "complete"}`` (or a
+run document under ``run``) posted to any path; with a secret (``--secret`` or
+``$AIRFLOW_SPELL_WEBHOOK_SECRET``) each body must be signed in the
+``X-Spell-Signature`` header with its hex HMAC-SHA256.
+"""
+import argparse
+import os
+from typing import Optional, Sequence
+
+from airflow_spell.hooks.spell_webhooks import SpellRunEvents, SpellWebhookReceiver
+
+
+SECRET_ENV = "AIRFLOW_SPELL_WEBHOOK_SECRET"
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=8787, help="the port to listen on")
+    parser.add_argument(
+        "--secret",
+        default=os.environ.get(SECRET_ENV),
+        help="the shared secret notifications are signed with (default: $%s)"
+        % SECRET_ENV,
+    )
+    parser.add_argument(
+        "--path", help="the notification store (default: spell_run_events.db)"
+    )
+    args = parser.parse_args(argv)
+
+    receiver = SpellWebhookReceiver(
+        events=SpellRunEvents.for_path(args.path),
+        host=args.host,
+        port=args.port,
+        secret=args.secret,
+    )
+    try:
+        receiver.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
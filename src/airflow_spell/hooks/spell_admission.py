@@ -0,0 +1,197 @@
+from time import sleep, time
+from typing import Dict, Optional, Union
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_store import connect, local_store_path
+
+
+class SpellAdmissionController(LoggingMixin):
+    """
+    Per machine type concurrency quotas for spell runs, shared by every
+    process on a host through a local SQLite store
+
+    A run is submitted only once it holds one of its machine type's slots;
+    waiting runs are admitted by descending priority, then in arrival order.
+    Slots are leases: the holder renews its slot at every status check and
+    releases it once the run ends, and slots of crashed processes expire
+    after ``lease_timeout`` seconds without renewal.
+
+    :param key: the quota name; runs with the same key share slots
+    :type key: str
+
+    :param quotas: the concurrent runs allowed per machine type; machine
+        types without a quota are admitted at once
+    :type quotas: Dict[str, int]
+
+    :param path: the SQLite database path; defaults to ``spell_admission.db``
+        in the local store directory
+    :type path: Optional[str]
+
+    :param poll_interval: seconds between admission checks of a waiting run
+    :type poll_interval: Union[int, float]
+
+    :param lease_timeout: seconds a slot is held without renewal
+    :type lease_timeout: Union[int, float]
+
+    :param tags: tags of the ``spell.admission.wait`` metric
+    :type tags: Optional[Dict[str, str]]
+    """
+
+    def __init__(
+        self,
+        key: str,
+        quotas: Dict[str, int],
+        path: Optional[str] = None,
+        poll_interval: Union[int, float] = 5.0,
+        lease_timeout: Union[int, float] = 1800.0,
+        tags: Optional[Dict[str, str]] = None,
+    ):
+        super().__init__()
+        self.key = key
+        self.quotas = {
+            machine_type: int(quota) for machine_type, quota in quotas.items()
+        }
+        self.path = path or local_store_path("spell_admission.db")
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.tags = tags or spell_metrics.stats_tags(key, None)
+        with connect(self.path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS admission_slots ("
+                " key TEXT NOT NULL,"
+                " machine_type TEXT NOT NULL,"
+                " ticket TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (key, ticket))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS admission_queue ("
+                " key TEXT NOT NULL,"
+                " machine_type TEXT NOT NULL,"
+                " ticket TEXT NOT NULL,"
+                " priority INTEGER NOT NULL,"
+                " enqueued_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (key, ticket))"
+            )
+
+    def acquire(self, ticket: str, machine_type: str, priority: int = 1) -> float:
+        """
+        Wait for a slot of the machine type, ahead of lower priority runs
+
+        :param ticket: identifies the run holding the slot
+        :type ticket: str
+
+        :param machine_type: the spell machine type of the run
+        :type machine_type: str
+
+        :param priority: the run priority, e.g. the task ``priority_weight``
+        :type priority: int
+
+        :return: seconds spent waiting for the slot
+        :rtype: float
+        """
+        if machine_type not in self.quotas:
+            return 0.0
+
+        started_at = time()
+        while not self._try_acquire(ticket, machine_type, priority, started_at):
+            sleep(self.poll_interval)
+        waited = time() - started_at
+
+        spell_metrics.timing("admission.wait", waited, self.tags)
+        if waited >= self.poll_interval:
+            self.log.info(
+                "Spell admission (%s) waited %.0f seconds for a %s slot"
+                % (self.key, waited, machine_type)
+            )
+        return waited
+
+    def renew(self, ticket: str, machine_type: str):
+        """
+        Extend the lease of a slot, taking one for a run that is already
+        submitted (e.g. reattached) if it has none
+        """
+        if machine_type not in self.quotas:
+            return
+        with connect(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO admission_slots VALUES (?, ?, ?, ?)",
+                (self.key, machine_type, ticket, time() + self.lease_timeout),
+            )
+
+    def release(self, ticket: str):
+        with connect(self.path) as db:
+            db.execute(
+                "DELETE FROM admission_slots WHERE key = ? AND ticket = ?",
+                (self.key, ticket),
+            )
+            db.execute(
+                "DELETE FROM admission_queue WHERE key = ? AND ticket = ?",
+                (self.key, ticket),
+            )
+
+    def _try_acquire(
+        self, ticket: str, machine_type: str, priority: int, enqueued_at: float
+    ) -> bool:
+        """
+        Queue the run (or refresh its place in the queue) and take a slot if
+        one is free and no run ahead of it is waiting
+
+        :rtype: bool
+        """
+        now = time()
+        # waiters check at every poll_interval; a waiter missing a few checks is gone
+        queue_expires_at = now + max(30.0, 3 * self.poll_interval)
+        with connect(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM admission_slots WHERE expires_at < ?", (now,))
+                db.execute("DELETE FROM admission_queue WHERE expires_at < ?", (now,))
+                held = db.execute(
+                    "SELECT 1 FROM admission_slots WHERE key = ? AND ticket = ?",
+                    (self.key, ticket),
+                ).fetchone()
+                if held is not None:
+                    # e.g. a retried task whose earlier try was admitted
+                    db.execute("COMMIT")
+                    return True
+
+                db.execute(
+                    "INSERT OR IGNORE INTO admission_queue VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.key, machine_type, ticket, priority, enqueued_at, 0),
+                )
+                db.execute(
+                    "UPDATE admission_queue SET expires_at = ?"
+                    " WHERE key = ? AND ticket = ?",
+                    (queue_expires_at, self.key, ticket),
+                )
+                used = db.execute(
+                    "SELECT COUNT(*) FROM admission_slots"
+                    " WHERE key = ? AND machine_type = ?",
+                    (self.key, machine_type),
+                ).fetchone()[0]
+                head = db.execute(
+                    "SELECT ticket FROM admission_queue"
+                    " WHERE key = ? AND machine_type = ?"
+                    " ORDER BY priority DESC, enqueued_at, ticket LIMIT 1",
+                    (self.key, machine_type),
+                ).fetchone()[0]
+
+                admitted = used < self.quotas[machine_type] and head == ticket
+                if admitted:
+                    db.execute(
+                        "DELETE FROM admission_queue WHERE key = ? AND ticket = ?",
+                        (self.key, ticket),
+                    )
+                    db.execute(
+                        "INSERT OR REPLACE INTO admission_slots VALUES (?, ?, ?, ?)",
+                        (self.key, machine_type, ticket, now + self.lease_timeout),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return admitted
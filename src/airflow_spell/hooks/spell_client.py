@@ -1,47 +1,294 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+import os
 from random import uniform
-from time import sleep
-from typing import List, Optional, Union
+import re
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from airflow.exceptions import AirflowException
 from airflow.hooks.base import BaseHook
 from airflow.utils.log.logging_mixin import LoggingMixin
-from spell.client import SpellClient as ExternalSpellClient
-from spell.client.runs import Run as ExternalSpellRun
-from spell.client.runs import RunsService as ExternalSpellRunsService
-from spell.cli.commands.ps import status_names
+
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_admission import SpellAdmissionController
+from airflow_spell.hooks.spell_distributed import SpellDistributedRunMonitor
+from airflow_spell.hooks.spell_errors import (
+    SpellCircuitBreaker,
+    is_transient_error,
+    retry_after,
+)
+from airflow_spell.hooks.spell_polling import (
+    ExponentialPollingPolicy,
+    SpellPollingPolicy,
+    run_elapsed,
+)
+from airflow_spell.hooks.spell_outputs import SpellRunOutputs
+from airflow_spell.hooks.spell_rate_limit import SpellRateLimiter
+from airflow_spell.hooks.spell_webhooks import SpellRunEvents
+
+# the spell SDK (and its CLI) is slow to import, so it is only imported when a
+# client is built or a run is fetched; DAG files can import this module cheaply
+if TYPE_CHECKING:
+    from airflow.models import Connection
+    from spell.client import SpellClient as ExternalSpellClient
+    from spell.client.runs import Run as ExternalSpellRun
 
 
 class SpellHook(BaseHook):
+    """
+    Builds spell API clients for an Airflow connection
+
+    Clients are cached per (connection, owner) and shared by every hook in the
+    process, so operators, triggers and pollers reuse one resolved connection
+    and one pool of keep-alive HTTP connections. A cached client is reused for
+    ``client_ttl`` seconds (a connection extra, :attr:`CLIENT_TTL` by default;
+    0 disables the cache), after which the connection is read again and the
+    client is rebuilt only if its host, token or extras changed. A connection
+    defined by an ``AIRFLOW_CONN_*`` environment variable is checked at every
+    request, so a changed ``base_url`` or token takes effect at once. Clients
+    getting an authentication error (HTTP 401/403) or failing to connect are
+    dropped from the cache, so the connection is read again at the next
+    request.
+
+    :param spell_conn_id: Airflow connection id for spell
+    :type spell_conn_id: str
+
+    :param owner: Spell owner (if different from the connection host)
+    :type owner: Optional[str]
+    """
+
+    # seconds a resolved connection and its client are reused
+    CLIENT_TTL = 300
+    # keep-alive HTTP connections kept per client
+    CLIENT_POOL_SIZE = 32
+
+    _clients: Dict[Tuple[Optional[str], Optional[str]], "_CachedClient"] = {}
+    _clients_lock = Lock()
+
     def __init__(self, spell_conn_id="spell_default", owner: Optional[str] = None):
         super().__init__()
         self.spell_conn_id = spell_conn_id
         self.owner = owner
 
-    def get_client(self):
-        if self.owner is not None:
-            owner = self.owner
+    def get_client(self) -> "ExternalSpellClient":
+        key = (self.spell_conn_id, self.owner)
+        uri = self._connection_uri()
+        with self._clients_lock:
+            cached = self._clients.get(key)
+        if cached is not None and monotonic() < cached.expires_at and cached.uri == uri:
+            return cached.client
+
+        # the connection may be read from the metastore or a secrets backend and
+        # the client is slow to build, so neither holds the lock; it only guards
+        # the swap of the cache entry
+        connection = self.get_connection(self.spell_conn_id)
+        extras = connection.extra_dejson
+        ttl = float(extras.get("client_ttl", self.CLIENT_TTL))
+        if cached is not None and cached.resolves(connection):
+            self.log.debug("Spell connection %s unchanged" % self.spell_conn_id)
+            client = cached.client
+        else:
+            client = self._build_client(connection)
+        if ttl <= 0:
+            return client
+
+        with self._clients_lock:
+            current = self._clients.get(key)
+            if (
+                current is not None
+                and current is not cached
+                and current.resolves(connection)
+            ):
+                # another hook refreshed the same connection meanwhile
+                client = current.client
+            self._clients[key] = _CachedClient(
+                client=client,
+                host=connection.host,
+                token=connection.password,
+                extras=extras,
+                uri=uri,
+                expires_at=monotonic() + ttl,
+            )
+        return client
+
+    def invalidate_client(self):
+        """
+        Drop the cached client of this connection, so the next
+        :meth:`get_client` reads the connection again and builds a new one
+        """
+        with self._clients_lock:
+            self._clients.pop((self.spell_conn_id, self.owner), None)
+
+    def _connection_uri(self) -> Optional[str]:
+        # the environment variable defining the connection, cheap to read
+        # unlike a connection stored in the metastore or a secrets backend
+        return os.environ.get("AIRFLOW_CONN_%s" % str(self.spell_conn_id).upper())
+
+    def _build_client(self, connection: "Connection") -> "ExternalSpellClient":
+        from requests.adapters import HTTPAdapter
+        from spell.client import SpellClient as ExternalSpellClient
+
+        owner = self.owner if self.owner is not None else connection.host
+        extras = connection.extra_dejson
+        if extras.get("base_url"):
+            client = ExternalSpellClient(
+                token=connection.password, owner=owner, base_url=extras["base_url"]
+            )
         else:
-            owner = self._get_owner()
+            client = ExternalSpellClient(token=connection.password, owner=owner)
+
+        pool_size = int(extras.get("pool_size", self.CLIENT_POOL_SIZE))
+        client.api.session.mount(
+            client.api.base_url,
+            HTTPAdapter(pool_connections=1, pool_maxsize=pool_size),
+        )
+        self._invalidate_on_error(client.api)
+        spell_metrics.instrument_api(
+            client.api, spell_metrics.stats_tags(self.spell_conn_id, self.owner)
+        )
+
+        rate_limiter = self.get_rate_limiter(extras)
+        if rate_limiter is not None:
+            rate_limiter.wrap(client.api)
+
+        return client
+
+    def _invalidate_on_error(self, api: Any):
+        import requests
+
+        request = api.request
+
+        @wraps(request)
+        def invalidating_request(*args, **kwargs):
+            try:
+                response = request(*args, **kwargs)
+            except Exception as e:
+                # spell wraps the requests exception of a failed connection
+                if isinstance(getattr(e, "exception", None), requests.ConnectionError):
+                    self.log.warning(
+                        "Spell API connection failed for connection %s; the"
+                        " connection will be read again" % self.spell_conn_id
+                    )
+                    self.invalidate_client()
+                raise
+            if getattr(response, "status_code", None) in (401, 403):
+                self.log.warning(
+                    "Spell API authentication failed for connection %s; the"
+                    " connection will be read again" % self.spell_conn_id
+                )
+                self.invalidate_client()
+            return response
+
+        api.request = invalidating_request
+
+    def get_rate_limiter(
+        self, extras: Optional[Dict[str, Any]] = None
+    ) -> Optional[SpellRateLimiter]:
+        """
+        Host-wide rate limiter for the Spell API requests of this connection,
+        configured by the ``rate_limit`` (requests per second) and
+        ``rate_limit_burst`` connection extras; None without ``rate_limit``
+
+        :param extras: the connection extras, if already read
+        :type extras: Optional[Dict[str, Any]]
+        """
+        if extras is None:
+            extras = self.get_connection(self.spell_conn_id).extra_dejson
+        if not extras.get("rate_limit"):
+            return None
+        return SpellRateLimiter(
+            key=str(self.spell_conn_id),
+            rate=float(extras["rate_limit"]),
+            burst=float(extras.get("rate_limit_burst", 1)),
+            tags=spell_metrics.stats_tags(self.spell_conn_id, self.owner),
+        )
 
-        return ExternalSpellClient(token=self._get_token(), owner=owner)
+    def get_admission_controller(self) -> Optional[SpellAdmissionController]:
+        """
+        Host-wide admission controller for the runs of this connection,
+        configured by the ``machine_quotas`` connection extra (concurrent runs
+        per machine type, e.g. ``{"GPU-V100": 10}``); None without quotas
+        """
+        extras = self.get_connection(self.spell_conn_id).extra_dejson
+        if not extras.get("machine_quotas"):
+            return None
+        return SpellAdmissionController(
+            key=str(self.spell_conn_id),
+            quotas=extras["machine_quotas"],
+            poll_interval=float(extras.get("admission_poll_interval", 5)),
+            tags=spell_metrics.stats_tags(self.spell_conn_id, self.owner),
+        )
+
+
+class _CachedClient(NamedTuple):
+    client: "ExternalSpellClient"
+    host: Optional[str]
+    token: Optional[str]
+    extras: Dict[str, Any]
+    uri: Optional[str]
+    expires_at: float
+
+    def resolves(self, connection: "Connection") -> bool:
+        # whether the client was built from the same host, token and extras
+        return (
+            self.host == connection.host
+            and self.token == connection.password
+            and self.extras == connection.extra_dejson
+        )
 
-    def _get_token(self):
-        # get_connection is on BaseHook
-        connection_object = self.get_connection(self.spell_conn_id)
-        return connection_object.password
 
-    def _get_owner(self):
-        connection_object = self.get_connection(self.spell_conn_id)
-        return connection_object.host
+class _CachedRun(NamedTuple):
+    run: "ExternalSpellRun"
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class SpellRunStatus:
+    """
+    Spell run statuses, as in ``spell.client.runs.RunsService`` and
+    ``spell.cli.commands.ps.status_names``, without importing the spell SDK
+    """
+
+    BUILDING = "building"
+    RUNNING = "running"
+    SAVING = "saving"
+    PUSHING = "pushing"
+    COMPLETE = "complete"
+    FAILED = "failed"
+    STOPPED = "stopped"
+    KILLED = "killed"
+    INTERRUPTED = "interrupted"
+    FINAL = (COMPLETE, FAILED, STOPPED, INTERRUPTED, KILLED)
+    QUEUED = ("user_requested", "machine_requested")
 
 
 STILL_RUNNING = [
-    ExternalSpellRunsService.BUILDING,
-    ExternalSpellRunsService.PUSHING,
-    ExternalSpellRunsService.RUNNING,
-    ExternalSpellRunsService.SAVING,
+    SpellRunStatus.BUILDING,
+    SpellRunStatus.PUSHING,
+    SpellRunStatus.RUNNING,
+    SpellRunStatus.SAVING,
 ]
 
+# statuses of a run submitted by an earlier task try that can be monitored again
+REATTACHABLE_STATUS = (
+    STILL_RUNNING + list(SpellRunStatus.QUEUED) + [SpellRunStatus.COMPLETE]
+)
+
 
 class SpellClient(LoggingMixin):
     MAX_RETRIES = 4200
@@ -51,14 +298,72 @@ class SpellClient(LoggingMixin):
     DEFAULT_DELAY_MIN = 1
     DEFAULT_DELAY_MAX = 10
 
+    # run log output written to the task log per status check
+    DEFAULT_MAX_LOG_BYTES = 64 * 1024
+
+    # transient API errors in a row a status check survives, and the longest
+    # pause between its attempts
+    TRANSIENT_RETRIES = 30
+    TRANSIENT_DELAY_MAX = 300
+
+    # seconds a fetched run document is reused for, and the runs kept (the
+    # least recently used are dropped)
+    RUN_CACHE_TTL = 5.0
+    RUN_CACHE_SIZE = 1024
+
+    # abort_patterns for fatal failures that show early in a training run
+    COMMON_ABORT_PATTERNS = [
+        r"CUDA out of memory",
+        r"CUDA error: out of memory",
+        r"\bloss\b.*\bnan\b",
+    ]
+
     def __init__(
-        self, spell_conn_id: Optional[str] = None, spell_owner: Optional[str] = None
+        self,
+        spell_conn_id: Optional[str] = None,
+        spell_owner: Optional[str] = None,
+        batch_polling: bool = False,
+        polling_policy: Optional[SpellPollingPolicy] = None,
+        stream_logs: bool = False,
+        max_log_bytes: int = DEFAULT_MAX_LOG_BYTES,
+        abort_patterns: Optional[List[str]] = None,
+        wait_for_webhooks: bool = False,
     ):
         super().__init__()
         self.spell_conn_id = spell_conn_id
         self.spell_owner = spell_owner
+        self.batch_polling = batch_polling
+        self.polling_policy = polling_policy or ExponentialPollingPolicy()
+        self.stream_logs = stream_logs
+        self.max_log_bytes = max_log_bytes
+        # a run log line matching one of these regular expressions stops the run
+        self.abort_patterns = list(abort_patterns or [])
+        self._abort_regexes = [re.compile(pattern) for pattern in self.abort_patterns]
+        # the first (pattern, line) match of the abort patterns
+        self.abort_match: Optional[Tuple[str, str]] = None
+        # wake from the pause between status checks on a run notification
+        self.wait_for_webhooks = wait_for_webhooks
+        # the next run log line to stream and a callback to save it
+        self.log_offset = 0
+        # run ID -> the next run log line to observe and match, which runs
+        # ahead of the written offset once the output is capped
+        self._observed_offsets: Dict[str, int] = {}
+        self.log_offset_callback: Optional[Callable[[int], None]] = None
+        # follows the ranks of a distributed run through its log output
+        self.distributed_monitor: Optional[SpellDistributedRunMonitor] = None
+        # called with the run document at every status check
+        self.status_callback: Optional[Callable[[Any], None]] = None
+        # metric tag and per-run counters reported through airflow Stats
+        self.machine_type: Optional[str] = None
+        self.poll_count = 0
+        self.sleep_time = 0.0
+        # the statuses seen while waiting for the run, with when each was first seen
+        self.status_timeline: List[Tuple[str, float]] = []
+        self._progress_at = 0.0
+        # the last document fetched per run, for conditional requests and reuse
+        self._run_documents: "OrderedDict[str, _CachedRun]" = OrderedDict()
         self._hook: Optional[SpellHook] = None
-        self._client: Optional[ExternalSpellClient] = None
+        self._client: Optional["ExternalSpellClient"] = None
 
     @property
     def hook(self) -> SpellHook:
@@ -69,10 +374,21 @@ class SpellClient(LoggingMixin):
         return self._hook
 
     @property
-    def client(self) -> ExternalSpellClient:
-        if self._client is None:
-            self._client = self.hook.get_client()
-        return self._client
+    def client(self) -> "ExternalSpellClient":
+        # the hook caches clients per connection; _client pins one
+        if self._client is not None:
+            return self._client
+        return self.hook.get_client()
+
+    @property
+    def stats_tags(self) -> Dict[str, str]:
+        return spell_metrics.stats_tags(
+            self.spell_conn_id, self.spell_owner, self.machine_type
+        )
+
+    @property
+    def status_poller(self) -> "SpellRunStatusPoller":
+        return SpellRunStatusPoller.for_connection(self.spell_conn_id, self.spell_owner)
 
     def wait_for_run(self, run_id: str, delay: Optional[Union[int, float]] = None):
         """
@@ -86,6 +402,10 @@ class SpellClient(LoggingMixin):
 
         :raises: AirflowException
         """
+        self.poll_count = 0
+        self.sleep_time = 0.0
+        self.status_timeline = []
+        self.abort_match = None
         _delay(delay)
         self._poll_for_run_running(run_id, delay)
         self._poll_for_run_complete(run_id, delay)
@@ -103,10 +423,21 @@ class SpellClient(LoggingMixin):
 
         :raises: AirflowException
         """
-        run: ExternalSpellRun = self._get_run(run_id)
+        run: "ExternalSpellRun" = self._get_recent_run(run_id)
         run_status = run.status
 
-        if run_status == ExternalSpellRunsService.COMPLETE:
+        if run_status == SpellRunStatus.COMPLETE:
+            if self.distributed_monitor is not None and (
+                self.distributed_monitor.failed_nodes()
+            ):
+                raise AirflowException(
+                    "Spell run (%s) completed but distributed run ranks %s failed: %s"
+                    % (
+                        run_id,
+                        self.distributed_monitor.failed_nodes(),
+                        self.distributed_monitor.summary(),
+                    )
+                )
             if int(run.user_exit_code) == 0:
                 self.log.info("Spell run (%s) completed: %s" % (run_id, run))
                 return True
@@ -116,7 +447,7 @@ class SpellClient(LoggingMixin):
                     % (run_id, run)
                 )
 
-        if run_status == ExternalSpellRunsService.FAILED:
+        if run_status == SpellRunStatus.FAILED:
             raise AirflowException("Spell run (%s) failed: %s" % (run_id, run))
 
         if run_status in STILL_RUNNING:
@@ -126,8 +457,343 @@ class SpellClient(LoggingMixin):
             "Spell (%s) has unknown status (%s): %s" % (run_id, run_status, run)
         )
 
-    def _get_run(self, run_id: str) -> ExternalSpellRun:
-        return ExternalSpellRun(self.client.api, self.client.api.get_run(run_id))
+    def stream_run_logs(
+        self, run_id: str, offset: int, max_bytes: int, write: bool = True
+    ) -> int:
+        """
+        Write the spell run log lines from ``offset`` to the task log, stopping
+        after ``max_bytes`` of written output; lines are streamed from the Spell
+        API one at a time, so at most one line is held in memory. Every line
+        read is also passed to the :attr:`distributed_monitor`, if any, and
+        matched against the ``abort_patterns``, once: past the cap the lines
+        are still read to the end of the log for them, only not written
+
+        :param run_id: a spell run ID
+        :type run_id: str
+
+        :param offset: the first log line to write
+        :type offset: int
+
+        :param max_bytes: the log output written before stopping
+        :type max_bytes: int
+
+        :param write: write the lines to the task log
+        :type write: bool
+
+        :return: the offset of the next log line to write
+        :rtype: int
+        """
+        entries = self.client.api.get_run_log_entries(
+            run_id, follow=False, offset=offset
+        )
+        observed = self._observed_offsets.get(str(run_id), 0)
+        line_number = offset
+        written = 0
+        capped = False
+        try:
+            for entry in entries:
+                line_number += 1
+                line = str(entry.log or "")
+                if line_number > observed:
+                    if self.distributed_monitor is not None:
+                        self.distributed_monitor.observe(line)
+                    if self.abort_match is None:
+                        self._match_abort_patterns(line)
+                if capped:
+                    if not self._observes_logs():
+                        break
+                    continue
+                offset = line_number
+                if not write:
+                    continue
+
+                self.log.info("Spell run (%s) log: %s" % (run_id, line))
+                written += len(line.encode())
+                if written >= max_bytes:
+                    capped = True
+                    self.log.info(
+                        "Spell run (%s) log output capped at %d bytes;"
+                        " resuming from line %d on the next check"
+                        % (run_id, max_bytes, offset)
+                    )
+        finally:
+            entries.close()
+        self._observed_offsets[str(run_id)] = max(observed, line_number)
+        return offset
+
+    @property
+    def reads_logs(self) -> bool:
+        """
+        Whether the run log is read at status checks: to write it to the task
+        log, to follow distributed ranks or to match abort patterns
+        """
+        return (
+            self.stream_logs
+            or self.distributed_monitor is not None
+            or bool(self._abort_regexes)
+        )
+
+    def _observes_logs(self) -> bool:
+        # whether lines past the output cap are still read
+        return self.distributed_monitor is not None or (
+            bool(self._abort_regexes) and self.abort_match is None
+        )
+
+    def _match_abort_patterns(self, line: str):
+        for pattern, regex in zip(self.abort_patterns, self._abort_regexes):
+            if regex.search(line):
+                self.log.warning(
+                    "Spell run log line matched abort pattern (%s): %s"
+                    % (pattern, line)
+                )
+                self.abort_match = (pattern, line)
+                return
+
+    def _stream_run_logs(self, run_id: str):
+        try:
+            offset = self.stream_run_logs(
+                run_id, self.log_offset, self.max_log_bytes, write=self.stream_logs
+            )
+        except Exception as e:
+            self.log.info("Spell run (%s) log streaming failed: %s" % (run_id, e))
+            return
+
+        if offset != self.log_offset:
+            self.log_offset = offset
+            if self.log_offset_callback is not None:
+                self.log_offset_callback(offset)
+
+    def stop_run(self, run_id: str, reason: str) -> bool:
+        """
+        Stop the spell run, writing the status timeline that led to it in the
+        task log
+
+        :param run_id: a spell run ID
+        :type run_id: str
+
+        :param reason: why the run is stopped
+        :type reason: str
+
+        :return: whether the run was stopped
+        :rtype: bool
+        """
+        self.log.warning(
+            "Stopping Spell run (%s): %s\n%s"
+            % (run_id, reason, self._format_status_timeline())
+        )
+        try:
+            self.client.api.stop_run(run_id)
+        except Exception as e:
+            self.log.warning("Spell run (%s) could not be stopped: %s" % (run_id, e))
+            return False
+        self.log.info("Spell run (%s) stopped" % run_id)
+        return True
+
+    def cancel_run(self, run_id: str, reason: str):
+        """
+        Stop the spell run and fail the task
+
+        :raises: AirflowException
+        """
+        self.stop_run(run_id, reason)
+        raise AirflowException("Spell run (%s) cancelled: %s" % (run_id, reason))
+
+    def download_run_outputs(
+        self,
+        run_id: str,
+        destination: str,
+        patterns: Optional[List[str]] = None,
+        max_workers: int = 8,
+        verify_checksum: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Download the run outputs matching any of the glob ``patterns`` into
+        ``destination``, skipping files whose local copy is already current;
+        see :class:`~airflow_spell.hooks.spell_outputs.SpellRunOutputs`
+
+        :param run_id: a spell run ID
+        :type run_id: str
+
+        :param destination: the local directory to download into
+        :type destination: str
+
+        :param patterns: globs of output paths relative to the run
+        :type patterns: Optional[List[str]]
+
+        :param max_workers: the number of files downloaded at the same time
+        :type max_workers: int
+
+        :param verify_checksum: re-download files whose local copy no longer
+            matches the checksum recorded when it was downloaded
+        :type verify_checksum: bool
+
+        :rtype: Dict[str, Any]
+        :raises: AirflowException
+        """
+        outputs = SpellRunOutputs(
+            self.client.api,
+            max_workers=max_workers,
+            verify_checksum=verify_checksum,
+            tags=self.stats_tags,
+        )
+        return outputs.download(run_id, destination, patterns)
+
+    def _format_status_timeline(self) -> str:
+        lines = ["Spell run status timeline:"]
+        ends = [seen_at for _, seen_at in self.status_timeline[1:]] + [time()]
+        for (status, seen_at), ended_at in zip(self.status_timeline, ends):
+            lines.append(
+                "  %s  %-20s %.0f seconds"
+                % (
+                    datetime.fromtimestamp(seen_at, timezone.utc).isoformat(),
+                    status,
+                    ended_at - seen_at,
+                )
+            )
+        return "\n".join(lines)
+
+    def _get_run(self, run_id: str) -> "ExternalSpellRun":
+        with spell_metrics.timer("get_run", self.stats_tags):
+            if self.batch_polling:
+                return self.status_poller.get_run(run_id)
+            return self._probe_run(run_id)
+
+    @property
+    def run_events(self) -> SpellRunEvents:
+        return SpellRunEvents.for_path()
+
+    @property
+    def circuit_breaker(self) -> SpellCircuitBreaker:
+        return SpellCircuitBreaker.for_connection(self.spell_conn_id, self.spell_owner)
+
+    def _check_run(self, run_id: str) -> "ExternalSpellRun":
+        """
+        Fetch the run for a status check, retrying transient API errors
+        (throttling, server errors, failed connections) with exponential
+        backoff that honours ``Retry-After``, up to :attr:`TRANSIENT_RETRIES`
+        in a row; while the API keeps failing, the connection's
+        :attr:`circuit_breaker` pauses every status check in the process.
+        Permanent errors are raised at once
+
+        :raises: AirflowException
+        """
+        failures = 0
+        while True:
+            self.circuit_breaker.wait()
+            try:
+                run = self._get_run(run_id)
+            except Exception as e:
+                failures += 1
+                sleep(self._retry_pause(run_id, e, failures))
+                continue
+            self.circuit_breaker.record_success()
+            return run
+
+    async def _async_check_run(self, run_id: str) -> "ExternalSpellRun":
+        """
+        :meth:`_check_run` for an event loop, e.g. a trigger on the triggerer:
+        the request is handed to the loop's default executor and the pauses
+        are awaited
+
+        :raises: AirflowException
+        """
+        loop = asyncio.get_event_loop()
+        failures = 0
+        while True:
+            await self.circuit_breaker.async_wait()
+            try:
+                run = await loop.run_in_executor(None, self._get_run, run_id)
+            except Exception as e:
+                failures += 1
+                await asyncio.sleep(self._retry_pause(run_id, e, failures))
+                continue
+            self.circuit_breaker.record_success()
+            return run
+
+    def _retry_pause(self, run_id: str, error: Exception, failures: int) -> float:
+        """
+        Seconds to pause before retrying a status check that failed with a
+        transient error; permanent errors are raised again
+
+        :raises: AirflowException after :attr:`TRANSIENT_RETRIES` in a row
+        """
+        if not is_transient_error(error):
+            # the API answered, so it is up
+            self.circuit_breaker.record_success()
+            raise error
+        wait = retry_after(error)
+        self.circuit_breaker.record_failure(wait)
+        spell_metrics.incr("get_run.transient_error", self.stats_tags)
+        if failures > self.TRANSIENT_RETRIES:
+            raise AirflowException(
+                "Spell run (%s) status checks failed %d times in a row: %s"
+                % (run_id, failures, error)
+            )
+        pause = min(self.TRANSIENT_DELAY_MAX, uniform(0.5, 1.0) * 2**failures)
+        pause = max(pause, wait or 0.0)
+        self.log.warning(
+            "Spell run (%s) status check failed with a transient error"
+            " (%d of %d), retrying in %.2f seconds: %s"
+            % (run_id, failures, self.TRANSIENT_RETRIES, pause, error)
+        )
+        return pause
+
+    def _get_recent_run(self, run_id: str) -> "ExternalSpellRun":
+        """
+        The run document of the last status check if the run had reached a
+        final status or it is at most :attr:`RUN_CACHE_TTL` seconds old,
+        otherwise a new one
+        """
+        cached = self._run_documents.get(str(run_id))
+        if cached is not None and (
+            cached.run.status in SpellRunStatus.FINAL
+            or monotonic() - cached.fetched_at <= self.RUN_CACHE_TTL
+        ):
+            spell_metrics.incr("get_run.cached", self.stats_tags)
+            self._run_documents.move_to_end(str(run_id))
+            return cached.run
+        return self._get_run(run_id)
+
+    def _probe_run(self, run_id: str) -> "ExternalSpellRun":
+        """
+        Fetch the run document with a conditional request, so a run that did
+        not change since the last check is answered with an empty
+        ``304 Not Modified`` and its cached document is reused rather than
+        downloaded and parsed again
+        """
+        from spell.api.utils import url_path_join
+
+        api = self.client.api
+        # kept until a new document replaces it: after an error the next
+        # check is still a conditional request
+        cached = self._run_documents.get(str(run_id))
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        response = api.request(
+            "get", url_path_join("runs", api.owner, str(run_id)), headers=headers
+        )
+        if response.status_code == 304 and cached is not None:
+            spell_metrics.incr("get_run.not_modified", self.stats_tags)
+            run = cached.run
+        else:
+            api.check_and_raise(response)
+            run = _external_run(api, api.get_json(response)["run"])
+
+        self._run_documents[str(run_id)] = _CachedRun(
+            run,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            monotonic(),
+        )
+        self._run_documents.move_to_end(str(run_id))
+        if len(self._run_documents) > self.RUN_CACHE_SIZE:
+            # the least recently used run
+            self._run_documents.popitem(last=False)
+        return run
 
     def _poll_for_run_running(self, run_id: str, delay: Union[int, float, None] = None):
         """
@@ -151,11 +817,13 @@ class SpellClient(LoggingMixin):
         """
         _delay(delay)
         running_status = [
-            ExternalSpellRunsService.BUILDING,
-            ExternalSpellRunsService.RUNNING,
-            ExternalSpellRunsService.SAVING,
-            ExternalSpellRunsService.PUSHING,
-        ] + list(status_names.keys())
+            SpellRunStatus.BUILDING,
+            SpellRunStatus.RUNNING,
+            SpellRunStatus.SAVING,
+            SpellRunStatus.PUSHING,
+        ]
+        running_status += list(SpellRunStatus.QUEUED)
+        running_status += list(SpellRunStatus.FINAL)
         self._poll_run_status(run_id, running_status)
 
     def _poll_for_run_complete(
@@ -177,12 +845,13 @@ class SpellClient(LoggingMixin):
         :raises: AirflowException
         """
         _delay(delay)
-        complete_status = ExternalSpellRunsService.FINAL
+        complete_status = SpellRunStatus.FINAL
         self._poll_run_status(run_id, complete_status)
 
     def _poll_run_status(self, run_id: str, match_status: List[str]) -> bool:
         """
-        Poll for job status using an exponential back-off strategy (with max_retries).
+        Poll for job status, pausing between checks as decided by the
+        ``polling_policy`` (with max_retries and the policy timeout).
 
         :param run_id: a spell ID
         :type run_id: str
@@ -196,10 +865,26 @@ class SpellClient(LoggingMixin):
         :raises: AirflowException
         """
         retries = 0
+        started_at = monotonic()
         while True:
 
-            run = self._get_run(run_id)
+            checked_at = time()
+            run = self._check_run(run_id)
             run_status = run.status
+            self.poll_count += 1
+            spell_metrics.incr("poll", self.stats_tags)
+
+            now = time()
+            if not self.status_timeline or self.status_timeline[-1][0] != run_status:
+                self.status_timeline.append((run_status, now))
+                self._progress_at = now
+            if self.reads_logs:
+                log_offset = self.log_offset
+                self._stream_run_logs(run_id)
+                if self.log_offset != log_offset:
+                    self._progress_at = now
+            if self.status_callback is not None:
+                self.status_callback(run)
 
             self.log.debug(
                 "Spell run (%s) check status (%s) in %s"
@@ -207,15 +892,48 @@ class SpellClient(LoggingMixin):
             )
 
             if run_status in match_status:
+                if run_status in SpellRunStatus.FINAL:
+                    self.polling_policy.record_run(run)
+                    spell_metrics.gauge("run.polls", self.poll_count, self.stats_tags)
+                    spell_metrics.timing(
+                        "run.sleep_time", self.sleep_time, self.stats_tags
+                    )
                 return True
 
-            if retries >= self.MAX_RETRIES:
-                raise AirflowException(
-                    "Spell run (%s) status checks exceed max_retries" % run_id
+            if self.abort_match is not None:
+                self.cancel_run(
+                    run_id,
+                    "log line matched abort pattern (%s): %s" % self.abort_match,
                 )
 
+            if self.distributed_monitor is not None:
+                failed = self.distributed_monitor.failed_nodes()
+                if failed:
+                    self.cancel_run(
+                        run_id,
+                        "distributed run ranks %s failed: %s"
+                        % (failed, self.distributed_monitor.summary()),
+                    )
+
+            if retries >= self.MAX_RETRIES:
+                self.cancel_run(run_id, "status checks exceed max_retries")
+
+            elapsed = run_elapsed(run, monotonic() - started_at)
+            status_elapsed = now - self._progress_at
+            reason = self.polling_policy.limit_exceeded(
+                run_status, status_elapsed, elapsed
+            )
+            if reason is not None:
+                self.cancel_run(run_id, reason)
+
             retries += 1
-            pause = _exponential_delay(retries)
+            pause = self.polling_policy.next_delay(run, retries, elapsed)
+            time_to_limit = self.polling_policy.time_to_limit(
+                run_status, status_elapsed, elapsed
+            )
+            if time_to_limit is not None:
+                # check again as the limit runs out rather than long after
+                pause = min(pause, max(1.0, time_to_limit))
 
             self.log.info(
                 "Spell run (%s) current status (%s), next check (%d of %d)"
@@ -223,7 +941,202 @@ class SpellClient(LoggingMixin):
                 % (run_id, run_status, retries, self.MAX_RETRIES, pause)
             )
 
+            with spell_metrics.timer("sleep", self.stats_tags):
+                self.sleep_time += self._pause(run_id, pause, checked_at)
+
+    def _pause(self, run_id: str, pause: Union[int, float], checked_at: float) -> float:
+        """
+        Pause between status checks; with ``wait_for_webhooks``, a run status
+        notification received since the last check ends the pause at once, so
+        the polling pause is only a fallback for missed notifications
+
+        :return: seconds paused
+        :rtype: float
+        """
+        if not self.wait_for_webhooks:
             _delay(pause)
+            return pause
+        started_at = monotonic()
+        status = self.run_events.wait(run_id, _add_jitter(pause), since=checked_at)
+        if status is not None:
+            spell_metrics.incr("webhook.wake", self.stats_tags)
+            self.log.info(
+                "Spell run (%s) notification (%s), checking status now"
+                % (run_id, status)
+            )
+        return monotonic() - started_at
+
+
+class SpellRunStatusPoller(LoggingMixin):
+    """
+    Share spell run status requests between every waiter in a process
+
+    Waiters call :meth:`get_run`; the first waiter to find the shared status
+    table older than ``interval`` refreshes it for every watched run with a
+    single ``list_runs`` request, made without holding the lock, while the
+    other waiters keep reading the previous table. Watched runs that fall
+    outside the listing are fetched one by one and the listing grows to cover
+    them next time, so API calls per interval grow with the listing pages
+    rather than the waiters.
+
+    Use :meth:`for_connection` to get the poller shared by a spell connection.
+
+    :param hook: the spell hook used to build the API client
+    :type hook: SpellHook
+
+    :param interval: seconds a status table is reused before it is refreshed
+    :type interval: Union[int, float]
+    """
+
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
+    # seconds; a status table is shared for this long
+    DEFAULT_INTERVAL = 10
+    # runs not requested for this many intervals are no longer watched
+    WATCH_EXPIRY_INTERVALS = 3
+
+    _pollers: Dict[Tuple[Optional[str], Optional[str]], "SpellRunStatusPoller"] = {}
+    _pollers_lock = Lock()
+
+    def __init__(self, hook: SpellHook, interval: Union[int, float] = DEFAULT_INTERVAL):
+        super().__init__()
+        self.hook = hook
+        self.interval = interval
+        self.page_size = self.PAGE_SIZE
+        self._lock = Lock()
+        self._watched: Dict[str, float] = {}
+        self._runs: Dict[str, "ExternalSpellRun"] = {}
+        self._refreshed_at: Optional[float] = None
+        # whether a waiter is refreshing the table, without the lock
+        self._refreshing = False
+
+    @classmethod
+    def for_connection(
+        cls, spell_conn_id: Optional[str] = None, spell_owner: Optional[str] = None
+    ) -> "SpellRunStatusPoller":
+        """
+        Return the poller shared by every waiter using this spell connection
+
+        :param spell_conn_id: Airflow connection id for spell
+        :type spell_conn_id: Optional[str]
+
+        :param spell_owner: Spell owner (if different from user account)
+        :type spell_owner: Optional[str]
+
+        :rtype: SpellRunStatusPoller
+        """
+        key = (spell_conn_id, spell_owner)
+        with cls._pollers_lock:
+            if key not in cls._pollers:
+                cls._pollers[key] = cls(
+                    SpellHook(spell_conn_id=spell_conn_id, owner=spell_owner)
+                )
+            return cls._pollers[key]
+
+    @property
+    def client(self) -> "ExternalSpellClient":
+        return self.hook.get_client()
+
+    def get_run(self, run_id: str) -> "ExternalSpellRun":
+        """
+        Return the latest shared status document for a spell run and add the
+        run to the watched runs
+
+        :param run_id: a spell run ID
+        :type run_id: str
+
+        :rtype: ExternalSpellRun
+        """
+        run_id = str(run_id)
+        with self._lock:
+            now = monotonic()
+            self._watched[run_id] = now
+            stale = (
+                self._refreshed_at is None or now - self._refreshed_at >= self.interval
+            )
+            refresh = stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+                watched = self._expire_watched(now)
+            elif run_id in self._runs:
+                return self._runs[run_id]
+
+        # API requests are made without the lock, so waiters whose run is in
+        # the table keep reading it while the table is refreshed
+        if not refresh:
+            # newly watched run; it joins the shared listing on the next refresh
+            run = self._fetch_run(run_id)
+            with self._lock:
+                self._runs.setdefault(run_id, run)
+            return run
+
+        try:
+            self._refresh(now, watched)
+        finally:
+            with self._lock:
+                self._refreshing = False
+        with self._lock:
+            return self._runs[run_id]
+
+    def _expire_watched(self, now: float) -> List[str]:
+        expiry = self.WATCH_EXPIRY_INTERVALS * self.interval
+        for run_id, requested_at in list(self._watched.items()):
+            if now - requested_at > expiry:
+                del self._watched[run_id]
+                self._runs.pop(run_id, None)
+        return list(self._watched)
+
+    def _refresh(self, now: float, watched: List[str]):
+        page_size = self.page_size
+        listed_runs = self.client.api.list_runs(number=page_size)
+        listed = {str(run.id): run for run in listed_runs}
+
+        runs = {}
+        missing = []
+        for run_id in watched:
+            if run_id in listed:
+                runs[run_id] = _external_run(self.client.api, listed[run_id])
+            else:
+                missing.append(run_id)
+                runs[run_id] = self._fetch_run(run_id)
+
+        self.log.debug(
+            "Spell status poller refreshed %d runs (%d listed, %d fetched)"
+            % (len(watched), len(watched) - len(missing), len(missing))
+        )
+
+        with self._lock:
+            self._runs.update(runs)
+            if missing and len(listed_runs) >= page_size:
+                self.page_size = _page_size_covering(
+                    page_size, listed, missing, self.MAX_PAGE_SIZE
+                )
+            self._refreshed_at = now
+
+    def _fetch_run(self, run_id: str) -> "ExternalSpellRun":
+        return _external_run(self.client.api, self.client.api.get_run(run_id))
+
+
+def _page_size_covering(
+    page_size: int, listed: Dict[str, object], missing: List[str], maxima: int
+) -> int:
+    """
+    Grow a ``list_runs`` page size so the next listing reaches back to the
+    oldest missing run (runs are listed newest first by their numeric ID).
+    """
+    try:
+        oldest_listed = min(int(run_id) for run_id in listed)
+        oldest_missing = min(int(run_id) for run_id in missing)
+    except ValueError:
+        return page_size
+    return max(page_size, min(maxima, page_size + oldest_listed - oldest_missing))
+
+
+def _external_run(api: Any, run: Any) -> "ExternalSpellRun":
+    from spell.client.runs import Run as ExternalSpellRun
+
+    return ExternalSpellRun(api, run)
 
 
 def _delay(delay: Union[int, float, None] = None):
@@ -247,13 +1160,6 @@ def _delay(delay: Union[int, float, None] = None):
     sleep(delay)
 
 
-def _exponential_delay(tries: int) -> float:
-    max_interval = 600.0  # results in 3 to 10 minute delay
-    delay = 1 + pow(tries * 0.6, 2)
-    delay = min(max_interval, delay)
-    return uniform(delay / 3, delay)
-
-
 def _add_jitter(
     delay: Union[int, float],
     width: Union[int, float] = 1,
@@ -0,0 +1,112 @@
+import re
+from time import time
+from typing import Any, Dict, List, Optional
+
+
+# output lines of a rank, as tagged by mpirun (``[1,3]<stdout>:``) and
+# horovodrun (``[3]<stderr>:``)
+RANK_OUTPUT = re.compile(r"^\[(?:\d+,)?(?P<rank>\d+)\]<(?:stdout|stderr)>:")
+# rank failures reported by mpirun and horovodrun
+RANK_SIGNALLED = re.compile(
+    r"process rank (?P<rank>\d+) .*exited on signal (?P<signal>\d+)"
+)
+RANK_EXITED = re.compile(r"Process (?P<rank>\d+) exit with status code (?P<code>-?\d+)")
+MPI_PROCESS_NAME = re.compile(r"Process name:\s*\[\[\d+,\d+\],(?P<rank>\d+)\]")
+MPI_EXIT_CODE = re.compile(r"Exit code:\s*(?P<code>-?\d+)")
+
+
+class SpellDistributedRunMonitor:
+    """
+    Track the worker processes (ranks) of a distributed spell run from its
+    log output, so the failure of one rank is noticed while the others are
+    still running
+
+    The spell API reports a single status for a distributed run, so ranks are
+    followed through the rank-tagged lines that mpirun and horovodrun write
+    and their reports of ranks exiting with a non-zero status or on a signal.
+
+    :param ranks: the number of worker processes, if known
+    :type ranks: Optional[int]
+    """
+
+    def __init__(self, ranks: Optional[int] = None):
+        self.ranks = ranks
+        self.nodes: Dict[int, Dict[str, Any]] = {}
+        self._mpi_failed_rank: Optional[int] = None
+
+    def observe(self, line: str, at: Optional[float] = None):
+        """
+        Update the rank states from a run log line
+
+        :param line: the run log line
+        :type line: str
+
+        :param at: when the line was read, in epoch seconds
+        :type at: Optional[float]
+        """
+        at = at if at is not None else time()
+
+        match = RANK_OUTPUT.match(line)
+        if match:
+            node = self._node(int(match.group("rank")), at)
+            node["last_output_at"] = at
+            node["lines"] += 1
+            return
+
+        match = RANK_SIGNALLED.search(line)
+        if match:
+            self._exited(int(match.group("rank")), 128 + int(match.group("signal")), at)
+            return
+
+        match = RANK_EXITED.search(line)
+        if match:
+            self._exited(int(match.group("rank")), int(match.group("code")), at)
+            return
+
+        # mpirun reports the first failed rank over two lines
+        match = MPI_PROCESS_NAME.search(line)
+        if match:
+            self._mpi_failed_rank = int(match.group("rank"))
+            return
+
+        match = MPI_EXIT_CODE.search(line)
+        if match and self._mpi_failed_rank is not None:
+            self._exited(self._mpi_failed_rank, int(match.group("code")), at)
+            self._mpi_failed_rank = None
+
+    def failed_nodes(self) -> List[int]:
+        """
+        The ranks that exited with a non-zero status
+
+        :rtype: List[int]
+        """
+        return sorted(
+            rank
+            for rank, node in self.nodes.items()
+            if node["exit_code"] not in (None, 0)
+        )
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per rank first and last output times, output lines and exit code
+
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        return {str(rank): dict(node) for rank, node in sorted(self.nodes.items())}
+
+    def _node(self, rank: int, at: float) -> Dict[str, Any]:
+        if rank not in self.nodes:
+            self.nodes[rank] = {
+                "first_output_at": at,
+                "last_output_at": at,
+                "lines": 0,
+                "exit_code": None,
+                "exited_at": None,
+            }
+        return self.nodes[rank]
+
+    def _exited(self, rank: int, exit_code: int, at: float):
+        node = self._node(rank, at)
+        if node["exit_code"] is None:
+            node["exit_code"] = exit_code
+            node["exited_at"] = at
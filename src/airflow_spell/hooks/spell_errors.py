@@ -0,0 +1,214 @@
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep
+from typing import Dict, Optional, Tuple
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+import requests
+
+from airflow_spell.hooks import spell_metrics
+
+
+# responses of a Spell API that is throttling, overloaded or restarting
+TRANSIENT_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Whether a Spell API error is likely to pass if the request is retried:
+    throttling, server errors, timeouts and connection failures; client
+    errors (e.g. an unknown run or a rejected token) are permanent
+
+    :rtype: bool
+    """
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code in TRANSIENT_STATUS_CODES
+
+    # spell wraps the requests exceptions of failed connections
+    cause = getattr(error, "exception", None) or error.__cause__
+    return any(
+        isinstance(candidate, (requests.ConnectionError, requests.Timeout, OSError))
+        for candidate in (error, cause)
+    )
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Seconds to wait before retrying, from the ``Retry-After`` header of the
+    error response (in seconds or as an HTTP date), if any
+
+    :rtype: Optional[float]
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class SpellCircuitBreaker(LoggingMixin):
+    """
+    Pause every Spell API status check of a connection in the process while
+    the API is failing, rather than each waiter adding its own retries
+
+    After ``failure_threshold`` transient errors in a row the circuit opens
+    and :meth:`wait` blocks callers for ``reset_timeout`` seconds (or the
+    ``Retry-After`` of the last error, if longer). Then one caller probes the
+    API while the others keep waiting: a success closes the circuit, a
+    failure opens it again for twice as long, up to ``max_reset_timeout``.
+
+    Use :meth:`for_connection` to get the circuit breaker of a connection.
+
+    :param key: the circuit name, for logs and metrics
+    :type key: str
+
+    :param failure_threshold: transient errors in a row that open the circuit
+    :type failure_threshold: int
+
+    :param reset_timeout: seconds the circuit first stays open
+    :type reset_timeout: float
+
+    :param max_reset_timeout: the longest the circuit stays open
+    :type max_reset_timeout: float
+
+    :param tags: tags of the ``spell.circuit.*`` metrics
+    :type tags: Optional[Dict[str, str]]
+    """
+
+    _breakers: Dict[Tuple[Optional[str], Optional[str]], "SpellCircuitBreaker"] = {}
+    _breakers_lock = Lock()
+
+    def __init__(
+        self,
+        key: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_reset_timeout: float = 600.0,
+        tags: Optional[Dict[str, str]] = None,
+    ):
+        super().__init__()
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.tags = tags or spell_metrics.stats_tags(key, None)
+        self.failures = 0
+        # monotonic time the open circuit lets a probe through; None when closed
+        self.open_until: Optional[float] = None
+        self._open_for = reset_timeout
+        self._probing = False
+        self._lock = Lock()
+
+    @classmethod
+    def for_connection(
+        cls, spell_conn_id: Optional[str] = None, spell_owner: Optional[str] = None
+    ) -> "SpellCircuitBreaker":
+        """
+        Return the circuit breaker shared by every waiter using this spell
+        connection
+
+        :rtype: SpellCircuitBreaker
+        """
+        key = (spell_conn_id, spell_owner)
+        with cls._breakers_lock:
+            if key not in cls._breakers:
+                cls._breakers[key] = cls(
+                    str(spell_conn_id or "default"),
+                    tags=spell_metrics.stats_tags(spell_conn_id, spell_owner),
+                )
+            return cls._breakers[key]
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_until is not None
+
+    def wait(self) -> float:
+        """
+        Block while the circuit is open, letting one caller through to probe
+        the API once it may have recovered
+
+        :return: seconds spent waiting
+        :rtype: float
+        """
+        started_at = monotonic()
+        pause = self._next_pause()
+        while pause is not None:
+            sleep(pause)
+            pause = self._next_pause()
+        return self._waited(started_at)
+
+    async def async_wait(self) -> float:
+        """
+        :meth:`wait` for an event loop, e.g. a trigger on the triggerer
+        """
+        started_at = monotonic()
+        pause = self._next_pause()
+        while pause is not None:
+            await asyncio.sleep(pause)
+            pause = self._next_pause()
+        return self._waited(started_at)
+
+    def _next_pause(self) -> Optional[float]:
+        """
+        Seconds to wait before checking the circuit again, or None once the
+        caller may go through
+        """
+        with self._lock:
+            if self.open_until is None:
+                return None
+            now = monotonic()
+            if now >= self.open_until and not self._probing:
+                self._probing = True
+                return None
+            return min(max(1.0, self.open_until - now), 5.0)
+
+    def _waited(self, started_at: float) -> float:
+        waited = monotonic() - started_at
+        if waited >= 1.0:
+            spell_metrics.timing("circuit.wait", waited, self.tags)
+        return waited
+
+    def record_success(self):
+        with self._lock:
+            if self.open_until is not None:
+                self.log.info(
+                    "Spell API (%s) circuit closed, status checks resume" % self.key
+                )
+            self.failures = 0
+            self.open_until = None
+            self._open_for = self.reset_timeout
+            self._probing = False
+
+    def record_failure(self, retry_after_seconds: Optional[float] = None):
+        """
+        Count a transient error, opening the circuit after
+        ``failure_threshold`` errors in a row or a failed probe
+        """
+        with self._lock:
+            self.failures += 1
+            if self._probing:
+                self._open_for = min(self._open_for * 2, self.max_reset_timeout)
+            elif self.failures < self.failure_threshold or self.open_until is not None:
+                return
+            self._probing = False
+            open_for = max(self._open_for, retry_after_seconds or 0.0)
+            self.open_until = monotonic() + open_for
+        spell_metrics.incr("circuit.open", self.tags)
+        self.log.warning(
+            "Spell API (%s) circuit open after %d transient errors in a row;"
+            " pausing status checks for %.0f seconds"
+            % (self.key, self.failures, open_for)
+        )
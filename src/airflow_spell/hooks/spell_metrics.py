@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+from functools import wraps
+from time import monotonic
+from typing import Any, Dict, Iterator, Optional
+
+from airflow.stats import Stats
+
+
+STATS_PREFIX = "spell"
+
+
+def stats_tags(
+    conn_id: Optional[str], owner: Optional[str], machine_type: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Tags attached to every airflow-spell metric
+
+    :rtype: Dict[str, str]
+    """
+    return {
+        "conn_id": str(conn_id or "default"),
+        "owner": str(owner or "default"),
+        "machine_type": str(machine_type or "unknown"),
+    }
+
+
+def incr(stat: str, tags: Dict[str, str], count: int = 1):
+    _emit(Stats.incr, stat, tags, count)
+
+
+def gauge(stat: str, value: float, tags: Dict[str, str]):
+    _emit(Stats.gauge, stat, tags, value)
+
+
+def timing(stat: str, seconds: float, tags: Dict[str, str]):
+    # StatsD timers are in milliseconds and are aggregated as histograms
+    _emit(Stats.timing, stat, tags, seconds * 1000)
+
+
+@contextmanager
+def timer(stat: str, tags: Dict[str, str]) -> Iterator[None]:
+    """
+    Emit the duration of the block as a timing, whether or not it raises
+    """
+    started_at = monotonic()
+    try:
+        yield
+    finally:
+        timing(stat, monotonic() - started_at, tags)
+
+
+def instrument_api(api: Any, tags: Dict[str, str]):
+    """
+    Time every request of a spell API client and count throttled (HTTP 429)
+    responses
+
+    :param api: the spell API client, i.e. ``spell.client.SpellClient.api``
+    :type api: spell.api.client.APIClient
+
+    :param tags: the metric tags
+    :type tags: Dict[str, str]
+    """
+    request = api.request
+
+    @wraps(request)
+    def instrumented_request(*args, **kwargs):
+        with timer("api.request", tags):
+            response = request(*args, **kwargs)
+        if getattr(response, "status_code", None) == 429:
+            incr("api.throttled", tags)
+        return response
+
+    api.request = instrumented_request
+
+
+def _emit(method, stat: str, tags: Dict[str, str], value: Any):
+    stat = "%s.%s" % (STATS_PREFIX, stat)
+    try:
+        method(stat, value, tags=tags)
+    except TypeError:
+        # apache-airflow < 2.6 does not support metric tags
+        method(stat, value)
@@ -0,0 +1,281 @@
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from hashlib import sha256
+import json
+import os
+import posixpath
+from time import sleep
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from airflow.exceptions import AirflowException
+from airflow.utils.log.logging_mixin import LoggingMixin
+
+from airflow_spell.hooks import spell_metrics
+
+
+# size and checksum of every output downloaded into a directory, kept in it
+MANIFEST_NAME = ".spell_outputs.json"
+# bytes read from the API and written to disk at a time
+CHUNK_SIZE = 1024 * 1024
+
+
+def list_run_outputs(
+    api: Any, run_id: str, path: str = ""
+) -> Iterator[Tuple[str, int]]:
+    """
+    (path, size) of every file under ``path`` in the outputs of a run, paths
+    relative to the run (e.g. ``models/best.pt``); links to other resources
+    (e.g. mounted datasets) are not followed
+
+    :param api: the spell API client, i.e. ``spell.client.SpellClient.api``
+    :type api: spell.api.client.APIClient
+
+    :param run_id: a spell run ID
+    :type run_id: str
+
+    :param path: the directory to list, relative to the run
+    :type path: str
+
+    :rtype: Iterator[Tuple[str, int]]
+    """
+    directories = [path.strip("/")]
+    while directories:
+        directory = directories.pop()
+        resource = posixpath.join("runs", str(run_id), directory).rstrip("/")
+        for line in api.get_ls(resource):
+            if getattr(line, "error", None) is not None:
+                raise AirflowException(
+                    "Spell run (%s) outputs (%s) could not be listed: %s"
+                    % (run_id, directory, line.error)
+                )
+            if not hasattr(line, "path") or line.link_target:
+                continue
+            name = posixpath.join(directory, posixpath.basename(line.path.rstrip("/")))
+            if line.size is None:
+                directories.append(name)
+            else:
+                yield name, int(line.size)
+
+
+def file_checksum(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    SHA-256 of a local file, read a chunk at a time
+
+    :rtype: str
+    """
+    digest = sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SpellRunOutputs(LoggingMixin):
+    """
+    Download the outputs of a spell run to a local directory, a thread pool
+    of files at a time
+
+    Every file is streamed from the API to disk ``chunk_size`` bytes at a time,
+    into a ``.part`` file that replaces the local copy once complete. Files
+    whose local copy has the size listed by spell are skipped, so a download
+    that failed part way resumes from the files it had left; spell lists no
+    checksums, so with ``verify_checksum`` the local copy must also match the
+    SHA-256 recorded in the directory's manifest when it was downloaded.
+
+    :param api: the spell API client, i.e. ``spell.client.SpellClient.api``
+    :type api: spell.api.client.APIClient
+
+    :param max_workers: the number of files downloaded at the same time
+    :type max_workers: int
+
+    :param verify_checksum: re-download files whose local copy no longer
+        matches the checksum recorded when it was downloaded
+    :type verify_checksum: bool
+
+    :param retries: attempts per file after a failed download
+    :type retries: int
+
+    :param chunk_size: bytes held in memory per file being downloaded
+    :type chunk_size: int
+
+    :param tags: tags of the ``spell.outputs.*`` metrics
+    :type tags: Optional[Dict[str, str]]
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        max_workers: int = 8,
+        verify_checksum: bool = False,
+        retries: int = 2,
+        chunk_size: int = CHUNK_SIZE,
+        tags: Optional[Dict[str, str]] = None,
+    ):
+        super().__init__()
+        self.api = api
+        self.max_workers = max_workers
+        self.verify_checksum = verify_checksum
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.tags = tags or spell_metrics.stats_tags(None, None)
+
+    def download(
+        self,
+        run_id: str,
+        destination: str,
+        patterns: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Download the run outputs matching any of the glob ``patterns``
+
+        :param run_id: a spell run ID
+        :type run_id: str
+
+        :param destination: the local directory to download into
+        :type destination: str
+
+        :param patterns: globs of output paths relative to the run, e.g.
+            ``["models/*.pt", "metrics.json"]`` (default: every output)
+        :type patterns: Optional[Sequence[str]]
+
+        :return: the ``downloaded`` and ``skipped`` paths and the ``bytes``
+            downloaded
+        :rtype: Dict[str, Any]
+        :raises: AirflowException if any file failed to download
+        """
+        patterns = list(patterns or ["*"])
+        outputs = [
+            (path, size)
+            for path, size in list_run_outputs(self.api, run_id)
+            if any(fnmatchcase(path, pattern) for pattern in patterns)
+        ]
+        os.makedirs(destination, exist_ok=True)
+        manifest = self._read_manifest(destination)
+
+        pending = []
+        skipped = []
+        for path, size in outputs:
+            if self._is_current(destination, path, size, manifest.get(path)):
+                skipped.append(path)
+            else:
+                pending.append((path, size))
+        self.log.info(
+            "Spell run (%s) outputs: %d files match %s, %d to download"
+            % (run_id, len(outputs), patterns, len(pending))
+        )
+
+        downloaded: List[str] = []
+        failed: Dict[str, str] = {}
+        try:
+            with spell_metrics.timer("outputs.download", self.tags):
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    results = executor.map(
+                        lambda output: self._download_file(
+                            run_id, destination, *output
+                        ),
+                        pending,
+                    )
+                    for (path, _), (entry, error) in zip(pending, results):
+                        if error is None:
+                            manifest[path] = entry
+                            downloaded.append(path)
+                        else:
+                            failed[path] = error
+        finally:
+            # recorded even after a failure, for the checksums of a resumed download
+            self._write_manifest(destination, manifest)
+
+        transferred = sum(manifest[path]["size"] for path in downloaded)
+        spell_metrics.incr("outputs.files", self.tags, len(downloaded))
+        spell_metrics.incr("outputs.bytes", self.tags, transferred)
+        if failed:
+            raise AirflowException(
+                "%d of %d Spell run (%s) outputs failed to download: %s"
+                % (len(failed), len(pending), run_id, failed)
+            )
+        self.log.info(
+            "Spell run (%s) outputs: downloaded %d files (%d bytes), skipped %d"
+            % (run_id, len(downloaded), transferred, len(skipped))
+        )
+        return {"downloaded": downloaded, "skipped": skipped, "bytes": transferred}
+
+    def _is_current(
+        self, destination: str, path: str, size: int, entry: Optional[Dict[str, Any]]
+    ) -> bool:
+        target = _local_path(destination, path)
+        if not os.path.isfile(target) or os.path.getsize(target) != size:
+            return False
+        if self.verify_checksum and entry is not None and entry["size"] == size:
+            return file_checksum(target, self.chunk_size) == entry["sha256"]
+        return True
+
+    def _download_file(
+        self, run_id: str, destination: str, path: str, size: int
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Download one file, retrying failed attempts
+
+        :return: the manifest entry of the file, or the last error
+        :rtype: Tuple[Optional[Dict[str, Any]], Optional[str]]
+        """
+        target = _local_path(destination, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for attempt in range(self.retries + 1):
+            try:
+                return self._stream_file(run_id, path, target, size), None
+            except Exception as e:
+                self.log.warning(
+                    "Spell run (%s) output (%s) failed to download (attempt %d of %d): %s"
+                    % (run_id, path, attempt + 1, self.retries + 1, e)
+                )
+                error = str(e)
+                if attempt < self.retries:
+                    sleep(min(30, 2**attempt))
+        return None, error
+
+    def _stream_file(
+        self, run_id: str, path: str, target: str, size: int
+    ) -> Dict[str, Any]:
+        partial = target + ".part"
+        digest = sha256()
+        written = 0
+        # spell serves run outputs as a tar stream, read one member at a time
+        with self.api.tar_of_path(posixpath.join("runs", str(run_id), path)) as tar:
+            member = next((member for member in tar if member.isfile()), None)
+            if member is None:
+                raise AirflowException("no file in the spell response")
+            source = tar.extractfile(member)
+            with open(partial, "wb") as f:
+                for chunk in iter(lambda: source.read(self.chunk_size), b""):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+        if written != size:
+            os.remove(partial)
+            raise AirflowException(
+                "downloaded %d bytes, spell listed %d" % (written, size)
+            )
+        os.replace(partial, target)
+        return {"size": written, "sha256": digest.hexdigest()}
+
+    @staticmethod
+    def _read_manifest(destination: str) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(os.path.join(destination, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_manifest(destination: str, manifest: Dict[str, Dict[str, Any]]):
+        path = os.path.join(destination, MANIFEST_NAME)
+        with open(path + ".part", "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(path + ".part", path)
+
+
+def _local_path(destination: str, path: str) -> str:
+    parts = path.split("/")
+    if any(part in ("", ".", "..") for part in parts):
+        raise AirflowException("Unsafe spell output path (%s)" % path)
+    return os.path.join(destination, *parts)
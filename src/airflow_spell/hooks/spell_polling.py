@@ -0,0 +1,293 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from random import uniform
+from statistics import median
+from typing import Any, Dict, Optional, Tuple, Union
+
+from airflow_spell.hooks.spell_store import connect, local_store_path
+
+
+COMPLETE = "complete"
+
+
+class SpellPollingPolicy(ABC):
+    """
+    Decide how long to pause between status checks of a spell run
+
+    :param timeout: seconds since the run was created after which status
+        checks stop with an error; ``None`` for no wall-clock limit
+    :type timeout: Optional[Union[int, float]]
+
+    :param status_timeouts: the longest a run may stay in a status, in
+        seconds, e.g. ``{"building": 1800, "saving": 900}``; a streamed run
+        log producing new lines counts as progress in the ``running`` status
+    :type status_timeouts: Optional[Dict[str, Union[int, float]]]
+
+    A run exceeding ``timeout`` or one of ``status_timeouts`` is stopped.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[Union[int, float]] = None,
+        status_timeouts: Optional[Dict[str, Union[int, float]]] = None,
+    ):
+        self.timeout = timeout
+        self.status_timeouts = status_timeouts or {}
+
+    @abstractmethod
+    def next_delay(self, run: Any, retries: int, elapsed: float) -> float:
+        """
+        Seconds to pause before the next status check
+
+        :param run: the latest spell run document
+        :type run: spell.client.runs.Run
+
+        :param retries: the number of status checks made so far
+        :type retries: int
+
+        :param elapsed: seconds since the run was created
+        :type elapsed: float
+
+        :rtype: float
+        """
+
+    def record_run(self, run: Any):
+        """
+        Called once with the run document that reached a final status
+
+        :param run: the final spell run document
+        :type run: spell.client.runs.Run
+        """
+
+    def time_to_limit(
+        self, status: str, status_elapsed: float, elapsed: float
+    ) -> Optional[float]:
+        """
+        Seconds until the run exceeds ``timeout`` or the timeout of its
+        status (zero or less once exceeded), or ``None`` without limits
+
+        :param status: the current run status
+        :type status: str
+
+        :param status_elapsed: seconds since the run entered the status (or,
+            while running, since its last log output)
+        :type status_elapsed: float
+
+        :param elapsed: seconds since the run was created
+        :type elapsed: float
+
+        :rtype: Optional[float]
+        """
+        limits = [
+            limit - spent
+            for limit, spent in (
+                (self.timeout, elapsed),
+                (self.status_timeouts.get(status), status_elapsed),
+            )
+            if limit is not None
+        ]
+        return min(limits) if limits else None
+
+    def limit_exceeded(
+        self, status: str, status_elapsed: float, elapsed: float
+    ) -> Optional[str]:
+        """
+        Why the run should be stopped, or ``None`` within its limits
+
+        :rtype: Optional[str]
+        """
+        status_timeout = self.status_timeouts.get(status)
+        if status_timeout is not None and status_elapsed >= status_timeout:
+            return (
+                "%.0f seconds without progress in status (%s) exceed %.0f seconds"
+                % (
+                    status_elapsed,
+                    status,
+                    status_timeout,
+                )
+            )
+        if self.timeout is not None and elapsed >= self.timeout:
+            return "%.0f seconds since the run was created exceed %.0f seconds" % (
+                elapsed,
+                self.timeout,
+            )
+        return None
+
+
+class ExponentialPollingPolicy(SpellPollingPolicy):
+    """
+    Pause on an exponential curve of the number of checks, capped at
+    ``max_interval`` seconds (the curve used for every run before polling
+    policies were pluggable)
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[Union[int, float]] = None,
+        max_interval: Union[int, float] = 600.0,
+        status_timeouts: Optional[Dict[str, Union[int, float]]] = None,
+    ):
+        super().__init__(timeout=timeout, status_timeouts=status_timeouts)
+        self.max_interval = max_interval
+
+    def next_delay(self, run: Any, retries: int, elapsed: float) -> float:
+        return _exponential_delay(retries, self.max_interval)
+
+
+class SpellRunHistory:
+    """
+    Local SQLite store of the durations of past successful spell runs, keyed
+    by the run command (or description) and machine type
+
+    :param path: the SQLite database path; defaults to ``spell_history.db``
+        in the local store directory
+    :type path: Optional[str]
+
+    :param samples: the number of most recent durations used for estimates
+    :type samples: int
+    """
+
+    def __init__(self, path: Optional[str] = None, samples: int = 20):
+        self.path = path or local_store_path("spell_history.db")
+        self.samples = samples
+        with connect(self.path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS run_durations ("
+                " command TEXT NOT NULL,"
+                " machine_type TEXT NOT NULL,"
+                " duration REAL NOT NULL,"
+                " recorded_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS run_durations_key"
+                " ON run_durations (command, machine_type, recorded_at)"
+            )
+
+    def record(self, command: str, machine_type: str, duration: float):
+        with connect(self.path) as db:
+            db.execute(
+                "INSERT INTO run_durations VALUES (?, ?, ?, ?)",
+                (command, machine_type, duration, _utcnow().timestamp()),
+            )
+
+    def expected_duration(self, command: str, machine_type: str) -> Optional[float]:
+        """
+        Median duration of the most recent runs, or ``None`` without history
+
+        :rtype: Optional[float]
+        """
+        with connect(self.path) as db:
+            rows = db.execute(
+                "SELECT duration FROM run_durations"
+                " WHERE command = ? AND machine_type = ?"
+                " ORDER BY recorded_at DESC LIMIT ?",
+                (command, machine_type, self.samples),
+            ).fetchall()
+        if not rows:
+            return None
+        return median(row[0] for row in rows)
+
+
+class HistoryPollingPolicy(ExponentialPollingPolicy):
+    """
+    Poll sparsely while a run is far from its expected finish and densely
+    around it, using the durations of earlier runs of the same command on the
+    same machine type; runs without history fall back to the exponential curve
+
+    :param history: the run duration store
+    :type history: Optional[SpellRunHistory]
+
+    :param timeout: seconds since the run was created after which status
+        checks stop with an error; ``None`` for no wall-clock limit
+    :type timeout: Optional[Union[int, float]]
+
+    :param min_interval: the shortest pause, in seconds
+    :type min_interval: Union[int, float]
+
+    :param max_interval: the longest pause, in seconds
+    :type max_interval: Union[int, float]
+
+    :param overrun_factor: once a run overruns its expected duration, pause
+        for this fraction of the overrun
+    :type overrun_factor: float
+
+    :param status_timeouts: the longest a run may stay in a status, in seconds
+    :type status_timeouts: Optional[Dict[str, Union[int, float]]]
+    """
+
+    def __init__(
+        self,
+        history: Optional[SpellRunHistory] = None,
+        timeout: Optional[Union[int, float]] = None,
+        min_interval: Union[int, float] = 5.0,
+        max_interval: Union[int, float] = 600.0,
+        overrun_factor: float = 0.25,
+        status_timeouts: Optional[Dict[str, Union[int, float]]] = None,
+    ):
+        super().__init__(
+            timeout=timeout, max_interval=max_interval, status_timeouts=status_timeouts
+        )
+        self.history = history or SpellRunHistory()
+        self.min_interval = min_interval
+        self.overrun_factor = overrun_factor
+
+    def next_delay(self, run: Any, retries: int, elapsed: float) -> float:
+        expected = self.history.expected_duration(*_history_key(run))
+        if expected is None:
+            return super().next_delay(run, retries, elapsed)
+
+        remaining = expected - elapsed
+        if remaining > 0:
+            # halve the distance to the expected finish
+            delay = remaining / 2
+        else:
+            delay = -remaining * self.overrun_factor
+        return min(self.max_interval, max(self.min_interval, delay))
+
+    def record_run(self, run: Any):
+        if run.status != COMPLETE:
+            return
+        duration = _run_duration(run)
+        if duration is not None:
+            self.history.record(*_history_key(run), duration)
+
+
+def run_elapsed(run: Any, default: float) -> float:
+    """
+    Seconds since the run was created, or ``default`` if the run document
+    has no creation time
+    """
+    created_at = getattr(run, "created_at", None)
+    if not isinstance(created_at, datetime):
+        return default
+    return (_utcnow() - _as_utc(created_at)).total_seconds()
+
+
+def _run_duration(run: Any) -> Optional[float]:
+    created_at = getattr(run, "created_at", None)
+    ended_at = getattr(run, "ended_at", None)
+    if not isinstance(created_at, datetime) or not isinstance(ended_at, datetime):
+        return None
+    return (_as_utc(ended_at) - _as_utc(created_at)).total_seconds()
+
+
+def _history_key(run: Any) -> Tuple[str, str]:
+    command = getattr(run, "description", None) or getattr(run, "command", "")
+    return str(command), str(getattr(run, "gpu", None) or "CPU")
+
+
+def _as_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _exponential_delay(tries: int, max_interval: float = 600.0) -> float:
+    # max_interval of 600 results in 3 to 10 minute delay
+    delay = 1 + pow(tries * 0.6, 2)
+    delay = min(max_interval, delay)
+    return uniform(delay / 3, delay)
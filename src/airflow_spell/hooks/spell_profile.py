@@ -0,0 +1,198 @@
+from datetime import datetime
+from time import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from airflow_spell.hooks.spell_client import SpellRunStatus
+from airflow_spell.hooks.spell_polling import _as_utc
+from airflow_spell.hooks.spell_store import connect, local_store_path
+
+
+# run statuses are grouped into these phases; final statuses end the profile
+PHASES = {
+    **{status: "queued" for status in SpellRunStatus.QUEUED},
+    SpellRunStatus.BUILDING: "building",
+    SpellRunStatus.PUSHING: "pushing",
+    SpellRunStatus.RUNNING: "running",
+    SpellRunStatus.SAVING: "saving",
+}
+
+# columns a profile report can be grouped by
+REPORT_GROUPS = ("machine_type", "docker_image", "command")
+
+
+def phase_durations(
+    status_timeline: Sequence[Tuple[str, float]],
+    created_at: Optional[datetime] = None,
+    now: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Seconds spent in each phase of a run, from the statuses seen while
+    polling it and when each was first seen
+
+    Status changes are only seen at status checks, so durations are accurate
+    to the polling interval. The time between the run's creation and the first
+    check counts towards the first status seen.
+
+    :param status_timeline: (status, epoch seconds) of each status change
+    :type status_timeline: Sequence[Tuple[str, float]]
+
+    :param created_at: when the run was created
+    :type created_at: Optional[datetime]
+
+    :param now: the end of a status timeline that has no final status yet
+    :type now: Optional[float]
+
+    :rtype: Dict[str, float]
+    """
+    durations: Dict[str, float] = {}
+    if not status_timeline:
+        return durations
+
+    timeline = list(status_timeline)
+    if isinstance(created_at, datetime):
+        first_status, first_seen_at = timeline[0]
+        timeline[0] = (
+            first_status,
+            min(first_seen_at, _as_utc(created_at).timestamp()),
+        )
+
+    ends = [seen_at for _, seen_at in timeline[1:]] + [now if now else time()]
+    for (status, seen_at), ended_at in zip(timeline, ends):
+        if status in SpellRunStatus.FINAL:
+            break
+        phase = PHASES.get(status, status)
+        durations[phase] = durations.get(phase, 0.0) + max(0.0, ended_at - seen_at)
+    return durations
+
+
+def run_profile(
+    run: Any, status_timeline: Sequence[Tuple[str, float]]
+) -> Dict[str, Any]:
+    """
+    Phase timing profile of a spell run
+
+    :param run: the latest spell run document
+    :type run: spell.client.runs.Run
+
+    :param status_timeline: (status, epoch seconds) of each status change
+    :type status_timeline: Sequence[Tuple[str, float]]
+
+    :rtype: Dict[str, Any]
+    """
+    phases = phase_durations(status_timeline, getattr(run, "created_at", None))
+    return {
+        "spell_run_id": getattr(run, "id", None),
+        "status": getattr(run, "status", None),
+        "machine_type": str(getattr(run, "gpu", None) or "CPU"),
+        "docker_image": getattr(run, "docker_image", None),
+        "command": getattr(run, "description", None) or getattr(run, "command", ""),
+        "phases": phases,
+        "total": sum(phases.values()),
+    }
+
+
+class SpellRunProfiles:
+    """
+    Local SQLite store of run phase timing profiles
+
+    :param path: the SQLite database path; defaults to ``spell_profiles.db``
+        in the local store directory
+    :type path: Optional[str]
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or local_store_path("spell_profiles.db")
+        with connect(self.path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS run_phases ("
+                " run_id TEXT NOT NULL,"
+                " status TEXT,"
+                " machine_type TEXT NOT NULL,"
+                " docker_image TEXT NOT NULL,"
+                " command TEXT NOT NULL,"
+                " phase TEXT NOT NULL,"
+                " duration REAL NOT NULL,"
+                " recorded_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS run_phases_recorded_at"
+                " ON run_phases (recorded_at)"
+            )
+
+    def record(self, profile: Dict[str, Any]):
+        """
+        Store the profile of a run, replacing an earlier profile of the run
+        """
+        recorded_at = time()
+        with connect(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "DELETE FROM run_phases WHERE run_id = ?",
+                    (str(profile["spell_run_id"]),),
+                )
+                db.executemany(
+                    "INSERT INTO run_phases VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            str(profile["spell_run_id"]),
+                            profile["status"],
+                            profile["machine_type"],
+                            profile["docker_image"] or "",
+                            str(profile["command"]),
+                            phase,
+                            duration,
+                            recorded_at,
+                        )
+                        for phase, duration in profile["phases"].items()
+                    ],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def report(
+        self,
+        group_by: Sequence[str] = ("machine_type", "docker_image"),
+        since: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Run count and mean seconds per phase for each group of runs, the
+        groups with the longest mean queue and build times first
+
+        :param group_by: the columns to group runs by, from :data:`REPORT_GROUPS`
+        :type group_by: Sequence[str]
+
+        :param since: only runs recorded since this epoch time
+        :type since: Optional[float]
+
+        :rtype: List[Dict[str, Any]]
+        """
+        for column in group_by:
+            if column not in REPORT_GROUPS:
+                raise ValueError(
+                    "Unknown report group (%s), expected one of %s"
+                    % (column, REPORT_GROUPS)
+                )
+        columns = ", ".join(group_by)
+        phases = sorted(set(PHASES.values()))
+        phase_means = ", ".join(
+            "SUM(CASE WHEN phase = '%s' THEN duration ELSE 0 END)"
+            " / COUNT(DISTINCT run_id)" % phase
+            for phase in phases
+        )
+        with connect(self.path) as db:
+            rows = db.execute(
+                "SELECT %s, COUNT(DISTINCT run_id), %s FROM run_phases"
+                " WHERE recorded_at >= ? GROUP BY %s" % (columns, phase_means, columns),
+                (since or 0,),
+            ).fetchall()
+
+        report = []
+        for row in rows:
+            group = dict(zip(group_by, row[: len(group_by)]))
+            group["runs"] = row[len(group_by)]
+            group.update(zip(phases, row[len(group_by) + 1 :]))
+            report.append(group)
+        return sorted(report, key=lambda group: -(group["queued"] + group["building"]))
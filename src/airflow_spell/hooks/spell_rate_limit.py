@@ -0,0 +1,132 @@
+from functools import wraps
+from time import sleep, time
+from typing import Any, Dict, Optional, Union
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_store import connect, local_store_path
+
+
+class SpellRateLimiter(LoggingMixin):
+    """
+    Token bucket shared by every process on a host through a local SQLite
+    store, so concurrent tasks using one spell connection stay within the
+    Spell API rate limits between them
+
+    :param key: the bucket name; requests with the same key share tokens
+    :type key: str
+
+    :param rate: tokens (API requests) added to the bucket per second
+    :type rate: Union[int, float]
+
+    :param burst: the bucket size, i.e. the requests allowed back to back
+    :type burst: Union[int, float]
+
+    :param path: the SQLite database path; defaults to ``spell_rate_limit.db``
+        in the local store directory
+    :type path: Optional[str]
+
+    :param tags: tags of the ``spell.rate_limit.wait`` metric
+    :type tags: Optional[Dict[str, str]]
+    """
+
+    def __init__(
+        self,
+        key: str,
+        rate: Union[int, float],
+        burst: Union[int, float] = 1,
+        path: Optional[str] = None,
+        tags: Optional[Dict[str, str]] = None,
+    ):
+        super().__init__()
+        self.key = key
+        self.tags = tags or spell_metrics.stats_tags(key, None)
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.path = path or local_store_path("spell_rate_limit.db")
+        # seconds this process spent waiting for tokens
+        self.total_wait = 0.0
+        with connect(self.path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def acquire(self) -> float:
+        """
+        Take one token from the bucket, sleeping until one is available
+
+        :return: seconds spent waiting for the token
+        :rtype: float
+        """
+        waited = 0.0
+        while True:
+            wait = self._take_token()
+            if wait <= 0:
+                break
+            sleep(wait)
+            waited += wait
+
+        spell_metrics.timing("rate_limit.wait", waited, self.tags)
+        if waited > 0:
+            self.total_wait += waited
+            self.log.info(
+                "Spell API rate limit (%s) waited %.2f seconds for a request"
+                " (%.2f seconds in total)" % (self.key, waited, self.total_wait)
+            )
+        return waited
+
+    def wrap(self, api: Any):
+        """
+        Make every request of a spell API client take a token first
+
+        :param api: the spell API client, i.e. ``spell.client.SpellClient.api``
+        :type api: spell.api.client.APIClient
+        """
+        request = api.request
+
+        @wraps(request)
+        def rate_limited_request(*args, **kwargs):
+            self.acquire()
+            return request(*args, **kwargs)
+
+        api.request = rate_limited_request
+
+    def _take_token(self) -> float:
+        """
+        Refill the bucket and take a token if one is available
+
+        :return: 0 if a token was taken, else the seconds until one is available
+        :rtype: float
+        """
+        with connect(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time()
+                row = db.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE key = ?", (self.key,)
+                ).fetchone()
+                tokens = self.burst
+                if row is not None:
+                    tokens = min(
+                        self.burst, row[0] + max(0.0, now - row[1]) * self.rate
+                    )
+
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate
+
+                db.execute(
+                    "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                    (self.key, tokens, now),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return wait
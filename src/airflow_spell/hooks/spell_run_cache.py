@@ -0,0 +1,176 @@
+from hashlib import sha256
+import json
+from time import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+
+from airflow_spell.hooks.spell_store import connect, local_store_path
+
+
+# run arguments that do not change what a run computes
+IGNORED_RUN_KWARGS = ("idempotent",)
+# list arguments whose order does not matter
+UNORDERED_RUN_KWARGS = ("pip_packages", "apt_packages")
+
+
+class SpellRunCache(LoggingMixin):
+    """
+    Local SQLite index of successful spell runs by a hash of their run
+    arguments, so an identical run can reuse the earlier run's result instead
+    of building and running again
+
+    Only use it for deterministic runs: arguments that resolve differently over
+    time (a branch ``github_ref``, a ``latest`` docker image tag) hash the same.
+
+    :param path: the SQLite database path; defaults to ``spell_run_cache.db``
+        in the local store directory
+    :type path: Optional[str]
+
+    :param ttl: seconds a successful run is reused for
+    :type ttl: Union[int, float]
+
+    :param max_entries: the number of runs kept; the least recently used
+        runs are evicted first
+    :type max_entries: int
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Union[int, float] = 7 * 24 * 3600,
+        max_entries: int = 10000,
+    ):
+        super().__init__()
+        self.path = path or local_store_path("spell_run_cache.db")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with connect(self.path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS run_results ("
+                " key TEXT PRIMARY KEY,"
+                " run_id NOT NULL,"
+                " duration REAL NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " used_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS run_results_used_at"
+                " ON run_results (used_at)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_stats ("
+                " name TEXT PRIMARY KEY,"
+                " value REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def run_key(
+        spell_conn_id: Optional[str],
+        spell_owner: Optional[str],
+        run_kwargs: Dict[str, Any],
+    ) -> str:
+        """
+        Hash of the spell account and the normalized run arguments: unset
+        arguments and :data:`IGNORED_RUN_KWARGS` are dropped, mappings and
+        :data:`UNORDERED_RUN_KWARGS` are sorted
+
+        :param spell_conn_id: Airflow connection id for spell
+        :type spell_conn_id: Optional[str]
+
+        :param spell_owner: Spell owner (if different from user account)
+        :type spell_owner: Optional[str]
+
+        :param run_kwargs: the ``spell.client.runs.RunsService.new`` arguments
+        :type run_kwargs: Dict[str, Any]
+
+        :rtype: str
+        """
+        normalized = {
+            name: sorted(value) if name in UNORDERED_RUN_KWARGS else value
+            for name, value in run_kwargs.items()
+            if value is not None and name not in IGNORED_RUN_KWARGS
+        }
+        document = json.dumps(
+            {"conn_id": spell_conn_id, "owner": spell_owner, "run": normalized},
+            sort_keys=True,
+            default=str,
+        )
+        return sha256(document.encode()).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Tuple[Union[int, str], float]]:
+        """
+        The run ID and duration of an unexpired successful run with this key,
+        counting the hit or miss
+
+        :rtype: Optional[Tuple[Union[int, str], float]]
+        """
+        now = time()
+        with connect(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "DELETE FROM run_results WHERE created_at < ?", (now - self.ttl,)
+                )
+                row = db.execute(
+                    "SELECT run_id, duration FROM run_results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._add_stat(db, "misses", 1)
+                else:
+                    db.execute(
+                        "UPDATE run_results SET used_at = ? WHERE key = ?", (now, key)
+                    )
+                    self._add_stat(db, "hits", 1)
+                    self._add_stat(db, "saved_seconds", row[1])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return None if row is None else (row[0], row[1])
+
+    def record(self, key: str, run_id: Union[int, str], duration: float):
+        """
+        Index a successful run, evicting the least recently used runs beyond
+        ``max_entries``
+        """
+        now = time()
+        with connect(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO run_results VALUES (?, ?, ?, ?, ?)",
+                    (key, run_id, duration, now, now),
+                )
+                db.execute(
+                    "DELETE FROM run_results WHERE key IN ("
+                    " SELECT key FROM run_results ORDER BY used_at DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Host-wide ``hits``, ``misses``, ``hit_rate`` and ``saved_seconds``
+
+        :rtype: Dict[str, float]
+        """
+        with connect(self.path) as db:
+            stats = dict(db.execute("SELECT name, value FROM cache_stats").fetchall())
+        stats = {
+            name: stats.get(name, 0.0) for name in ("hits", "misses", "saved_seconds")
+        }
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _add_stat(db: Any, name: str, value: float):
+        db.execute("INSERT OR IGNORE INTO cache_stats VALUES (?, 0)", (name,))
+        db.execute(
+            "UPDATE cache_stats SET value = value + ? WHERE name = ?", (value, name)
+        )
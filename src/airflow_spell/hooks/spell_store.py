@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+from typing import Iterator, Optional
+
+
+STORE_DIR_ENV = "AIRFLOW_SPELL_STORE_DIR"
+
+# seconds to wait for another process to release a lock on the store
+STORE_TIMEOUT = 30
+
+
+def local_store_path(filename: str, store_dir: Optional[str] = None) -> str:
+    """
+    Path of a host-local airflow-spell store shared by every task process
+
+    :param filename: the store file name
+    :type filename: str
+
+    :param store_dir: the store directory; defaults to ``$AIRFLOW_SPELL_STORE_DIR``,
+        then ``$AIRFLOW_HOME``, then ``~/airflow``
+    :type store_dir: Optional[str]
+
+    :rtype: str
+    """
+    if store_dir is None:
+        store_dir = os.environ.get(
+            STORE_DIR_ENV,
+            os.environ.get("AIRFLOW_HOME", os.path.expanduser("~/airflow")),
+        )
+    os.makedirs(store_dir, exist_ok=True)
+    return os.path.join(store_dir, filename)
+
+
+@contextmanager
+def connect(path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Open a connection to a local SQLite store in autocommit mode; callers use
+    ``BEGIN IMMEDIATE`` for read-modify-write transactions across processes
+
+    :param path: the SQLite database path
+    :type path: str
+
+    :rtype: Iterator[sqlite3.Connection]
+    """
+    db = sqlite3.connect(path, timeout=STORE_TIMEOUT, isolation_level=None)
+    try:
+        yield db
+    finally:
+        db.close()
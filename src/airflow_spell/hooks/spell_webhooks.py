@@ -0,0 +1,382 @@
+import asyncio
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from time import monotonic, sleep, time
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.request import Request, urlopen
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_store import connect, local_store_path
+
+
+# the header carrying the hex HMAC-SHA256 of a webhook body, when signed
+SIGNATURE_HEADER = "X-Spell-Signature"
+
+
+def sign(body: bytes, secret: str) -> str:
+    """
+    The signature of a webhook body: the hex HMAC-SHA256 of the body with
+    the shared secret
+
+    :rtype: str
+    """
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def parse_run_event(payload: Any) -> Tuple[str, str]:
+    """
+    The (run ID, status) of a run status notification, either
+    ``{"run_id": 42, "status": "running"}`` or a run document
+    ``{"run": {"id": 42, "status": "running", ...}}``
+
+    :rtype: Tuple[str, str]
+    :raises: ValueError if the payload has no run ID or status
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("expected a JSON object")
+    run = payload.get("run")
+    if isinstance(run, dict):
+        run_id, status = run.get("id"), run.get("status")
+    else:
+        run_id, status = payload.get("run_id"), payload.get("status")
+    if run_id is None or not status:
+        raise ValueError("expected a run ID and status")
+    return str(run_id), str(status)
+
+
+def send_run_event(
+    url: str,
+    run_id: Union[int, str],
+    status: str,
+    secret: Optional[str] = None,
+    timeout: float = 10.0,
+) -> int:
+    """
+    Post a run status notification to a webhook receiver, the way a Spell
+    webhook (or a run's last command) would
+
+    :param url: the receiver URL, e.g. ``http://localhost:8787/``
+    :type url: str
+
+    :param run_id: a spell run ID
+    :type run_id: Union[int, str]
+
+    :param status: the run status
+    :type status: str
+
+    :param secret: sign the body with this shared secret
+    :type secret: Optional[str]
+
+    :return: the HTTP status code of the response
+    :rtype: int
+    """
+    body = json.dumps({"run_id": str(run_id), "status": status}).encode()
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers[SIGNATURE_HEADER] = sign(body, secret)
+    with urlopen(Request(url, body, headers, method="POST"), timeout=timeout) as r:
+        return r.status
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer is only in python >= 3.7
+    daemon_threads = True
+
+
+class SpellRunEvents(LoggingMixin):
+    """
+    Run status notifications received on this host, shared by every process
+    through a local SQLite store, so waiters are woken as soon as their run
+    changes status rather than at their next status check
+
+    The :class:`SpellWebhookReceiver` records the latest notification of each
+    run; waiters call :meth:`wait` (or :meth:`async_wait` on the triggerer)
+    for up to their polling pause. The first waiter to find the shared table
+    older than ``check_interval`` reads the notifications received since, with
+    a single query, for every waiter in the process.
+
+    Use :meth:`for_path` to get the instance shared by a process.
+
+    :param path: the SQLite database path; defaults to ``spell_run_events.db``
+        in the local store directory
+    :type path: Optional[str]
+
+    :param check_interval: seconds between reads of the store
+    :type check_interval: float
+
+    :param retention: seconds a notification is kept
+    :type retention: float
+    """
+
+    _instances: Dict[Optional[str], "SpellRunEvents"] = {}
+    _instances_lock = Lock()
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        check_interval: float = 1.0,
+        retention: float = 24 * 3600,
+    ):
+        super().__init__()
+        self.path = path or local_store_path("spell_run_events.db")
+        self.check_interval = check_interval
+        self.retention = retention
+        # run ID -> (status, received_at) of its latest notification
+        self._received: Dict[str, Tuple[str, float]] = {}
+        self._read_until = time() - retention
+        self._checked_at: Optional[float] = None
+        # guards _received; the store is read by one thread at a time, under
+        # _read_lock, so waiters keep reading _received meanwhile
+        self._lock = Lock()
+        self._read_lock = Lock()
+        with connect(self.path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS run_events ("
+                " run_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " received_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS run_events_received_at"
+                " ON run_events (received_at)"
+            )
+
+    @classmethod
+    def for_path(cls, path: Optional[str] = None) -> "SpellRunEvents":
+        """
+        Return the instance shared by every waiter in the process
+
+        :rtype: SpellRunEvents
+        """
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def record(self, run_id: Union[int, str], status: str):
+        """
+        Record the latest status notification of a run
+        """
+        now = time()
+        with connect(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO run_events (run_id, status, received_at)"
+                " VALUES (?, ?, ?)",
+                (str(run_id), status, now),
+            )
+            db.execute(
+                "DELETE FROM run_events WHERE received_at < ?", (now - self.retention,)
+            )
+
+    def received_since(self, run_id: Union[int, str], since: float) -> Optional[str]:
+        """
+        The status of the run's latest notification if it was received at or
+        after ``since`` (epoch seconds), reading the store at most every
+        ``check_interval`` seconds
+
+        :rtype: Optional[str]
+        """
+        if self._read_due():
+            self._refresh()
+        return self._latest(run_id, since)
+
+    def wait(
+        self, run_id: Union[int, str], timeout: float, since: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        Block for up to ``timeout`` seconds until a notification of the run
+        is received
+
+        :param since: epoch seconds notifications count from (default: now),
+            e.g. the time of the last status check
+        :type since: Optional[float]
+
+        :return: the notified status, or None after ``timeout``
+        :rtype: Optional[str]
+        """
+        since = time() if since is None else since
+        deadline = monotonic() + timeout
+        while True:
+            status = self.received_since(run_id, since)
+            remaining = deadline - monotonic()
+            if status is not None or remaining <= 0:
+                return status
+            sleep(min(self.check_interval, remaining))
+
+    async def async_wait(
+        self, run_id: Union[int, str], timeout: float, since: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        :meth:`wait` for an event loop, e.g. a trigger on the triggerer; the
+        store is read in the loop's default executor
+        """
+        loop = asyncio.get_event_loop()
+        since = time() if since is None else since
+        deadline = monotonic() + timeout
+        while True:
+            if self._read_due():
+                await loop.run_in_executor(None, self._refresh)
+            status = self._latest(run_id, since)
+            remaining = deadline - monotonic()
+            if status is not None or remaining <= 0:
+                return status
+            await asyncio.sleep(min(self.check_interval, remaining))
+
+    def _read_due(self) -> bool:
+        checked_at = self._checked_at
+        return checked_at is None or monotonic() - checked_at >= self.check_interval
+
+    def _refresh(self):
+        with self._read_lock:
+            # another waiter may have read the store while this one waited
+            if self._read_due():
+                self._read()
+                self._checked_at = monotonic()
+
+    def _latest(self, run_id: Union[int, str], since: float) -> Optional[str]:
+        with self._lock:
+            status, received_at = self._received.get(str(run_id), (None, 0.0))
+        return status if received_at >= since else None
+
+    def _read(self):
+        with connect(self.path) as db:
+            rows = db.execute(
+                "SELECT run_id, status, received_at FROM run_events"
+                " WHERE received_at > ?",
+                # a notification recorded while the last read ran may be older
+                (self._read_until - self.check_interval,),
+            ).fetchall()
+        expired = time() - self.retention
+        with self._lock:
+            for run_id, status, received_at in rows:
+                self._received[run_id] = (status, received_at)
+                self._read_until = max(self._read_until, received_at)
+            for run_id, (_, received_at) in list(self._received.items()):
+                if received_at < expired:
+                    del self._received[run_id]
+
+
+class SpellWebhookReceiver(LoggingMixin):
+    """
+    A small HTTP server recording run status notifications (Spell webhooks or
+    any other sender) in :class:`SpellRunEvents`, to run alongside the
+    triggerer and workers of a host
+
+    It accepts a ``POST`` of a JSON run status notification to any path (see
+    :func:`parse_run_event`) and answers ``204 No Content``; with a ``secret``
+    the body must be signed in the :data:`SIGNATURE_HEADER` header (see
+    :func:`sign`). A ``GET`` answers ``200 OK``, for health checks.
+
+    :param events: the store notifications are recorded in
+    :type events: Optional[SpellRunEvents]
+
+    :param host: the address to listen on
+    :type host: str
+
+    :param port: the port to listen on; 0 picks a free port
+    :type port: int
+
+    :param secret: the shared secret webhook bodies are signed with
+    :type secret: Optional[str]
+    """
+
+    # the largest notification body accepted, in bytes
+    MAX_BODY_BYTES = 1024 * 1024
+
+    def __init__(
+        self,
+        events: Optional[SpellRunEvents] = None,
+        host: str = "127.0.0.1",
+        port: int = 8787,
+        secret: Optional[str] = None,
+    ):
+        super().__init__()
+        self.events = events or SpellRunEvents.for_path()
+        self.secret = secret
+        self.tags = spell_metrics.stats_tags(None, None)
+        self.server = _ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d/" % (host, port)
+
+    def start(self) -> "SpellWebhookReceiver":
+        """
+        Serve notifications from a background thread
+        """
+        self._thread = Thread(
+            target=self.server.serve_forever, name="spell-webhooks", daemon=True
+        )
+        self._thread.start()
+        self.log.info("Receiving Spell run notifications on %s" % self.url)
+        return self
+
+    def serve_forever(self):
+        self.log.info("Receiving Spell run notifications on %s" % self.url)
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def receive(self, body: bytes, signature: Optional[str]) -> int:
+        """
+        Record the notification of a request body
+
+        :return: the HTTP status code of the response
+        :rtype: int
+        """
+        if self.secret:
+            expected = sign(body, self.secret)
+            signature = (signature or "").split("=", 1)[-1]
+            if not hmac.compare_digest(signature, expected):
+                spell_metrics.incr("webhook.rejected", self.tags)
+                self.log.warning("Spell run notification with a bad signature")
+                return 401
+        try:
+            run_id, status = parse_run_event(json.loads(body))
+        except ValueError as e:
+            spell_metrics.incr("webhook.rejected", self.tags)
+            self.log.warning("Spell run notification rejected: %s" % e)
+            return 400
+        self.events.record(run_id, status)
+        spell_metrics.incr("webhook.received", self.tags)
+        self.log.info("Spell run (%s) notification: %s" % (run_id, status))
+        return 204
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._respond(200)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > receiver.MAX_BODY_BYTES:
+                    self._respond(413)
+                    return
+                body = self.rfile.read(length)
+                self._respond(
+                    receiver.receive(body, self.headers.get(SIGNATURE_HEADER))
+                )
+
+            def _respond(self, code: int):
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format: str, *args: Any):
+                receiver.log.debug(format % args)
+
+        return Handler
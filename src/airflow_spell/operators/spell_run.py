@@ -1,9 +1,18 @@
-from typing import Dict, Optional
+from functools import partial
+from typing import Any, Dict, List, Optional
 
 from airflow import AirflowException
-from airflow.models import BaseOperator
+from airflow.models import BaseOperator, Variable
 
 from airflow_spell import SpellClient
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_admission import SpellAdmissionController
+from airflow_spell.hooks.spell_client import REATTACHABLE_STATUS, SpellRunStatus
+from airflow_spell.hooks.spell_distributed import SpellDistributedRunMonitor
+from airflow_spell.hooks.spell_polling import SpellPollingPolicy, _run_duration
+from airflow_spell.hooks.spell_profile import SpellRunProfiles, run_profile
+from airflow_spell.hooks.spell_run_cache import SpellRunCache
+from airflow_spell.triggers.spell_run import SpellRunTrigger
 
 
 """ https://spell.run/docs/runs/
@@ -17,6 +26,50 @@ class SpellRunOperator(BaseOperator, SpellClient):
     Args:
         spell_conn_id (str): Airflow connection id for spell
         spell_owner (str, optional): Spell owner (if different from user account)
+        deferrable (bool, optional): submit the run on the worker, then defer monitoring
+            to :class:`~airflow_spell.triggers.spell_run.SpellRunTrigger` on the triggerer
+            (default: False)
+        poll_interval (float, optional): seconds between status checks when deferred (default: 30)
+        batch_polling (bool, optional): share status requests with every other run watched in the
+            process (or triggerer) through :class:`~airflow_spell.hooks.spell_client.SpellRunStatusPoller`
+            (default: False)
+        polling_policy (SpellPollingPolicy, optional): decides the pause between status checks and the
+            wall-clock timeout of the run, e.g. :class:`~airflow_spell.hooks.spell_polling.HistoryPollingPolicy`
+            (default: :class:`~airflow_spell.hooks.spell_polling.ExponentialPollingPolicy`)
+        stream_logs (bool, optional): write the run's new log lines to the task log at every status
+            check; after a retry or reattach streaming resumes from the last saved line (default: False)
+        max_log_bytes (int, optional): the run log output written per status check, so a chatty run
+            cannot flood the log backend (default: 64 KiB)
+        abort_patterns (:obj:`list` of :obj:`str`, optional): regular expressions matched against every
+            run log line; the run is stopped and the task fails on the first match, e.g.
+            :attr:`~airflow_spell.hooks.spell_client.SpellClient.COMMON_ABORT_PATTERNS` (default: None)
+        wait_for_webhooks (bool, optional): check the run status as soon as a run notification is
+            received by a :class:`~airflow_spell.hooks.spell_webhooks.SpellWebhookReceiver` on this
+            host (worker or triggerer), rather than only after the polling pause, which then becomes
+            a fallback for missed notifications (default: False)
+        reattach (bool, optional): save the spell run ID as soon as the run is submitted and, when the
+            task is retried, reattach to that run if it is still running or completed successfully
+            instead of submitting a duplicate run (default: True)
+        run_cache (SpellRunCache, optional): reuse the earlier successful run with the same run arguments
+            instead of submitting a new one, and submit with ``idempotent=True`` (unless given) on a cache
+            miss; only for deterministic runs, see :class:`~airflow_spell.hooks.spell_run_cache.SpellRunCache`
+            (default: None)
+        record_profile (bool, optional): push the time the run spent in each phase (queued, building,
+            pushing, running, saving) as the ``spell_run_phases`` XCom and append it to the local
+            :class:`~airflow_spell.hooks.spell_profile.SpellRunProfiles` store (default: True)
+        monitor_distributed (bool, optional): for ``distributed`` runs, follow every worker process
+            (rank) through the run log, stop the run as soon as one rank fails, and push per rank
+            output times and exit codes as the ``spell_run_nodes`` XCom; not applied while deferred
+            (default: True)
+        upstream_outputs (:obj:`dict` of :obj:`str` -> :obj:`str`, optional): upstream SpellRunOperator
+            task ID to mountpoint mapping; the outputs of each upstream task's run (its ``spell_run_id``
+            XCom) are added to ``attached_resources``. For example: ``{"train": "/mnt/model"}``
+            (default: None)
+        speculative (bool, optional): let the upstream tasks of :obj:`upstream_outputs` submit this run
+            as soon as their run enters SAVING, so its build overlaps their save; this task then reattaches
+            to that run, which is stopped if the upstream run fails. Requires ``reattach``; not applied
+            with a ``run_cache``, a machine type under a ``machine_quotas`` quota, or while the upstream
+            task is deferred (default: False)
         task_id (str, optional):
         params (dict, optional):
         (all commands below passed to SpellClient)
@@ -71,32 +124,446 @@ class SpellRunOperator(BaseOperator, SpellClient):
         task_id: str,
         spell_owner: Optional[str] = None,
         spell_conn_id: Optional[str] = None,
+        deferrable: bool = False,
+        poll_interval: float = 30.0,
+        batch_polling: bool = False,
+        polling_policy: Optional[SpellPollingPolicy] = None,
+        stream_logs: bool = False,
+        max_log_bytes: int = SpellClient.DEFAULT_MAX_LOG_BYTES,
+        abort_patterns: Optional[List[str]] = None,
+        wait_for_webhooks: bool = False,
+        reattach: bool = True,
+        run_cache: Optional[SpellRunCache] = None,
+        record_profile: bool = True,
+        monitor_distributed: bool = True,
+        upstream_outputs: Optional[Dict[str, str]] = None,
+        speculative: bool = False,
         **kwargs,
     ):
         BaseOperator.__init__(self, task_id=task_id)
-        SpellClient.__init__(self, spell_conn_id=spell_conn_id, spell_owner=spell_owner)
+        SpellClient.__init__(
+            self,
+            spell_conn_id=spell_conn_id,
+            spell_owner=spell_owner,
+            batch_polling=batch_polling,
+            polling_policy=polling_policy,
+            stream_logs=stream_logs,
+            max_log_bytes=max_log_bytes,
+            abort_patterns=abort_patterns,
+            wait_for_webhooks=wait_for_webhooks,
+        )
+        self.deferrable = deferrable
+        self.poll_interval = poll_interval
+        self.reattach = reattach
+        self.run_cache = run_cache
+        self.record_profile = record_profile
+        self.monitor_distributed = monitor_distributed
+        self.upstream_outputs = upstream_outputs
+        self.speculative = speculative
+        # downstream task ID -> the spell run ID submitted for it ahead of time
+        self.speculative_runs: Dict[str, Any] = {}
+        self.admission: Optional[SpellAdmissionController] = None
+        self.spell_run_id: Optional[str] = None
         self.log.warning(kwargs)
         if "default_args" in kwargs:
             kwargs.pop("default_args")
         self.kwargs = kwargs
+        self.machine_type = kwargs.get("machine_type", "CPU")
 
     def execute(self, context: Dict) -> int:
         """
-        Submit and monitor a Spell run
+        Submit (or reattach to) and monitor a Spell run
         :raises: AirflowException
         """
-        self.submit_run(context)
-        self.monitor_run(context)
+        if self.upstream_outputs:
+            run_kwargs = self.upstream_run_kwargs(context)
+            if run_kwargs is None:
+                raise AirflowException(
+                    "Spell run IDs of upstream tasks %s not found in XCom"
+                    % list(self.upstream_outputs)
+                )
+            self.kwargs = run_kwargs
+
+        if self.cached_run():
+            return self.spell_run_id
+
+        self.admission = self.hook.get_admission_controller()
+        if self.reattach_run(context):
+            self._renew_admission(context)
+        else:
+            self.admit_run(context)
+            try:
+                self.submit_run(context)
+            except Exception:
+                self.release_run(context)
+                raise
+
+        self.status_callback = partial(self._on_run_status, context)
+
+        if self.stream_logs and self.reattach:
+            self.log_offset_callback = partial(
+                self._set_task_state, context, "log_offset"
+            )
+
+        if self.deferrable:
+            self.defer(
+                trigger=SpellRunTrigger(
+                    run_id=self.spell_run_id,
+                    spell_conn_id=self.spell_conn_id,
+                    spell_owner=self.spell_owner,
+                    poll_interval=self.poll_interval,
+                    batch_polling=self.batch_polling,
+                    stream_logs=self.stream_logs,
+                    max_log_bytes=self.max_log_bytes,
+                    log_offset=self.log_offset,
+                    abort_patterns=self.abort_patterns,
+                    wait_for_webhooks=self.wait_for_webhooks,
+                    admission_ticket=self._deferred_admission_ticket(context),
+                    machine_type=self.machine_type,
+                    timeout=self.polling_policy.timeout,
+                    status_timeouts=self.polling_policy.status_timeouts,
+                ),
+                method_name="execute_complete",
+            )
+
+        if self.monitor_distributed and int(self.kwargs.get("distributed") or 1) > 1:
+            self.distributed_monitor = SpellDistributedRunMonitor(
+                ranks=int(self.kwargs["distributed"])
+            )
+
+        try:
+            self.monitor_run(context)
+        except Exception:
+            self.stop_speculative_runs(
+                context, "upstream Spell run (%s) failed" % self.spell_run_id
+            )
+            self._clear_run_state_on_final_try(context)
+            raise
+        finally:
+            self.release_run(context)
+            self.profile_run(context)
+            self.report_nodes(context)
+        self._cache_run()
+        self._clear_run_state(context)
+
+        # this return value gets pushed as XCom
+        return self.spell_run_id
+
+    def execute_complete(self, context: Dict, event: Dict[str, Any]) -> int:
+        """
+        Resume after :class:`SpellRunTrigger` reports the run reached a final status
+        :raises: AirflowException
+        """
+        self.spell_run_id = event["spell_run_id"]
+        if event.get("log_offset") is not None:
+            # a retry reattaching to the run streams its log from here
+            self.log_offset = event["log_offset"]
+            if self.stream_logs and self.reattach:
+                self._set_task_state(context, "log_offset", self.log_offset)
+
+        if event["status"] == "error":
+            self.log.info("Spell run (%s) failed monitoring" % self.spell_run_id)
+            self._clear_run_state_on_final_try(context)
+            raise AirflowException(event["message"])
+
+        self.status_timeline = [
+            (status, seen_at) for status, seen_at in event.get("status_timeline", [])
+        ]
+        try:
+            self.check_run_complete(self.spell_run_id)
+            self.log.info("Spell run (%s) succeeded" % self.spell_run_id)
+
+        except Exception as e:
+            self.log.info("Spell run (%s) failed monitoring" % self.spell_run_id)
+            self._clear_run_state_on_final_try(context)
+            raise AirflowException(e)
+
+        finally:
+            self.profile_run(context)
+
+        self._cache_run()
+        self._clear_run_state(context)
 
         # this return value gets pushed as XCom
         return self.spell_run_id
 
+    def profile_run(self, context: Dict):
+        """
+        Push the time the run spent in each phase as the ``spell_run_phases``
+        XCom and append it to the local profile store
+        """
+        if not self.record_profile or not self.status_timeline:
+            return
+
+        try:
+            profile = run_profile(
+                self._get_recent_run(self.spell_run_id), self.status_timeline
+            )
+            self.log.info(
+                "Spell run (%s) phases (seconds): %s"
+                % (
+                    self.spell_run_id,
+                    ", ".join("%s %.0f" % phase for phase in profile["phases"].items()),
+                )
+            )
+            ti = context.get("ti")
+            if ti is not None:
+                ti.xcom_push(key="spell_run_phases", value=profile)
+            SpellRunProfiles().record(profile)
+        except Exception as e:
+            self.log.warning(
+                "Spell run (%s) profile could not be recorded: %s"
+                % (self.spell_run_id, e)
+            )
+
+    def report_nodes(self, context: Dict):
+        """
+        Log the per rank output times and exit codes of a distributed run and
+        push them as the ``spell_run_nodes`` XCom
+        """
+        if self.distributed_monitor is None:
+            return
+
+        nodes = self.distributed_monitor.summary()
+        for rank, node in nodes.items():
+            self.log.info(
+                "Spell run (%s) rank %s: %d output lines, exit code %s"
+                % (self.spell_run_id, rank, node["lines"], node["exit_code"])
+            )
+        ti = context.get("ti")
+        if ti is not None:
+            ti.xcom_push(key="spell_run_nodes", value=nodes)
+
+    def on_kill(self):
+        """
+        Stop the Spell run when the task is killed or times out
+        """
+        if self.spell_run_id is not None:
+            self.stop_run(self.spell_run_id, "the Airflow task was killed")
+        self.stop_speculative_runs(None, "the upstream Airflow task was killed")
+
+    def upstream_run_kwargs(
+        self, context: Dict, spell_run_ids: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The run arguments, with the outputs of the runs of the
+        :attr:`upstream_outputs` tasks added to ``attached_resources``;
+        upstream run IDs missing from ``spell_run_ids`` are pulled from XCom
+
+        :return: None if the run ID of an upstream task is not known yet
+        :rtype: Optional[Dict[str, Any]]
+        """
+        run_kwargs = dict(self.kwargs)
+        attached_resources = dict(run_kwargs.get("attached_resources") or {})
+        for task_id, mountpoint in (self.upstream_outputs or {}).items():
+            spell_run_id = (spell_run_ids or {}).get(task_id)
+            if spell_run_id is None:
+                spell_run_id = context["ti"].xcom_pull(task_ids=task_id)
+            if spell_run_id is None:
+                return None
+            attached_resources["runs/%s" % spell_run_id] = mountpoint
+        run_kwargs["attached_resources"] = attached_resources
+        return run_kwargs
+
+    def submit_speculative_runs(self, context: Dict):
+        """
+        Submit the runs of the ``speculative`` downstream tasks that mount
+        this task's run outputs, and save each as the run of its task, which
+        reattaches to it once this task succeeds
+        """
+        for task in self.downstream_list:
+            if (
+                not isinstance(task, SpellRunOperator)
+                or not (task.speculative and task.reattach)
+                or task.run_cache is not None
+                or self.task_id not in (task.upstream_outputs or {})
+                or task.task_id in self.speculative_runs
+            ):
+                continue
+
+            # e.g. submitted by an earlier try of this task
+            spell_run_id = self._get_task_state(
+                context, "spell_run_id", task_id=task.task_id
+            )
+            if spell_run_id is not None:
+                self.speculative_runs[task.task_id] = spell_run_id
+                continue
+
+            admission = task.hook.get_admission_controller()
+            if admission is not None and task.machine_type in admission.quotas:
+                continue
+            run_kwargs = task.upstream_run_kwargs(
+                context, {self.task_id: self.spell_run_id}
+            )
+            if run_kwargs is None:
+                continue
+
+            try:
+                with spell_metrics.timer("runs_new", task.stats_tags):
+                    run = task.client.runs.new(**run_kwargs)
+            except Exception as e:
+                self.log.warning(
+                    "Speculative Spell run of task (%s) failed submission: %s"
+                    % (task.task_id, e)
+                )
+                continue
+            self.speculative_runs[task.task_id] = run.id
+            self._set_task_state(context, "spell_run_id", run.id, task_id=task.task_id)
+            self.log.info(
+                "Spell run (%s) of downstream task (%s) submitted while Spell run"
+                " (%s) is saving" % (run.id, task.task_id, self.spell_run_id)
+            )
+
+    def stop_speculative_runs(self, context: Optional[Dict], reason: str):
+        """
+        Stop the runs submitted ahead of time for downstream tasks, which
+        will not run
+        """
+        if not self.speculative_runs:
+            return
+        tasks = {task.task_id: task for task in self.downstream_list}
+        for task_id, spell_run_id in self.speculative_runs.items():
+            tasks[task_id].stop_run(spell_run_id, reason)
+            if context is not None:
+                self._clear_task_state(context, "spell_run_id", task_id=task_id)
+        self.speculative_runs = {}
+
+    def cached_run(self) -> bool:
+        """
+        Reuse the earlier successful Spell run with the same run arguments
+        from :attr:`run_cache`, if any
+
+        :rtype: bool
+        """
+        if self.run_cache is None:
+            return False
+
+        cached = self.run_cache.lookup(self._run_cache_key())
+        stats = self.run_cache.stats()
+        if cached is None:
+            spell_metrics.incr("run_cache.miss", self.stats_tags)
+            self.log.info(
+                "Spell run cache miss; host hit rate %.0f%% (%d of %d)"
+                % (
+                    100 * stats["hit_rate"],
+                    stats["hits"],
+                    stats["hits"] + stats["misses"],
+                )
+            )
+            return False
+
+        self.spell_run_id, duration = cached
+        spell_metrics.incr("run_cache.hit", self.stats_tags)
+        spell_metrics.timing("run_cache.saved", duration, self.stats_tags)
+        self.log.info(
+            "Spell run cache hit: reusing Spell run (%s), saving %.0f seconds of"
+            " compute; host hit rate %.0f%% (%d of %d), %.0f seconds saved in total"
+            % (
+                self.spell_run_id,
+                duration,
+                100 * stats["hit_rate"],
+                stats["hits"],
+                stats["hits"] + stats["misses"],
+                stats["saved_seconds"],
+            )
+        )
+        return True
+
+    def admit_run(self, context: Dict):
+        """
+        Wait for a slot of the run's machine type from the admission
+        controller of the connection (``machine_quotas`` extra), ahead of
+        tasks with a lower priority weight
+        """
+        if self.admission is None:
+            return
+
+        ti = context.get("ti")
+        priority = getattr(ti, "priority_weight", None) or self.priority_weight
+        self.log.info(
+            "Waiting for a %s slot (priority %s)" % (self.machine_type, priority)
+        )
+        self.admission.acquire(
+            self._admission_ticket(context), self.machine_type, priority
+        )
+
+    def release_run(self, context: Dict):
+        """
+        Give back the admission slot of the run, once it ended
+        """
+        if self.admission is not None:
+            self.admission.release(self._admission_ticket(context))
+
+    def reattach_run(self, context: Dict) -> bool:
+        """
+        Reattach to the Spell run submitted by an earlier try of this task
+        instance, if that run is still running or completed successfully;
+        a new run is only submitted once the earlier run is known to have
+        failed, been killed or be missing
+
+        :rtype: bool
+        :raises: AirflowException if the earlier run could not be checked
+        """
+        if not self.reattach:
+            return False
+
+        spell_run_id = self._get_task_state(context, "spell_run_id")
+        if spell_run_id is None:
+            return False
+
+        try:
+            # transient API errors are retried: resubmitting while the
+            # earlier run is still live would run it twice
+            run = self._check_run(spell_run_id)
+        except Exception as e:
+            status_code = getattr(getattr(e, "response", None), "status_code", None)
+            if status_code != 404:
+                raise AirflowException(
+                    "Spell run (%s) from an earlier try could not be checked: %s"
+                    % (spell_run_id, e)
+                )
+            self.log.info(
+                "Spell run (%s) from an earlier try was not found;"
+                " submitting a new run" % spell_run_id
+            )
+            self._clear_run_state(context)
+            return False
+
+        if run.status not in REATTACHABLE_STATUS or (
+            run.user_exit_code is not None and int(run.user_exit_code) != 0
+        ):
+            self.log.info(
+                "Spell run (%s) from an earlier try ended with status (%s);"
+                " submitting a new run" % (spell_run_id, run.status)
+            )
+            self._clear_run_state(context)
+            return False
+
+        self.spell_run_id = spell_run_id
+        if self.stream_logs:
+            self.log_offset = self._get_task_state(context, "log_offset") or 0
+        self.log.info(
+            "Reattaching to Spell run (%s) with status (%s)"
+            % (self.spell_run_id, run.status)
+        )
+        return True
+
     def submit_run(self, context: Dict):  # pylint: disable=unused-argument
         self.log.info("Running Spell run")
 
         try:
-            run = self.client.runs.new(**self.kwargs)
+            run_kwargs = dict(self.kwargs)
+            if self.run_cache is not None:
+                # fall back to spell's own reuse of identical runs
+                run_kwargs.setdefault("idempotent", True)
+            with spell_metrics.timer("runs_new", self.stats_tags):
+                run = self.client.runs.new(**run_kwargs)
             self.spell_run_id = run.id
+            self.log_offset = 0
+            if self.reattach:
+                self._set_task_state(context, "spell_run_id", self.spell_run_id)
+                if self.stream_logs:
+                    self._set_task_state(context, "log_offset", self.log_offset)
 
             self.log.info(
                 "Spell run (spell_run_id: %s) started: %s"
@@ -120,3 +587,110 @@ class SpellRunOperator(BaseOperator, SpellClient):
         except Exception as e:
             self.log.info("Spell run (%s) failed monitoring" % self.spell_run_id)
             raise AirflowException(e)
+
+    def _on_run_status(self, context: Dict, run: Any = None):
+        # slots are leases, held while the run is being checked on
+        self._renew_admission(context)
+        if getattr(run, "status", None) == SpellRunStatus.SAVING and self.has_dag():
+            self.submit_speculative_runs(context)
+
+    def _renew_admission(self, context: Dict):
+        if self.admission is not None:
+            self.admission.renew(self._admission_ticket(context), self.machine_type)
+
+    def _deferred_admission_ticket(self, context: Dict) -> Optional[str]:
+        # the trigger renews the slot while the run is deferred and releases
+        # it once the run ends, on whichever host it runs
+        if self.admission is None or self.machine_type not in self.admission.quotas:
+            return None
+        return self._admission_ticket(context)
+
+    def _admission_ticket(self, context: Dict) -> str:
+        ti = context.get("ti")
+        if ti is None:
+            return "%s__%s" % (self.task_id, id(self))
+        return "%s__%s__%s__%s" % (
+            ti.dag_id,
+            ti.task_id,
+            ti.run_id,
+            getattr(ti, "map_index", -1),
+        )
+
+    def _run_cache_key(self) -> str:
+        return SpellRunCache.run_key(self.spell_conn_id, self.spell_owner, self.kwargs)
+
+    def _cache_run(self):
+        """
+        Index the successful run in :attr:`run_cache`
+        """
+        if self.run_cache is None:
+            return
+        run = self._get_recent_run(self.spell_run_id)
+        self.run_cache.record(
+            self._run_cache_key(), self.spell_run_id, _run_duration(run) or 0.0
+        )
+
+    def _clear_run_state(self, context: Dict):
+        """
+        Forget the run (and its log offset) saved for retries of this task
+        """
+        self._clear_task_state(context, "spell_run_id")
+        self._clear_task_state(context, "log_offset")
+
+    def _clear_run_state_on_final_try(self, context: Dict):
+        """
+        Forget the saved run once the task has failed its last try, when
+        no retry will reattach to it
+        """
+        if not self.reattach:
+            return
+        ti = context.get("ti")
+        if ti is not None and ti.is_eligible_to_retry():
+            return
+        try:
+            self._clear_run_state(context)
+        except Exception as e:
+            self.log.warning(
+                "Spell run (%s) task state could not be cleared: %s"
+                % (self.spell_run_id, e)
+            )
+
+    def _task_state_key(
+        self, context: Dict, name: str, task_id: Optional[str] = None
+    ) -> str:
+        """
+        Key for state that must outlive a single task try; XComs are cleared
+        when a task instance is retried, so this state is kept as a Variable
+        keyed by dag_id/task_id/run_id/map_index. ``task_id`` selects the
+        (unmapped) task instance of another task in the same DAG run
+        """
+        ti = context["ti"]
+        return "airflow_spell__%s__%s__%s__%s__%s" % (
+            ti.dag_id,
+            task_id or ti.task_id,
+            ti.run_id,
+            -1 if task_id else getattr(ti, "map_index", -1),
+            name,
+        )
+
+    def _get_task_state(
+        self, context: Dict, name: str, task_id: Optional[str] = None
+    ) -> Optional[Any]:
+        return Variable.get(
+            self._task_state_key(context, name, task_id),
+            default_var=None,
+            deserialize_json=True,
+        )
+
+    def _set_task_state(
+        self, context: Dict, name: str, value: Any, task_id: Optional[str] = None
+    ):
+        Variable.set(
+            self._task_state_key(context, name, task_id), value, serialize_json=True
+        )
+
+    def _clear_task_state(
+        self, context: Dict, name: str, task_id: Optional[str] = None
+    ):
+        if self.reattach or task_id:
+            Variable.delete(self._task_state_key(context, name, task_id))
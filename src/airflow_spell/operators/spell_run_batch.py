@@ -0,0 +1,277 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from airflow import AirflowException
+from airflow.models import BaseOperator
+from airflow.models.xcom import XCOM_RETURN_KEY
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_client import SpellRunStatus, _delay
+from airflow_spell.hooks.spell_polling import SpellPollingPolicy, run_elapsed
+from airflow_spell.hooks.spell_profile import phase_durations
+
+
+class SpellRunBatchOperator(BaseOperator, SpellClient):
+    """
+    Submit a batch of Spell runs concurrently and monitor them from a single
+    polling loop
+
+    Args:
+        runs (:obj:`list` of :obj:`dict`): one run spec per Spell run; each spec takes the same
+            keyword arguments as :class:`~airflow_spell.operators.spell_run.SpellRunOperator`
+            (i.e. ``spell.client.runs.RunService.new``)
+        spell_conn_id (str): Airflow connection id for spell
+        spell_owner (str, optional): Spell owner (if different from user account)
+        max_submit_workers (int, optional): the number of runs submitted at the same time (default: 8)
+        fail_fast (bool, optional): stop the remaining runs and fail the task as soon as any run fails;
+            otherwise wait for every run and fail the task afterwards if any run failed (default: True)
+        batch_polling (bool, optional): share status requests with every other run watched in the
+            process through :class:`~airflow_spell.hooks.spell_client.SpellRunStatusPoller`
+            (default: True)
+        polling_policy (SpellPollingPolicy, optional): decides the pause between status checks
+            (default: :class:`~airflow_spell.hooks.spell_polling.ExponentialPollingPolicy`)
+        task_id (str, optional):
+        (all other keyword arguments are run arguments shared by every run spec, which may
+        override them; e.g. ``machine_type="GPU-V100"``)
+
+    The outcome of each run (``spell_run_id``, ``status``, ``user_exit_code``,
+    ``succeeded``, ``stopped_early`` and the seconds spent in each phase,
+    ``phases``) is returned, in the order of ``runs``, and pushed as XCom,
+    also when the task fails.
+    """
+
+    ui_color = "#f2f0f6"
+    ui_fgcolor = "#3c1fd1"
+
+    def __init__(
+        self,
+        *,
+        task_id: str,
+        runs: List[Dict[str, Any]],
+        spell_owner: Optional[str] = None,
+        spell_conn_id: Optional[str] = None,
+        max_submit_workers: int = 8,
+        fail_fast: bool = True,
+        batch_polling: bool = True,
+        polling_policy: Optional[SpellPollingPolicy] = None,
+        **kwargs,
+    ):
+        BaseOperator.__init__(self, task_id=task_id)
+        SpellClient.__init__(
+            self,
+            spell_conn_id=spell_conn_id,
+            spell_owner=spell_owner,
+            batch_polling=batch_polling,
+            polling_policy=polling_policy,
+        )
+        kwargs.pop("default_args", None)
+        self.runs = [dict(kwargs, **run_spec) for run_spec in runs]
+        self.max_submit_workers = max_submit_workers
+        self.fail_fast = fail_fast
+        self.spell_run_ids: List[Optional[str]] = []
+        self.outcomes: List[Dict[str, Any]] = []
+
+    def execute(self, context: Dict) -> List[Dict[str, Any]]:
+        """
+        Submit and monitor a batch of Spell runs
+        :raises: AirflowException
+        """
+        try:
+            outcomes = self.submit_runs(context)
+            outcomes = self.monitor_runs(context, outcomes)
+
+            failed = [outcome for outcome in outcomes if _failed(outcome)]
+            if failed:
+                raise AirflowException(
+                    "%d of %d Spell runs failed: %s"
+                    % (len(failed), len(outcomes), failed)
+                )
+        except Exception:
+            # the runs that succeeded, for the record and downstream tasks
+            ti = context.get("ti")
+            if ti is not None and self.outcomes:
+                ti.xcom_push(key=XCOM_RETURN_KEY, value=self.outcomes)
+            raise
+
+        # this return value gets pushed as XCom
+        return outcomes
+
+    def submit_runs(self, context: Dict) -> List[Dict[str, Any]]:
+        """
+        Submit every run spec through a bounded thread pool
+        :raises: AirflowException
+        """
+        self.log.info(
+            "Submitting %d Spell runs (%d at a time)"
+            % (len(self.runs), self.max_submit_workers)
+        )
+
+        with ThreadPoolExecutor(max_workers=self.max_submit_workers) as executor:
+            outcomes = list(executor.map(self._submit_run, self.runs))
+        self.outcomes = outcomes
+
+        self.spell_run_ids = [outcome["spell_run_id"] for outcome in outcomes]
+
+        if self.fail_fast and any(outcome["error"] for outcome in outcomes):
+            self.stop_runs(outcomes)
+            raise AirflowException(
+                "Spell runs failed submission: %s"
+                % [outcome for outcome in outcomes if outcome["error"]]
+            )
+
+        return outcomes
+
+    def monitor_runs(
+        self, context: Dict, outcomes: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Poll every submitted run from one loop until all of them reach a final status
+        :raises: AirflowException
+        """
+        pending = [outcome for outcome in outcomes if outcome["spell_run_id"]]
+        retries = 0
+        started_at = monotonic()
+        # run ID -> (status, epoch seconds) of each status change
+        timelines: Dict[Any, List[Tuple[str, float]]] = {}
+        while pending:
+            running = []
+            for outcome in list(pending):
+                run = self._check_run(outcome["spell_run_id"])
+                outcome["status"] = run.status
+                timeline = timelines.setdefault(outcome["spell_run_id"], [])
+                if not timeline or timeline[-1][0] != run.status:
+                    timeline.append((run.status, time()))
+                if run.status not in SpellRunStatus.FINAL:
+                    running.append((outcome, run))
+                    continue
+
+                pending.remove(outcome)
+                self.polling_policy.record_run(run)
+                outcome["phases"] = phase_durations(
+                    timeline, getattr(run, "created_at", None)
+                )
+                outcome["user_exit_code"] = run.user_exit_code
+                outcome["succeeded"] = (
+                    run.status == SpellRunStatus.COMPLETE
+                    and int(run.user_exit_code) == 0
+                )
+                self.log.info(
+                    "Spell run (%s) finished with status (%s)"
+                    % (outcome["spell_run_id"], run.status)
+                )
+
+                if self.fail_fast and _failed(outcome):
+                    self.stop_runs(pending)
+                    raise AirflowException(
+                        "Spell run (%s) failed: %s" % (outcome["spell_run_id"], run)
+                    )
+
+            if not pending:
+                break
+
+            if retries >= self.MAX_RETRIES:
+                self.stop_runs(pending)
+                raise AirflowException(
+                    "Spell runs (%s) status checks exceed max_retries"
+                    % [outcome["spell_run_id"] for outcome in pending]
+                )
+
+            self.check_runs(running)
+
+            now = time()
+            elapsed = [run_elapsed(run, monotonic() - started_at) for _, run in running]
+            for (outcome, run), run_age in zip(running, elapsed):
+                status_since = timelines[outcome["spell_run_id"]][-1][1]
+                reason = self.polling_policy.limit_exceeded(
+                    run.status, now - status_since, run_age
+                )
+                if reason is not None:
+                    self.stop_runs(pending)
+                    raise AirflowException(
+                        "Spell runs (%s) cancelled, Spell run (%s): %s"
+                        % (
+                            [outcome["spell_run_id"] for outcome in pending],
+                            outcome["spell_run_id"],
+                            reason,
+                        )
+                    )
+
+            retries += 1
+            # the run expected to change soonest sets the pace of the loop
+            pause = min(
+                self.polling_policy.next_delay(run, retries, run_age)
+                for (_, run), run_age in zip(running, elapsed)
+            )
+            self.log.info(
+                "%d of %d Spell runs still running, next check (%d of %d)"
+                " in the %.2f seconds"
+                % (len(pending), len(outcomes), retries, self.MAX_RETRIES, pause)
+            )
+            _delay(pause)
+
+        return outcomes
+
+    def check_runs(self, running: List[Tuple[Dict[str, Any], Any]]):
+        """
+        Called with the (outcome, run) of every run still running after each
+        round of status checks; subclasses may stop runs here, setting
+        ``stopped_early`` in their outcome so they do not count as failed
+        """
+
+    def on_kill(self):
+        """
+        Stop the submitted runs when the task is killed or times out
+        """
+        self.stop_runs(self.outcomes)
+
+    def stop_runs(self, outcomes: List[Dict[str, Any]]):
+        """
+        Stop the submitted runs of ``outcomes`` that have not reached a final status
+        """
+        for outcome in outcomes:
+            if not outcome["spell_run_id"] or (
+                outcome["status"] in SpellRunStatus.FINAL
+            ):
+                continue
+            try:
+                self.client.api.stop_run(outcome["spell_run_id"])
+                self.log.info("Spell run (%s) stopped" % outcome["spell_run_id"])
+            except Exception as e:
+                self.log.info(
+                    "Spell run (%s) could not be stopped: %s"
+                    % (outcome["spell_run_id"], e)
+                )
+
+    def _submit_run(self, run_spec: Dict[str, Any]) -> Dict[str, Any]:
+        outcome = {
+            "spell_run_id": None,
+            "status": None,
+            "user_exit_code": None,
+            "succeeded": False,
+            "error": None,
+            "phases": {},
+            "stopped_early": False,
+        }
+        try:
+            tags = spell_metrics.stats_tags(
+                self.spell_conn_id,
+                self.spell_owner,
+                run_spec.get("machine_type", "CPU"),
+            )
+            with spell_metrics.timer("runs_new", tags):
+                run = self.client.runs.new(**run_spec)
+            outcome["spell_run_id"] = run.id
+            outcome["status"] = run.status
+            self.log.info("Spell run (spell_run_id: %s) started: %s" % (run.id, run))
+
+        except Exception as e:
+            outcome["error"] = str(e)
+            self.log.info("Spell run (%s) failed submission: %s" % (run_spec, e))
+
+        return outcome
+
+
+def _failed(outcome: Dict[str, Any]) -> bool:
+    return not outcome["succeeded"] and not outcome["stopped_early"]
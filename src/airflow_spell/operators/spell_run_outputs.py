@@ -0,0 +1,73 @@
+from typing import Any, Dict, List, Optional
+
+from airflow.models import BaseOperator
+
+from airflow_spell import SpellClient
+
+
+class SpellRunOutputsOperator(BaseOperator, SpellClient):
+    """
+    Download the outputs of a finished Spell run to a local directory
+
+    Args:
+        spell_run_id (str): the spell run ID, e.g. ``"{{ ti.xcom_pull(task_ids='train') }}"`` for the
+            run of a :class:`~airflow_spell.operators.spell_run.SpellRunOperator` (templated)
+        destination (str): the local directory to download into (templated)
+        patterns (:obj:`list` of :obj:`str`, optional): globs of output paths relative to the run,
+            e.g. ``["models/*.pt", "metrics.json"]`` (templated, default: every output)
+        spell_conn_id (str): Airflow connection id for spell
+        spell_owner (str, optional): Spell owner (if different from user account)
+        max_workers (int, optional): the number of files downloaded at the same time (default: 8)
+        verify_checksum (bool, optional): re-download files whose local copy no longer matches the
+            checksum recorded when it was downloaded; otherwise local copies of the listed size are
+            kept (default: False)
+        task_id (str, optional):
+
+    Files are streamed to disk a chunk at a time and files already downloaded
+    are skipped, so a retried task resumes from the files it had left. The
+    ``downloaded`` and ``skipped`` paths and the ``bytes`` downloaded are
+    returned and pushed as XCom.
+    """
+
+    template_fields = ("spell_run_id", "destination", "patterns")
+    ui_color = "#f2f0f6"
+    ui_fgcolor = "#3c1fd1"
+
+    def __init__(
+        self,
+        *,
+        task_id: str,
+        spell_run_id: str,
+        destination: str,
+        patterns: Optional[List[str]] = None,
+        spell_owner: Optional[str] = None,
+        spell_conn_id: Optional[str] = None,
+        max_workers: int = 8,
+        verify_checksum: bool = False,
+        **kwargs,
+    ):
+        BaseOperator.__init__(self, task_id=task_id, **kwargs)
+        SpellClient.__init__(
+            self,
+            spell_conn_id=spell_conn_id,
+            spell_owner=spell_owner,
+        )
+        self.spell_run_id = spell_run_id
+        self.destination = destination
+        self.patterns = patterns
+        self.max_workers = max_workers
+        self.verify_checksum = verify_checksum
+
+    def execute(self, context: Dict) -> Dict[str, Any]:
+        """
+        Download the matching outputs of the Spell run
+        :raises: AirflowException
+        """
+        # this return value gets pushed as XCom
+        return self.download_run_outputs(
+            str(self.spell_run_id),
+            self.destination,
+            patterns=self.patterns,
+            max_workers=self.max_workers,
+            verify_checksum=self.verify_checksum,
+        )
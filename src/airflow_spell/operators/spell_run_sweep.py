@@ -0,0 +1,314 @@
+from itertools import product
+from random import Random
+import re
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+from airflow import AirflowException
+
+from airflow_spell.hooks.spell_polling import SpellPollingPolicy
+from airflow_spell.operators.spell_run_batch import SpellRunBatchOperator
+
+
+def sweep_params(
+    grid: Dict[str, List[Any]],
+    samples: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    The parameter sets of a grid sweep, or of a random sweep of ``samples``
+    points of the grid
+
+    :param grid: parameter name to values mapping
+    :type grid: Dict[str, List[Any]]
+
+    :param samples: the number of grid points sampled, without replacement
+    :type samples: Optional[int]
+
+    :param seed: the random seed of the sample
+    :type seed: Optional[int]
+
+    :rtype: List[Dict[str, Any]]
+    """
+    names = sorted(grid)
+    points = [dict(zip(names, values)) for values in product(*(grid[n] for n in names))]
+    if samples is not None and samples < len(points):
+        points = Random(seed).sample(points, samples)
+    return points
+
+
+def sweep_run_spec(run_spec: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The run spec of one parameter set: ``{name}`` placeholders of its
+    parameter names in the ``command`` and the ``envvars`` values are
+    replaced with its values; other braces (e.g. ``${HOME}`` or JSON) are
+    left as they are
+
+    :rtype: Dict[str, Any]
+    :raises: AirflowException if the run spec has no command
+    """
+    if not run_spec.get("command"):
+        raise AirflowException("The sweep run_spec needs a command")
+    run_spec = dict(run_spec)
+    run_spec["command"] = _fill_params(run_spec["command"], params)
+    if run_spec.get("envvars"):
+        run_spec["envvars"] = {
+            name: _fill_params(str(value), params)
+            for name, value in run_spec["envvars"].items()
+        }
+    return run_spec
+
+
+def _fill_params(template: str, params: Dict[str, Any]) -> str:
+    if not params:
+        return template
+    placeholder = r"\{(%s)\}" % "|".join(re.escape(name) for name in params)
+    return re.sub(placeholder, lambda match: str(params[match.group(1)]), template)
+
+
+class SpellRunSweepOperator(SpellRunBatchOperator):
+    """
+    Run a hyperparameter sweep as a batch of Spell runs, monitored from a
+    single polling loop, stopping runs whose metric is clearly worse than the
+    best run so far
+
+    Args:
+        run_spec (dict): the run spec, with the same keyword arguments as
+            :class:`~airflow_spell.operators.spell_run.SpellRunOperator`; ``{name}`` placeholders of
+            the ``grid`` names in ``command`` and the ``envvars`` values are filled in from each
+            parameter set; other braces are left as they are.
+            For example: ``{"command": "python train.py --lr {lr}", "machine_type": "V100"}``
+        grid (:obj:`dict` of :obj:`str` -> :obj:`list`): parameter name to values mapping; every
+            combination is run
+        samples (int, optional): run this many combinations, sampled at random, instead of the whole
+            grid (default: None)
+        seed (int, optional): the random seed of ``samples`` (default: None)
+        metric (str, optional): the name of the Spell user metric the runs report, used to stop
+            runs early and pick the best run (default: None)
+        metric_pattern (str, optional): read the metric from the run log instead, as the first group
+            of this regular expression, e.g. ``r"val_loss=([0-9.eE+-]+)"`` (default: None)
+        mode (str, optional): ``min`` or ``max``, whether lower or higher metric values are better
+            (default: min)
+        early_stop_margin (float, optional): stop a run once, after as many metric values as the
+            other runs reported, its best value is worse than theirs by more than this fraction;
+            None disables early stopping (default: None)
+        early_stop_min_reports (int, optional): the metric values a run reports before it can be
+            stopped early (default: 3)
+        metric_interval (float, optional): seconds between metric reads of a running run; status
+            checks in between only read statuses (default: 60)
+        spell_conn_id (str): Airflow connection id for spell
+        spell_owner (str, optional): Spell owner (if different from user account)
+        max_submit_workers (int, optional): the number of runs submitted at the same time (default: 8)
+        fail_fast (bool, optional): stop the remaining runs and fail the task as soon as any run fails
+            (default: False)
+        batch_polling (bool, optional): share status requests with every other run watched in the
+            process (default: True)
+        polling_policy (SpellPollingPolicy, optional): decides the pause between status checks
+        task_id (str, optional):
+
+    The outcome of each run, with its ``params`` and last ``metric`` value, is
+    returned and pushed as XCom; the best completed run (``spell_run_id``,
+    ``params`` and ``metric``) is pushed as the ``best_run`` XCom, even when
+    some runs failed.
+    """
+
+    def __init__(
+        self,
+        *,
+        task_id: str,
+        run_spec: Dict[str, Any],
+        grid: Dict[str, List[Any]],
+        samples: Optional[int] = None,
+        seed: Optional[int] = None,
+        metric: Optional[str] = None,
+        metric_pattern: Optional[str] = None,
+        mode: str = "min",
+        early_stop_margin: Optional[float] = None,
+        early_stop_min_reports: int = 3,
+        metric_interval: float = 60.0,
+        spell_owner: Optional[str] = None,
+        spell_conn_id: Optional[str] = None,
+        max_submit_workers: int = 8,
+        fail_fast: bool = False,
+        batch_polling: bool = True,
+        polling_policy: Optional[SpellPollingPolicy] = None,
+        **kwargs,
+    ):
+        if mode not in ("min", "max"):
+            raise AirflowException(
+                "Unknown sweep mode (%s), expected min or max" % mode
+            )
+        if early_stop_margin is not None and not (metric or metric_pattern):
+            raise AirflowException("Early stopping needs a metric or metric_pattern")
+
+        self.sweep_params = sweep_params(grid, samples, seed)
+        super().__init__(
+            task_id=task_id,
+            runs=[sweep_run_spec(run_spec, params) for params in self.sweep_params],
+            spell_owner=spell_owner,
+            spell_conn_id=spell_conn_id,
+            max_submit_workers=max_submit_workers,
+            fail_fast=fail_fast,
+            batch_polling=batch_polling,
+            polling_policy=polling_policy,
+            **kwargs,
+        )
+        self.metric = metric
+        self.metric_pattern = re.compile(metric_pattern) if metric_pattern else None
+        self.mode = mode
+        self.early_stop_margin = early_stop_margin
+        self.early_stop_min_reports = early_stop_min_reports
+        self.metric_interval = metric_interval
+        # spell run ID -> the metric values read so far, the offset to read
+        # from and when they were last read (monotonic seconds)
+        self.metric_values: Dict[Any, List[float]] = {}
+        self._metric_offsets: Dict[Any, Any] = {}
+        self._metric_read_at: Dict[Any, float] = {}
+
+    def execute(self, context: Dict) -> List[Dict[str, Any]]:
+        """
+        Submit and monitor the sweep runs, then pick the best run
+        :raises: AirflowException
+        """
+        try:
+            return super().execute(context)
+        finally:
+            best_run = self.best_run()
+            if best_run is not None:
+                self.log.info("Best Spell run of the sweep: %s" % best_run)
+                ti = context.get("ti")
+                if ti is not None:
+                    ti.xcom_push(key="best_run", value=best_run)
+
+    def submit_runs(self, context: Dict) -> List[Dict[str, Any]]:
+        outcomes = super().submit_runs(context)
+        for outcome, params in zip(outcomes, self.sweep_params):
+            outcome["params"] = params
+            outcome["metric"] = None
+        return outcomes
+
+    def check_runs(self, running: List[Tuple[Dict[str, Any], Any]]):
+        """
+        Read the new metric values of the running runs not read for
+        ``metric_interval`` seconds and stop the runs that are clearly worse
+        than the best run so far, once
+        """
+        if not (self.metric or self.metric_pattern):
+            return
+        now = monotonic()
+        for outcome, _ in running:
+            read_at = self._metric_read_at.get(outcome["spell_run_id"])
+            if read_at is None or now - read_at >= self.metric_interval:
+                self._metric_read_at[outcome["spell_run_id"]] = now
+                self.read_metric(outcome)
+        if self.early_stop_margin is None:
+            return
+
+        for outcome, _ in running:
+            values = self.metric_values.get(outcome["spell_run_id"], [])
+            if outcome["stopped_early"] or len(values) < self.early_stop_min_reports:
+                continue
+            leader = self._leader(outcome["spell_run_id"], len(values))
+            if leader is not None and self._clearly_worse(self._best(values), leader):
+                self.log.info(
+                    "Stopping Spell run (%s) early: best %s %s after %d values,"
+                    " %s for the best run so far"
+                    % (
+                        outcome["spell_run_id"],
+                        self.metric or "metric",
+                        self._best(values),
+                        len(values),
+                        leader,
+                    )
+                )
+                outcome["stopped_early"] = True
+                self.stop_runs([outcome])
+
+    def read_metric(self, outcome: Dict[str, Any]):
+        """
+        Append the run's metric values reported since the last read, from the
+        Spell user metrics or the run log
+        """
+        spell_run_id = outcome["spell_run_id"]
+        values = self.metric_values.setdefault(spell_run_id, [])
+        offset = self._metric_offsets.get(spell_run_id)
+        try:
+            if self.metric_pattern is not None:
+                offset = offset or 0
+                entries = self.client.api.get_run_log_entries(
+                    spell_run_id, follow=False, offset=offset
+                )
+                try:
+                    for entry in entries:
+                        offset += 1
+                        match = self.metric_pattern.search(
+                            getattr(entry, "log", None) or ""
+                        )
+                        if match:
+                            values.append(float(match.group(1)))
+                finally:
+                    # releases the streamed response if reading stopped early
+                    entries.close()
+            else:
+                metrics = self.client.api.get_run_metrics(
+                    spell_run_id, self.metric, follow=False, offset=offset
+                )
+                try:
+                    for timestamp, _, value in metrics:
+                        offset = timestamp
+                        values.append(float(value))
+                finally:
+                    metrics.close()
+        except Exception as e:
+            self.log.warning(
+                "Spell run (%s) metric could not be read: %s" % (spell_run_id, e)
+            )
+        self._metric_offsets[spell_run_id] = offset
+        if values:
+            outcome["metric"] = values[-1]
+
+    def best_run(self) -> Optional[Dict[str, Any]]:
+        """
+        The completed run with the best last metric value, or the first
+        completed run without a metric
+
+        :rtype: Optional[Dict[str, Any]]
+        """
+        completed = [outcome for outcome in self.outcomes if outcome["succeeded"]]
+        if self.metric or self.metric_pattern:
+            for outcome in completed:
+                # values reported after the last check of the run
+                self.read_metric(outcome)
+            completed = [
+                outcome for outcome in completed if outcome["metric"] is not None
+            ]
+            completed.sort(
+                key=lambda outcome: outcome["metric"], reverse=self.mode == "max"
+            )
+        if not completed:
+            return None
+        return {
+            "spell_run_id": completed[0]["spell_run_id"],
+            "params": completed[0]["params"],
+            "metric": completed[0]["metric"],
+        }
+
+    def _leader(self, spell_run_id: Any, reports: int) -> Optional[float]:
+        """
+        The best value of the other runs over their first ``reports`` values
+        """
+        others = [
+            self._best(values[:reports])
+            for other_run_id, values in self.metric_values.items()
+            if other_run_id != spell_run_id and len(values) >= reports
+        ]
+        return self._best(others) if others else None
+
+    def _best(self, values: List[float]) -> float:
+        return min(values) if self.mode == "min" else max(values)
+
+    def _clearly_worse(self, value: float, leader: float) -> bool:
+        margin = self.early_stop_margin * abs(leader)
+        if self.mode == "min":
+            return value > leader + margin
+        return value < leader - margin
@@ -0,0 +1,304 @@
+import asyncio
+from time import monotonic, time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from airflow.exceptions import AirflowException
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+from airflow_spell.hooks import spell_metrics
+from airflow_spell.hooks.spell_admission import SpellAdmissionController
+from airflow_spell.hooks.spell_client import SpellClient, SpellRunStatus
+from airflow_spell.hooks.spell_polling import ExponentialPollingPolicy, run_elapsed
+
+
+class SpellRunTrigger(BaseTrigger):
+    """
+    Poll a Spell run from the triggerer until it reaches a final status.
+
+    The spell SDK is synchronous, so every status request is handed to the
+    event loop's default executor; between requests the trigger only awaits
+    ``asyncio.sleep``, which lets a single triggerer watch thousands of runs.
+    Transient API errors are retried behind the connection's circuit breaker,
+    shared with every other status check in the triggerer.
+
+    A run exceeding ``timeout`` or one of ``status_timeouts`` is stopped, as
+    is the run of a task that stops being deferred while its trigger runs
+    (e.g. the task was marked failed or timed out).
+
+    :param run_id: a spell run ID
+    :type run_id: str
+
+    :param spell_conn_id: Airflow connection id for spell
+    :type spell_conn_id: Optional[str]
+
+    :param spell_owner: Spell owner (if different from user account)
+    :type spell_owner: Optional[str]
+
+    :param poll_interval: seconds between status requests
+    :type poll_interval: float
+
+    :param batch_polling: share status requests with every other trigger for
+        the same connection through one ``SpellRunStatusPoller``
+    :type batch_polling: bool
+
+    :param stream_logs: write the run's new log lines to the trigger log at
+        every status check
+    :type stream_logs: bool
+
+    :param max_log_bytes: the run log output written per status check
+    :type max_log_bytes: int
+
+    :param log_offset: the first run log line to stream
+    :type log_offset: int
+
+    :param abort_patterns: regular expressions matched against every run log
+        line; the run is stopped on the first match
+    :type abort_patterns: Optional[List[str]]
+
+    :param wait_for_webhooks: check the status as soon as a run notification
+        is received by a :class:`~airflow_spell.hooks.spell_webhooks.SpellWebhookReceiver`
+        on this host; ``poll_interval`` is then only a fallback
+    :type wait_for_webhooks: bool
+
+    :param admission_ticket: the admission slot held by the run (see
+        :class:`~airflow_spell.hooks.spell_admission.SpellAdmissionController`),
+        renewed at every status check and released once the run ends
+    :type admission_ticket: Optional[str]
+
+    :param machine_type: the spell machine type of the run's admission slot
+    :type machine_type: Optional[str]
+
+    :param timeout: seconds since the run was created after which it is
+        stopped; ``None`` for no wall-clock limit
+    :type timeout: Optional[float]
+
+    :param status_timeouts: the longest the run may stay in a status, in
+        seconds (see :class:`~airflow_spell.hooks.spell_polling.SpellPollingPolicy`)
+    :type status_timeouts: Optional[Dict[str, float]]
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        spell_conn_id: Optional[str] = None,
+        spell_owner: Optional[str] = None,
+        poll_interval: float = 30.0,
+        batch_polling: bool = False,
+        stream_logs: bool = False,
+        max_log_bytes: int = SpellClient.DEFAULT_MAX_LOG_BYTES,
+        log_offset: int = 0,
+        abort_patterns: Optional[List[str]] = None,
+        wait_for_webhooks: bool = False,
+        admission_ticket: Optional[str] = None,
+        machine_type: Optional[str] = None,
+        timeout: Optional[float] = None,
+        status_timeouts: Optional[Dict[str, float]] = None,
+    ):
+        super().__init__()
+        self.run_id = run_id
+        self.spell_conn_id = spell_conn_id
+        self.spell_owner = spell_owner
+        self.poll_interval = poll_interval
+        self.batch_polling = batch_polling
+        self.stream_logs = stream_logs
+        self.max_log_bytes = max_log_bytes
+        self.log_offset = log_offset
+        self.abort_patterns = abort_patterns
+        self.wait_for_webhooks = wait_for_webhooks
+        self.admission_ticket = admission_ticket
+        self.machine_type = machine_type
+        self.timeout = timeout
+        self.status_timeouts = status_timeouts
+
+    def serialize(self) -> Tuple[str, Dict[str, Any]]:
+        return (
+            "airflow_spell.triggers.spell_run.SpellRunTrigger",
+            {
+                "run_id": self.run_id,
+                "spell_conn_id": self.spell_conn_id,
+                "spell_owner": self.spell_owner,
+                "poll_interval": self.poll_interval,
+                "batch_polling": self.batch_polling,
+                "stream_logs": self.stream_logs,
+                "max_log_bytes": self.max_log_bytes,
+                "log_offset": self.log_offset,
+                "abort_patterns": self.abort_patterns,
+                "wait_for_webhooks": self.wait_for_webhooks,
+                "admission_ticket": self.admission_ticket,
+                "machine_type": self.machine_type,
+                "timeout": self.timeout,
+                "status_timeouts": self.status_timeouts,
+            },
+        )
+
+    async def run(self) -> AsyncIterator[TriggerEvent]:
+        client = SpellClient(
+            spell_conn_id=self.spell_conn_id,
+            spell_owner=self.spell_owner,
+            batch_polling=self.batch_polling,
+            # only its limits apply: the trigger pauses poll_interval seconds
+            polling_policy=ExponentialPollingPolicy(
+                timeout=self.timeout, status_timeouts=self.status_timeouts
+            ),
+            stream_logs=self.stream_logs,
+            max_log_bytes=self.max_log_bytes,
+            abort_patterns=self.abort_patterns,
+            wait_for_webhooks=self.wait_for_webhooks,
+        )
+        client.log_offset = self.log_offset
+        loop = asyncio.get_event_loop()
+        admission = None
+        if self.admission_ticket is not None:
+            # the slot store is local to a host: the slot moves to the
+            # triggerer's host while the run is deferred
+            admission = await loop.run_in_executor(
+                None, client.hook.get_admission_controller
+            )
+
+        try:
+            payload = await self._watch_run(client, admission)
+        except asyncio.CancelledError:
+            # also cancelled when the triggerer stops, handing the trigger
+            # over to another triggerer while the task is still deferred
+            if not await loop.run_in_executor(None, self._task_deferred):
+                await loop.run_in_executor(
+                    None,
+                    client.stop_run,
+                    self.run_id,
+                    "the Airflow task is no longer deferred",
+                )
+            raise
+        finally:
+            if admission is not None:
+                await loop.run_in_executor(
+                    None, admission.release, self.admission_ticket
+                )
+        yield TriggerEvent(payload)
+
+    async def _watch_run(
+        self, client: SpellClient, admission: Optional[SpellAdmissionController]
+    ) -> Dict[str, Any]:
+        """
+        Check the run until it reaches a final status
+
+        :return: the payload of the trigger event
+        :rtype: Dict[str, Any]
+        """
+        loop = asyncio.get_event_loop()
+        policy = client.polling_policy
+        started_at = monotonic()
+        # epoch seconds of the last status change or new log line
+        progress_at = 0.0
+
+        while True:
+            checked_at = time()
+            try:
+                run = await client._async_check_run(self.run_id)
+                run_status = run.status
+                if (
+                    not client.status_timeline
+                    or client.status_timeline[-1][0] != run_status
+                ):
+                    # (status, epoch seconds) of each change, for the run profile
+                    client.status_timeline.append((run_status, time()))
+                    progress_at = time()
+                if admission is not None:
+                    await loop.run_in_executor(
+                        None, admission.renew, self.admission_ticket, self.machine_type
+                    )
+                if client.reads_logs:
+                    log_offset = client.log_offset
+                    await loop.run_in_executor(
+                        None, client._stream_run_logs, self.run_id
+                    )
+                    if client.log_offset != log_offset:
+                        progress_at = time()
+                if client.abort_match is not None:
+                    reason = (
+                        "log line matched abort pattern (%s): %s" % client.abort_match
+                    )
+                    await loop.run_in_executor(
+                        None, client.stop_run, self.run_id, reason
+                    )
+                    raise AirflowException(
+                        "Spell run (%s) cancelled: %s" % (self.run_id, reason)
+                    )
+            except Exception as e:
+                return {
+                    "status": "error",
+                    "spell_run_id": self.run_id,
+                    "message": str(e),
+                    "log_offset": client.log_offset,
+                }
+
+            if run_status in SpellRunStatus.FINAL:
+                return {
+                    "status": "success",
+                    "spell_run_id": self.run_id,
+                    "run_status": run_status,
+                    "log_offset": client.log_offset,
+                    "status_timeline": client.status_timeline,
+                }
+
+            elapsed = run_elapsed(run, monotonic() - started_at)
+            status_elapsed = time() - progress_at
+            reason = policy.limit_exceeded(run_status, status_elapsed, elapsed)
+            if reason is not None:
+                await loop.run_in_executor(None, client.stop_run, self.run_id, reason)
+                return {
+                    "status": "error",
+                    "spell_run_id": self.run_id,
+                    "message": "Spell run (%s) cancelled: %s" % (self.run_id, reason),
+                    "log_offset": client.log_offset,
+                }
+
+            pause = self.poll_interval
+            time_to_limit = policy.time_to_limit(run_status, status_elapsed, elapsed)
+            if time_to_limit is not None:
+                # check again as the limit runs out rather than long after
+                pause = min(pause, max(1.0, time_to_limit))
+
+            self.log.info(
+                "Spell run (%s) current status (%s), next check in %.2f seconds"
+                % (self.run_id, run_status, pause)
+            )
+            if not self.wait_for_webhooks:
+                await asyncio.sleep(pause)
+                continue
+            status = await client.run_events.async_wait(
+                self.run_id, pause, since=checked_at
+            )
+            if status is not None:
+                spell_metrics.incr("webhook.wake", client.stats_tags)
+                self.log.info(
+                    "Spell run (%s) notification (%s), checking status now"
+                    % (self.run_id, status)
+                )
+
+    def _task_deferred(self) -> bool:
+        """
+        Whether the task instance of the trigger is still deferred, i.e. its
+        run is still awaited
+
+        :rtype: bool
+        """
+        ti = getattr(self, "task_instance", None)
+        if ti is None:
+            return False
+        from airflow.models.taskinstance import TaskInstance
+        from airflow.utils.session import create_session
+        from airflow.utils.state import State
+
+        filters = {"dag_id": ti.dag_id, "task_id": ti.task_id, "run_id": ti.run_id}
+        if hasattr(ti, "map_index"):
+            filters["map_index"] = ti.map_index
+        try:
+            with create_session() as session:
+                state = session.query(TaskInstance.state).filter_by(**filters).scalar()
+        except Exception as e:
+            self.log.warning(
+                "Spell run (%s) task state could not be read: %s" % (self.run_id, e)
+            )
+            # leave the run alone: another triggerer may be watching it
+            return True
+        return state == State.DEFERRED
@@ -0,0 +1,93 @@
+import json
+from unittest.mock import MagicMock
+
+from precisely import assert_that, equal_to
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell.cli import bulk_submit
+from airflow_spell.hooks.spell_client import SpellClient
+
+
+@pytest.fixture
+def manifest(tmp_path) -> str:
+    path = tmp_path / "runs.jsonl"
+    path.write_text(
+        "\n".join(json.dumps({"command": "score %d" % index}) for index in range(5))
+    )
+    return str(path)
+
+
+@pytest.fixture
+def spell_api(monkeypatch) -> MagicMock:
+    client = MagicMock()
+    client.runs.new.side_effect = lambda command: MagicMock(id=command.split()[-1])
+    monkeypatch.setattr(SpellClient, "client", client)
+    monkeypatch.setattr(
+        SpellClient,
+        "_check_run",
+        lambda _, run_id: MagicMock(status=RunsService.COMPLETE, user_exit_code=0),
+    )
+    return client
+
+
+def test_runs_are_submitted_and_monitored(capsys, manifest, spell_api):
+    bulk_submit.main([manifest, "--workers", "2", "--poll-interval", "0"])
+
+    assert_that(spell_api.runs.new.call_count, equal_to(5))
+    progress = bulk_submit.load_checkpoint(manifest + ".checkpoint")
+    assert_that(
+        [progress[index]["status"] for index in range(5)],
+        equal_to([RunsService.COMPLETE] * 5),
+    )
+    assert_that("5 of 5 runs succeeded" in capsys.readouterr().out, equal_to(True))
+
+
+def test_interrupted_job_resumes_without_resubmitting(manifest, spell_api):
+    with open(manifest + ".checkpoint", "w") as f:
+        checkpoint = bulk_submit.Checkpoint(f)
+        for index in range(3):
+            spec = {"command": "score %d" % index}
+            checkpoint.record(
+                index, spell_run_id=str(index), spec_hash=bulk_submit.spec_hash(spec)
+            )
+        f.write('{"index": 3, "spell_run')
+
+    bulk_submit.main([manifest, "--poll-interval", "0"])
+
+    assert_that(
+        sorted(call.kwargs["command"] for call in spell_api.runs.new.call_args_list),
+        equal_to(["score 3", "score 4"]),
+    )
+
+
+def test_failed_status_check_is_recorded_and_other_runs_continue(
+    capsys, monkeypatch, manifest, spell_api
+):
+    def mock_check_run(_, run_id):
+        if run_id == "2":
+            raise RuntimeError("run not found")
+        return MagicMock(status=RunsService.COMPLETE, user_exit_code=0)
+
+    monkeypatch.setattr(SpellClient, "_check_run", mock_check_run)
+
+    with pytest.raises(SystemExit):
+        bulk_submit.main([manifest, "--poll-interval", "0"])
+
+    progress = bulk_submit.load_checkpoint(manifest + ".checkpoint")
+    assert_that(
+        [progress[index]["status"] for index in range(5)],
+        equal_to(
+            [RunsService.COMPLETE] * 2 + ["check_failed"] + [RunsService.COMPLETE] * 2
+        ),
+    )
+    assert_that(progress[2]["error"], equal_to("run not found"))
+    assert_that("4 of 5 runs succeeded" in capsys.readouterr().out, equal_to(True))
+
+
+def test_no_wait_prints_only_the_submissions(capsys, manifest, spell_api):
+    bulk_submit.main([manifest, "--no-wait"])
+
+    out = capsys.readouterr().out
+    assert_that(out.startswith("Submitted 5 runs"), equal_to(True))
+    assert_that("succeeded" in out, equal_to(False))
@@ -0,0 +1,49 @@
+from precisely import assert_that, equal_to
+import pytest
+
+from airflow_spell.hooks.spell_admission import SpellAdmissionController
+
+
+@pytest.fixture
+def admission(tmp_path) -> SpellAdmissionController:
+    return SpellAdmissionController(
+        key="spell_default",
+        quotas={"GPU-V100": 2},
+        path=str(tmp_path / "admission.db"),
+        poll_interval=0.01,
+    )
+
+
+def test_runs_within_quota_are_admitted(admission):
+    assert_that(admission._try_acquire("a", "GPU-V100", 1, 0), equal_to(True))
+    assert_that(admission._try_acquire("b", "GPU-V100", 1, 1), equal_to(True))
+    assert_that(admission._try_acquire("c", "GPU-V100", 1, 2), equal_to(False))
+
+    admission.release("a")
+
+    assert_that(admission._try_acquire("c", "GPU-V100", 1, 2), equal_to(True))
+
+
+def test_machine_types_without_quota_are_not_queued(admission):
+    for ticket in "abc":
+        assert_that(admission.acquire(ticket, "CPU"), equal_to(0.0))
+
+
+def test_higher_priority_runs_are_admitted_first(admission):
+    admission._try_acquire("a", "GPU-V100", 1, 0)
+    admission._try_acquire("b", "GPU-V100", 1, 1)
+    admission._try_acquire("low", "GPU-V100", 1, 2)
+    admission._try_acquire("high", "GPU-V100", 10, 3)
+
+    admission.release("a")
+
+    assert_that(admission._try_acquire("low", "GPU-V100", 1, 2), equal_to(False))
+    assert_that(admission._try_acquire("high", "GPU-V100", 10, 3), equal_to(True))
+
+
+def test_expired_slots_are_reclaimed(admission):
+    admission.lease_timeout = -1
+    admission._try_acquire("a", "GPU-V100", 1, 0)
+    admission._try_acquire("b", "GPU-V100", 1, 1)
+
+    assert_that(admission._try_acquire("c", "GPU-V100", 1, 2), equal_to(True))
@@ -1,15 +1,37 @@
 import inspect
+import json
+import subprocess
+import sys
+from threading import Event, Thread
 from timeit import default_timer
+from types import SimpleNamespace
 from typing import Callable
 from unittest.mock import MagicMock, PropertyMock, patch
 
 from airflow.exceptions import AirflowException
-from precisely import assert_that, has_attr, is_instance, less_than, raises
+from airflow.models import Connection
+from precisely import (
+    assert_that,
+    equal_to,
+    has_attr,
+    is_instance,
+    less_than,
+    not_,
+    raises,
+)
 import pytest
+import requests
+from spell.api.exceptions import ClientException
+from spell.cli.commands.ps import status_names
 from spell.client.runs import RunsService
 
 from airflow_spell import SpellClient
-from airflow_spell.hooks.spell_client import _delay
+from airflow_spell.hooks.spell_client import (
+    SpellHook,
+    SpellRunStatus,
+    SpellRunStatusPoller,
+    _delay,
+)
 
 
 def test_client_can_be_created():
@@ -17,6 +39,41 @@ def test_client_can_be_created():
     assert_that(client, has_attr("spell_conn_id", "testing-spell-client"))
 
 
+def test_run_statuses_match_spell_sdk():
+    for name in ["BUILDING", "RUNNING", "SAVING", "PUSHING", "COMPLETE", "FAILED"]:
+        assert_that(getattr(SpellRunStatus, name), equal_to(getattr(RunsService, name)))
+    assert_that(set(SpellRunStatus.FINAL), equal_to(set(RunsService.FINAL)))
+    assert_that(set(SpellRunStatus.QUEUED), equal_to(set(status_names.keys())))
+
+
+# importing the spell SDK takes most of a second, which every DAG file parse
+# importing airflow_spell would pay
+IMPORT_SPELL_MODULES = """
+import sys
+from time import perf_counter
+import airflow.models
+started_at = perf_counter()
+import airflow_spell
+import airflow_spell.operators.spell_run
+import airflow_spell.triggers.spell_run
+elapsed = perf_counter() - started_at
+spell = [name for name in sys.modules if name.split(".")[0] == "spell"]
+print("%f %s" % (elapsed, ",".join(spell)))
+"""
+
+
+def test_importing_operators_does_not_import_spell_sdk():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SPELL_MODULES],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.split()
+
+    assert_that(output[1:], equal_to([]))
+    assert_that(float(output[0]), less_than(2))
+
+
 def test_delay_delays_for_duration_within_bounds():
     start = default_timer()
     for _ in range(10):
@@ -140,3 +197,397 @@ class TestWaitForRun:
             # Act - if this process completes, we don't see an exception
             # (it waits and then exits)
             spell_client.wait_for_run(run_id="test1", delay=0)
+
+    def test_jobs_complete_before_first_check_end(self, monkeypatch, spell_client):
+        # Catch issue where jobs that are already COMPLETE at the first status
+        # check never match a "running" status
+        monkeypatch.setattr(
+            SpellClient, "_get_run", mock_get_run(status=RunsService.COMPLETE)
+        )
+
+        spell_client.wait_for_run(run_id="test1", delay=0)
+
+
+def api_run(run_id, status=RunsService.RUNNING):
+    return SimpleNamespace(id=run_id, status=status, workspace=None, labels=None)
+
+
+@pytest.fixture
+def status_poller() -> SpellRunStatusPoller:
+    poller = SpellRunStatusPoller(hook=MagicMock(), interval=60)
+    poller.client.api.list_runs.side_effect = lambda number: [
+        api_run(run_id) for run_id in range(200, 200 - number, -1)
+    ]
+    poller.client.api.get_run.side_effect = api_run
+    return poller
+
+
+class TestRunStatusPoller:
+    def test_stale_statuses_refresh_with_one_listing(self, status_poller):
+        run_ids = [str(run_id) for run_id in range(151, 201)]
+        for run_id in run_ids:
+            status_poller.get_run(run_id)
+        get_run_calls = status_poller.client.api.get_run.call_count
+
+        status_poller._refreshed_at -= status_poller.interval
+        runs = [status_poller.get_run(run_id) for run_id in run_ids]
+
+        assert_that(status_poller.client.api.list_runs.call_count, equal_to(2))
+        assert_that(
+            status_poller.client.api.get_run.call_count, equal_to(get_run_calls)
+        )
+        assert_that([run.id for run in runs], equal_to(list(range(151, 201))))
+
+    def test_runs_outside_the_listing_grow_the_page_size(self, status_poller):
+        status_poller.get_run("50")
+
+        assert_that(status_poller.get_run("50").status, equal_to(RunsService.RUNNING))
+        assert_that(status_poller.client.api.get_run.call_count, equal_to(1))
+        assert_that(status_poller.page_size, equal_to(151))
+
+    def test_slow_listing_does_not_block_watched_runs(self, status_poller):
+        status_poller.get_run("199")
+        listing = Event()
+        release = Event()
+        list_runs = status_poller.client.api.list_runs.side_effect
+
+        def slow_list_runs(number):
+            listing.set()
+            release.wait(5)
+            return list_runs(number)
+
+        status_poller.client.api.list_runs.side_effect = slow_list_runs
+        status_poller._refreshed_at -= status_poller.interval
+        refresher = Thread(target=status_poller.get_run, args=("199",))
+        refresher.start()
+        listing.wait(5)
+
+        start = default_timer()
+        assert_that(status_poller.get_run("199").id, equal_to(199))
+        assert_that(default_timer() - start, less_than(1))
+        release.set()
+        refresher.join()
+
+    def test_client_with_batch_polling_reads_the_shared_poller(
+        self, monkeypatch, status_poller
+    ):
+        client = SpellClient(spell_conn_id="testing-batch-polling", batch_polling=True)
+        monkeypatch.setitem(
+            SpellRunStatusPoller._pollers,
+            ("testing-batch-polling", None),
+            status_poller,
+        )
+
+        assert_that(client._get_run("199").id, equal_to(199))
+        assert_that(status_poller.client.api.list_runs.call_count, equal_to(1))
+
+
+class TestClientCache:
+    @pytest.fixture
+    def connections(self, monkeypatch):
+        connections = {"token": "token-1", "reads": 0}
+
+        def get_connection(conn_id):
+            connections["reads"] += 1
+            connections["locked"] = SpellHook._clients_lock.locked()
+            return Connection(
+                conn_id=conn_id,
+                host="owner",
+                password=connections["token"],
+                extra=json.dumps({"client_ttl": 60}),
+            )
+
+        clock = [1000.0]
+        monkeypatch.setattr(SpellHook, "_clients", {})
+        monkeypatch.setattr(SpellHook, "get_connection", staticmethod(get_connection))
+        monkeypatch.setattr(
+            "airflow_spell.hooks.spell_client.monotonic", lambda: clock[0]
+        )
+        connections["clock"] = clock
+        return connections
+
+    def test_hooks_share_a_client_per_connection(self, connections):
+        client = SpellHook("spell_cache").get_client()
+
+        assert_that(SpellHook("spell_cache").get_client(), equal_to(client))
+        assert_that(
+            SpellHook("spell_cache", owner="other").get_client(), not_(equal_to(client))
+        )
+        assert_that(client.api.owner, equal_to("owner"))
+        assert_that(connections["reads"], equal_to(2))
+
+    def test_expired_client_is_kept_while_the_connection_is_unchanged(
+        self, connections
+    ):
+        client = SpellHook("spell_cache").get_client()
+        connections["clock"][0] += 61
+
+        assert_that(SpellHook("spell_cache").get_client(), equal_to(client))
+        assert_that(connections["reads"], equal_to(2))
+
+    def test_changed_token_rebuilds_the_client(self, connections):
+        client = SpellHook("spell_cache").get_client()
+        connections["token"] = "token-2"
+        connections["clock"][0] += 61
+
+        rebuilt = SpellHook("spell_cache").get_client()
+
+        assert_that(rebuilt, not_(equal_to(client)))
+        assert_that(rebuilt.api.token, equal_to("token-2"))
+
+    def test_auth_error_drops_the_cached_client(self, connections):
+        client = SpellHook("spell_cache").get_client()
+        client.api.session.request = MagicMock(
+            return_value=SimpleNamespace(status_code=401)
+        )
+        client.api.request("get", "runs/owner/1")
+        connections["token"] = "token-2"
+
+        assert_that(SpellHook("spell_cache").get_client(), not_(equal_to(client)))
+
+    def test_connection_error_drops_the_cached_client(self, connections):
+        client = SpellHook("spell_cache").get_client()
+        client.api.session.request = MagicMock(
+            side_effect=requests.ConnectionError("connection refused")
+        )
+        with pytest.raises(ClientException):
+            client.api.request("get", "runs/owner/1")
+        connections["token"] = "token-2"
+
+        assert_that(SpellHook("spell_cache").get_client(), not_(equal_to(client)))
+
+    def test_changed_environment_connection_rebuilds_the_client(
+        self, monkeypatch, connections
+    ):
+        monkeypatch.setenv("AIRFLOW_CONN_SPELL_CACHE", "spell://owner:token-1@")
+        client = SpellHook("spell_cache").get_client()
+        monkeypatch.setenv("AIRFLOW_CONN_SPELL_CACHE", "spell://owner:token-2@")
+        connections["token"] = "token-2"
+
+        rebuilt = SpellHook("spell_cache").get_client()
+
+        assert_that(rebuilt, not_(equal_to(client)))
+        assert_that(rebuilt.api.token, equal_to("token-2"))
+
+    def test_connection_is_read_without_the_lock(self, monkeypatch, connections):
+        monkeypatch.setattr(
+            SpellHook,
+            "_build_client",
+            lambda *_: MagicMock(locked=SpellHook._clients_lock.locked()),
+        )
+
+        client = SpellHook("spell_cache").get_client()
+
+        assert_that(connections["locked"], equal_to(False))
+        assert_that(client.locked, equal_to(False))
+
+    def test_concurrent_refresh_keeps_one_client(self, monkeypatch, connections):
+        hook = SpellHook("spell_cache")
+        client = SpellHook("spell_cache").get_client()
+        connections["clock"][0] += 61
+        connections["token"] = "token-2"
+        get_connection = SpellHook.get_connection
+
+        def refresh_meanwhile(conn_id):
+            connection = get_connection(conn_id)
+            monkeypatch.setattr(
+                SpellHook, "get_connection", staticmethod(get_connection)
+            )
+            refreshed.append(SpellHook("spell_cache").get_client())
+            return connection
+
+        refreshed = []
+        monkeypatch.setattr(
+            SpellHook, "get_connection", staticmethod(refresh_meanwhile)
+        )
+
+        assert_that(hook.get_client(), equal_to(refreshed[0]))
+        assert_that(refreshed[0], not_(equal_to(client)))
+
+
+def mock_log_entries(lines):
+    def mock_func(run_id, follow, offset):
+        for line in lines[offset:]:
+            yield SimpleNamespace(log=line)
+
+    return mock_func
+
+
+class TestStreamRunLogs:
+    def test_new_lines_are_streamed_from_offset(self, spell_client):
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["one", "two", "three"]
+        )
+
+        offset = spell_client.stream_run_logs("test1", offset=1, max_bytes=1024)
+
+        assert_that(offset, equal_to(3))
+        spell_client._client.api.get_run_log_entries.assert_called_once_with(
+            "test1", follow=False, offset=1
+        )
+
+    def test_log_output_is_capped_per_check(self, spell_client):
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["x" * 10] * 100
+        )
+
+        offset = spell_client.stream_run_logs("test1", offset=0, max_bytes=25)
+
+        assert_that(offset, equal_to(3))
+
+    def test_unwritten_log_lines_are_read_to_the_end(self, spell_client):
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["x" * 10] * 100
+        )
+
+        offset = spell_client.stream_run_logs(
+            "test1", offset=0, max_bytes=25, write=False
+        )
+
+        assert_that(offset, equal_to(100))
+
+    def test_capped_log_keeps_the_polling_pause(self, monkeypatch):
+        statuses = iter([RunsService.RUNNING, RunsService.COMPLETE])
+        monkeypatch.setattr(
+            SpellClient, "_get_run", lambda _, __: MagicMock(status=next(statuses))
+        )
+        pauses = []
+        monkeypatch.setattr(
+            SpellClient, "_pause", lambda _, __, pause, ___: pauses.append(pause) or 0
+        )
+        spell_client = SpellClient(stream_logs=True, max_log_bytes=25)
+        spell_client.polling_policy.next_delay = lambda *_: 600.0
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["x" * 10] * 100
+        )
+
+        spell_client._poll_run_status("test1", RunsService.FINAL)
+
+        assert_that(pauses, equal_to([600.0]))
+
+    def test_streamed_offset_is_saved(self, spell_client):
+        saved = []
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["one", "two"]
+        )
+        spell_client.log_offset_callback = saved.append
+
+        spell_client._stream_run_logs("test1")
+        spell_client._stream_run_logs("test1")
+
+        assert_that(saved, equal_to([2]))
+
+
+class TestAbortPatterns:
+    def test_matching_log_line_stops_the_run(self, monkeypatch):
+        spell_client = SpellClient(abort_patterns=SpellClient.COMMON_ABORT_PATTERNS)
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["epoch 1", "RuntimeError: CUDA out of memory. Tried to allocate 2 GiB"]
+        )
+        monkeypatch.setattr(SpellClient, "_get_run", mock_get_run(RunsService.RUNNING))
+
+        assert_that(
+            lambda: spell_client._poll_run_status("test1", RunsService.FINAL),
+            raises(is_instance(AirflowException)),
+        )
+        spell_client._client.api.stop_run.assert_called_once_with("test1")
+        assert_that(spell_client.abort_match[0], equal_to("CUDA out of memory"))
+
+    def test_lines_without_a_match_do_not_stop_the_run(self):
+        spell_client = SpellClient(abort_patterns=[r"\bloss\b.*\bnan\b"])
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["loss: 0.25", "nan values dropped"]
+        )
+
+        spell_client.stream_run_logs("test1", offset=0, max_bytes=1024, write=False)
+
+        assert_that(spell_client.abort_match, equal_to(None))
+
+    def test_lines_past_the_log_cap_are_matched(self):
+        spell_client = SpellClient(abort_patterns=SpellClient.COMMON_ABORT_PATTERNS)
+        spell_client._client = MagicMock()
+        spell_client._client.api.get_run_log_entries.side_effect = mock_log_entries(
+            ["x" * 10] * 100 + ["RuntimeError: CUDA out of memory."]
+        )
+
+        offset = spell_client.stream_run_logs("test1", offset=0, max_bytes=25)
+
+        assert_that(offset, equal_to(3))
+        assert_that(spell_client.abort_match[0], equal_to("CUDA out of memory"))
+
+
+def api_response(status_code, etag=None):
+    return MagicMock(status_code=status_code, headers={"ETag": etag} if etag else {})
+
+
+class TestRunProbes:
+    @pytest.fixture
+    def probed_client(self, monkeypatch, spell_client) -> SpellClient:
+        monkeypatch.setattr(
+            "airflow_spell.hooks.spell_client._external_run", lambda _, run: run
+        )
+        spell_client._client = MagicMock()
+        spell_client._client.api.owner = "owner"
+        spell_client._client.api.get_json.side_effect = lambda _: {
+            "run": MagicMock(status=RunsService.RUNNING)
+        }
+        return spell_client
+
+    def test_unchanged_run_is_not_downloaded_again(self, probed_client):
+        api = probed_client._client.api
+        api.request.side_effect = [api_response(200, '"v1"'), api_response(304)]
+
+        first = probed_client._get_run("42")
+        second = probed_client._get_run("42")
+
+        assert_that(second, equal_to(first))
+        assert_that(api.get_json.call_count, equal_to(1))
+        api.request.assert_called_with(
+            "get", "runs/owner/42", headers={"If-None-Match": '"v1"'}
+        )
+
+    def test_completeness_check_reuses_the_final_run(self, probed_client):
+        api = probed_client._client.api
+        api.request.return_value = api_response(200)
+        api.get_json.side_effect = lambda _: {
+            "run": MagicMock(status=RunsService.COMPLETE, user_exit_code=0)
+        }
+
+        probed_client._poll_run_status("42", RunsService.FINAL)
+
+        assert_that(probed_client.check_run_complete("42"), equal_to(True))
+        assert_that(api.request.call_count, equal_to(1))
+
+    def test_failed_probe_keeps_the_cached_run(self, probed_client):
+        api = probed_client._client.api
+        api.request.side_effect = [
+            api_response(200, '"v1"'),
+            RuntimeError("connection reset"),
+            api_response(304),
+        ]
+
+        first = probed_client._get_run("42")
+        with pytest.raises(RuntimeError):
+            probed_client._get_run("42")
+        third = probed_client._get_run("42")
+
+        assert_that(third, equal_to(first))
+        assert_that(api.get_json.call_count, equal_to(1))
+
+    def test_least_recently_used_run_is_dropped(self, monkeypatch, probed_client):
+        monkeypatch.setattr(SpellClient, "RUN_CACHE_SIZE", 2)
+        probed_client._client.api.request.return_value = api_response(200)
+        probed_client._get_run("1")
+        probed_client._get_run("2")
+
+        probed_client._get_recent_run("1")
+        probed_client._get_run("3")
+
+        assert_that(list(probed_client._run_documents), equal_to(["1", "3"]))
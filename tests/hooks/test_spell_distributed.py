@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from airflow.exceptions import AirflowException
+from precisely import (
+    assert_that,
+    equal_to,
+    is_instance,
+    less_than,
+    mapping_includes,
+    raises,
+)
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks.spell_distributed import SpellDistributedRunMonitor
+
+
+@pytest.mark.parametrize(
+    "lines, failed_nodes",
+    [
+        (["[1,0]<stdout>:epoch 1", "[1,1]<stdout>:epoch 1"], []),
+        (["[1,0]<stdout>:epoch 1", "Process 1 exit with status code 1."], [1]),
+        (
+            [
+                "mpirun noticed that process rank 3 with PID 0 on node worker-1"
+                " exited on signal 9 (Killed)."
+            ],
+            [3],
+        ),
+        (
+            [
+                "  Process name: [[52614,1],2]",
+                "  Exit code:    2",
+            ],
+            [2],
+        ),
+        (["Process 0 exit with status code 0."], []),
+    ],
+)
+def test_failed_ranks_are_read_from_the_run_log(lines, failed_nodes):
+    monitor = SpellDistributedRunMonitor(ranks=4)
+    for line in lines:
+        monitor.observe(line, at=100.0)
+
+    assert_that(monitor.failed_nodes(), equal_to(failed_nodes))
+
+
+def test_rank_output_is_summarized():
+    monitor = SpellDistributedRunMonitor()
+    monitor.observe("[0]<stdout>:step 1", at=100.0)
+    monitor.observe("[0]<stderr>:step 2", at=160.0)
+    monitor.observe("Process 0 exit with status code 137.", at=170.0)
+
+    assert_that(
+        monitor.summary()["0"],
+        mapping_includes(
+            {
+                "first_output_at": 100.0,
+                "last_output_at": 160.0,
+                "lines": 2,
+                "exit_code": 137,
+                "exited_at": 170.0,
+            }
+        ),
+    )
+
+
+def test_run_is_stopped_when_a_rank_fails(monkeypatch):
+    client = SpellClient()
+    client.distributed_monitor = SpellDistributedRunMonitor(ranks=2)
+    client._client = MagicMock()
+    client._client.api.get_run_log_entries.side_effect = lambda *_, **__: (
+        SimpleNamespace(log=line)
+        for line in ["[1,0]<stdout>:epoch 1", "Process 1 exit with status code 1."]
+    )
+    monkeypatch.setattr(
+        SpellClient,
+        "_get_run",
+        lambda _, __: SimpleNamespace(status=RunsService.RUNNING, user_exit_code=None),
+    )
+
+    assert_that(
+        lambda: client._poll_run_status("test1", RunsService.FINAL),
+        raises(is_instance(AirflowException)),
+    )
+    client._client.api.stop_run.assert_called_once_with("test1")
+
+
+def test_rank_failures_past_the_log_cap_are_seen_at_once():
+    lines = ["[1,0]<stdout>:epoch %d" % epoch for epoch in range(100)] + [
+        "Process 1 exit with status code 1."
+    ]
+    client = SpellClient(stream_logs=True, max_log_bytes=100)
+    client.distributed_monitor = SpellDistributedRunMonitor(ranks=2)
+    client._client = MagicMock()
+    client._client.api.get_run_log_entries.side_effect = lambda _, follow, offset: (
+        SimpleNamespace(log=line) for line in lines[offset:]
+    )
+
+    client._stream_run_logs("test1")
+
+    assert_that(client.log_offset, less_than(len(lines)))
+    assert_that(client.distributed_monitor.failed_nodes(), equal_to([1]))
+
+    # the lines written at the next checks are not counted again
+    while client.log_offset < len(lines):
+        client._stream_run_logs("test1")
+    assert_that(client.distributed_monitor.summary()["0"]["lines"], equal_to(100))
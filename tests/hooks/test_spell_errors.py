@@ -0,0 +1,165 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from airflow.exceptions import AirflowException
+from precisely import assert_that, equal_to, is_instance, mapping_includes, raises
+import pytest
+import requests
+from spell.api.exceptions import BadRequest, ClientException, ServerError
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks.spell_errors import (
+    SpellCircuitBreaker,
+    is_transient_error,
+    retry_after,
+)
+from airflow_spell.triggers.spell_run import SpellRunTrigger
+
+
+def api_error(error_class, status_code, headers=None):
+    return error_class(
+        msg="error", response=SimpleNamespace(status_code=status_code, headers=headers)
+    )
+
+
+@pytest.mark.parametrize(
+    "error, transient",
+    [
+        (api_error(ServerError, 500), True),
+        (api_error(ClientException, 502), True),
+        (api_error(ClientException, 429), True),
+        (ClientException(exception=requests.ConnectionError("reset")), True),
+        (api_error(BadRequest, 400), False),
+        (api_error(ClientException, 404), False),
+        (ValueError("bad document"), False),
+    ],
+)
+def test_errors_are_classified(error, transient):
+    assert_that(is_transient_error(error), equal_to(transient))
+
+
+def test_retry_after_is_read_from_the_response():
+    assert_that(
+        retry_after(api_error(ClientException, 429, {"Retry-After": "12"})),
+        equal_to(12.0),
+    )
+    assert_that(
+        retry_after(
+            api_error(
+                ClientException, 503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+            )
+        ),
+        equal_to(0.0),
+    )
+    assert_that(retry_after(api_error(ClientException, 502)), equal_to(None))
+
+
+def test_circuit_opens_after_failures_and_lets_one_probe_through(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("airflow_spell.hooks.spell_errors.monotonic", lambda: clock[0])
+    breaker = SpellCircuitBreaker("testing", failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert_that(breaker.is_open, equal_to(False))
+    breaker.record_failure(retry_after_seconds=60)
+    assert_that(breaker.open_until, equal_to(60.0))
+
+    clock[0] = 61.0
+    breaker.wait()
+    breaker.record_failure()
+    assert_that(breaker.open_until, equal_to(121.0))
+
+    clock[0] = 122.0
+    breaker.wait()
+    breaker.record_success()
+    assert_that(breaker.is_open, equal_to(False))
+
+
+@pytest.fixture(autouse=True)
+def circuit_breakers(monkeypatch):
+    monkeypatch.setattr(SpellCircuitBreaker, "_breakers", {})
+    monkeypatch.setattr("airflow_spell.hooks.spell_client.sleep", lambda _: None)
+    monkeypatch.setattr("airflow_spell.hooks.spell_errors.sleep", lambda _: None)
+
+
+def test_status_checks_survive_transient_errors(monkeypatch):
+    responses = [
+        api_error(ServerError, 502),
+        api_error(ClientException, 429, {"Retry-After": "1"}),
+        MagicMock(status=RunsService.COMPLETE),
+    ]
+
+    def mock_get_run(_, __):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(SpellClient, "_get_run", mock_get_run)
+
+    assert_that(
+        SpellClient()._poll_run_status("test1", RunsService.FINAL), equal_to(True)
+    )
+
+
+def test_permanent_errors_end_status_checks(monkeypatch):
+    def mock_get_run(_, __):
+        raise api_error(BadRequest, 400)
+
+    monkeypatch.setattr(SpellClient, "_get_run", mock_get_run)
+
+    assert_that(
+        lambda: SpellClient()._poll_run_status("test1", RunsService.FINAL),
+        raises(is_instance(BadRequest)),
+    )
+
+
+def test_transient_retry_budget_is_bounded(monkeypatch):
+    def mock_get_run(_, __):
+        raise api_error(ServerError, 503)
+
+    monkeypatch.setattr(SpellClient, "_get_run", mock_get_run)
+    monkeypatch.setattr(SpellClient, "TRANSIENT_RETRIES", 3)
+    monkeypatch.setattr(SpellCircuitBreaker, "wait", lambda _: 0.0)
+
+    assert_that(
+        lambda: SpellClient()._poll_run_status("test1", RunsService.FINAL),
+        raises(is_instance(AirflowException)),
+    )
+
+
+def test_trigger_status_checks_go_through_the_circuit_breaker(monkeypatch):
+    responses = [
+        api_error(ServerError, 502),
+        api_error(ServerError, 503),
+        MagicMock(status=RunsService.COMPLETE),
+    ]
+
+    def mock_get_run(_, __):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    failures = []
+    monkeypatch.setattr(SpellClient, "_get_run", mock_get_run)
+    monkeypatch.setattr("airflow_spell.hooks.spell_client.uniform", lambda *_: 0.0)
+    monkeypatch.setattr(
+        SpellCircuitBreaker,
+        "record_failure",
+        lambda self, retry_after_seconds=None: failures.append(self.key),
+    )
+    trigger = SpellRunTrigger(
+        run_id="test1", spell_conn_id="testing-spell-trigger", poll_interval=0
+    )
+
+    async def collect():
+        async for event in trigger.run():
+            return event
+
+    event = asyncio.run(collect())
+
+    assert_that(event.payload, mapping_includes({"status": "success"}))
+    assert_that(failures, equal_to(["testing-spell-trigger"] * 2))
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+from typing import List, Tuple
+from unittest.mock import MagicMock
+
+from airflow.models import Connection
+from precisely import assert_that, contains_exactly, equal_to, includes
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks import spell_metrics
+
+
+@pytest.fixture
+def emitted(monkeypatch) -> List[Tuple[str, str, object, dict]]:
+    emitted = []
+
+    def recorder(kind):
+        def record(stat, value, tags=None):
+            emitted.append((kind, stat, value, tags))
+
+        return record
+
+    for kind in ["incr", "gauge", "timing"]:
+        monkeypatch.setattr(spell_metrics.Stats, kind, recorder(kind))
+    return emitted
+
+
+def test_throttled_api_responses_are_counted(emitted):
+    api = MagicMock()
+    api.request.side_effect = [
+        SimpleNamespace(status_code=200),
+        SimpleNamespace(status_code=429),
+    ]
+    tags = spell_metrics.stats_tags("spell_default", "healx")
+    spell_metrics.instrument_api(api, tags)
+
+    api.request("get", "runs/1")
+    api.request("get", "runs/1")
+
+    assert_that(
+        [(kind, stat) for kind, stat, _, _ in emitted],
+        contains_exactly(
+            ("timing", "spell.api.request"),
+            ("timing", "spell.api.request"),
+            ("incr", "spell.api.throttled"),
+        ),
+    )
+    assert_that(
+        emitted[-1][3],
+        equal_to(
+            {"conn_id": "spell_default", "owner": "healx", "machine_type": "unknown"}
+        ),
+    )
+
+
+def test_untagged_stats_are_emitted_without_tags(monkeypatch):
+    emitted = []
+    monkeypatch.setattr(
+        spell_metrics.Stats, "incr", lambda stat, count: emitted.append((stat, count))
+    )
+
+    spell_metrics.incr("poll", spell_metrics.stats_tags(None, None))
+
+    assert_that(emitted, equal_to([("spell.poll", 1)]))
+
+
+def test_polls_per_run_are_reported(monkeypatch, emitted):
+    statuses = iter([RunsService.RUNNING, RunsService.RUNNING, RunsService.COMPLETE])
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: MagicMock(status=next(statuses))
+    )
+    monkeypatch.setattr("airflow_spell.hooks.spell_client._delay", lambda _: None)
+    client = SpellClient(spell_conn_id="spell_default")
+    client.machine_type = "GPU-V100"
+
+    client._poll_run_status("test1", RunsService.FINAL)
+
+    assert_that(
+        emitted,
+        includes(
+            (
+                "gauge",
+                "spell.run.polls",
+                3,
+                {
+                    "conn_id": "spell_default",
+                    "owner": "default",
+                    "machine_type": "GPU-V100",
+                },
+            )
+        ),
+    )
+
+
+def test_api_and_poll_metrics_share_the_owner_tag(monkeypatch):
+    instrumented = []
+    monkeypatch.setattr(
+        spell_metrics, "instrument_api", lambda _, tags: instrumented.append(tags)
+    )
+    client = SpellClient(spell_conn_id="testing-metric-tags")
+
+    client.hook._build_client(
+        Connection(conn_id="testing-metric-tags", host="healx", password="token")
+    )
+
+    assert_that(instrumented[0]["owner"], equal_to(client.stats_tags["owner"]))
+    assert_that(instrumented[0]["conn_id"], equal_to(client.stats_tags["conn_id"]))
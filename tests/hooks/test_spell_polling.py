@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from airflow.exceptions import AirflowException
+from precisely import (
+    assert_that,
+    equal_to,
+    is_instance,
+    less_than_or_equal_to,
+    raises,
+)
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks.spell_polling import (
+    ExponentialPollingPolicy,
+    HistoryPollingPolicy,
+    SpellPollingPolicy,
+    SpellRunHistory,
+)
+
+
+def spell_run(status=RunsService.RUNNING, duration=None):
+    created_at = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    ended_at = None if duration is None else created_at + timedelta(seconds=duration)
+    return SimpleNamespace(
+        status=status,
+        command="python train.py",
+        description=None,
+        gpu="V100",
+        created_at=created_at,
+        ended_at=ended_at,
+    )
+
+
+@pytest.fixture
+def history(tmp_path) -> SpellRunHistory:
+    return SpellRunHistory(path=str(tmp_path / "history.db"))
+
+
+def test_history_estimates_median_duration(history):
+    for duration in [100, 3600, 3700]:
+        history.record("python train.py", "V100", duration)
+
+    assert_that(history.expected_duration("python train.py", "V100"), equal_to(3600))
+    assert_that(history.expected_duration("python train.py", "CPU"), equal_to(None))
+
+
+def test_completed_runs_are_recorded(history):
+    policy = HistoryPollingPolicy(history=history)
+    policy.record_run(spell_run(status=RunsService.COMPLETE, duration=3600))
+    policy.record_run(spell_run(status=RunsService.FAILED, duration=10))
+
+    assert_that(history.expected_duration("python train.py", "V100"), equal_to(3600))
+
+
+@pytest.mark.parametrize(
+    "elapsed, delay",
+    [(0, 600), (3400, 100), (3595, 5), (4000, 100)],
+)
+def test_history_polls_densely_around_expected_finish(history, elapsed, delay):
+    history.record("python train.py", "V100", 3600)
+    policy = HistoryPollingPolicy(history=history)
+
+    assert_that(policy.next_delay(spell_run(), 1, elapsed), equal_to(delay))
+
+
+def test_runs_without_history_use_exponential_delay(history):
+    policy = HistoryPollingPolicy(history=history)
+
+    assert_that(policy.next_delay(spell_run(), 100, 0), less_than_or_equal_to(600))
+
+
+def test_status_checks_stop_at_policy_timeout(monkeypatch):
+    client = SpellClient(polling_policy=ExponentialPollingPolicy(timeout=60))
+    monkeypatch.setattr(SpellClient, "_get_run", lambda _, __: spell_run())
+
+    assert_that(
+        lambda: client._poll_run_status("test1", RunsService.FINAL),
+        raises(is_instance(AirflowException)),
+    )
+
+
+def test_run_stuck_in_a_status_is_stopped(monkeypatch):
+    client = SpellClient(
+        polling_policy=ExponentialPollingPolicy(status_timeouts={"building": 0})
+    )
+    client._client = MagicMock()
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: spell_run(RunsService.BUILDING)
+    )
+
+    assert_that(
+        lambda: client._poll_run_status("test1", RunsService.FINAL),
+        raises(is_instance(AirflowException)),
+    )
+    client._client.api.stop_run.assert_called_once_with("test1")
+    assert_that(
+        [status for status, _ in client.status_timeline],
+        equal_to([RunsService.BUILDING]),
+    )
+
+
+@pytest.mark.parametrize(
+    "status, status_elapsed, elapsed, time_to_limit",
+    [
+        (RunsService.BUILDING, 100, 100, 200),
+        (RunsService.RUNNING, 100, 3500, 100),
+        (RunsService.SAVING, 10, 10, None),
+    ],
+)
+def test_time_to_limit_is_the_nearest_limit(
+    status, status_elapsed, elapsed, time_to_limit
+):
+    policy = ExponentialPollingPolicy(
+        timeout=3600 if status != RunsService.SAVING else None,
+        status_timeouts={RunsService.BUILDING: 300},
+    )
+
+    assert_that(
+        policy.time_to_limit(status, status_elapsed, elapsed), equal_to(time_to_limit)
+    )
+
+
+def test_policies_must_decide_the_delay():
+    assert_that(lambda: SpellPollingPolicy(), raises(is_instance(TypeError)))
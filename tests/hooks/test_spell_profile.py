@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from precisely import assert_that, contains_exactly, equal_to, mapping_includes
+import pytest
+
+from airflow_spell.cli.phase_report import main
+from airflow_spell.hooks.spell_profile import (
+    SpellRunProfiles,
+    phase_durations,
+    run_profile,
+)
+
+
+TIMELINE = [
+    ("machine_requested", 1000.0),
+    ("building", 1060.0),
+    ("running", 1360.0),
+    ("saving", 1960.0),
+    ("complete", 1990.0),
+]
+
+
+def test_phase_durations_follow_status_changes():
+    assert_that(
+        phase_durations(TIMELINE),
+        equal_to({"queued": 60.0, "building": 300.0, "running": 600.0, "saving": 30.0}),
+    )
+
+
+def test_time_before_the_first_check_counts_towards_the_first_status():
+    created_at = datetime.fromtimestamp(990.0, timezone.utc)
+
+    assert_that(
+        phase_durations(TIMELINE, created_at),
+        mapping_includes({"queued": 70.0}),
+    )
+
+
+@pytest.fixture
+def profiles(tmp_path) -> SpellRunProfiles:
+    return SpellRunProfiles(path=str(tmp_path / "profiles.db"))
+
+
+def spell_run(run_id, docker_image):
+    return SimpleNamespace(
+        id=run_id,
+        status="complete",
+        gpu="V100",
+        docker_image=docker_image,
+        command="python train.py",
+        description=None,
+    )
+
+
+def test_report_ranks_groups_by_queue_and_build_time(profiles):
+    profiles.record(run_profile(spell_run(1, "slim"), TIMELINE))
+    profiles.record(run_profile(spell_run(1, "slim"), TIMELINE))
+    slow_build = [("building", 0.0), ("running", 3000.0), ("complete", 3100.0)]
+    profiles.record(run_profile(spell_run(2, "heavy"), slow_build))
+
+    report = profiles.report()
+
+    assert_that(
+        report,
+        contains_exactly(
+            mapping_includes({"docker_image": "heavy", "runs": 1, "building": 3000.0}),
+            mapping_includes(
+                {"docker_image": "slim", "runs": 1, "queued": 60.0, "building": 300.0}
+            ),
+        ),
+    )
+    assert_that(
+        [group["docker_image"] for group in report], equal_to(["heavy", "slim"])
+    )
+
+
+def test_failed_record_keeps_the_earlier_profile(profiles):
+    profiles.record(run_profile(spell_run(1, "slim"), TIMELINE))
+    broken = run_profile(spell_run(1, "slim"), TIMELINE)
+    del broken["command"]
+
+    with pytest.raises(KeyError):
+        profiles.record(broken)
+    profiles.record(run_profile(spell_run(2, "slim"), TIMELINE))
+
+    assert_that(profiles.report(), contains_exactly(mapping_includes({"runs": 2})))
+
+
+def test_report_tool_prints_groups(profiles, capsys):
+    profiles.record(run_profile(spell_run(1, "slim"), TIMELINE))
+
+    main(["--path", profiles.path, "--group-by", "docker_image"])
+
+    assert_that(
+        capsys.readouterr().out.splitlines()[2].split()[:3],
+        equal_to(["slim", "1", "300"]),
+    )
@@ -0,0 +1,59 @@
+from timeit import default_timer
+from unittest.mock import MagicMock
+
+from precisely import assert_that, equal_to, greater_than, less_than
+import pytest
+
+from airflow_spell.hooks.spell_rate_limit import SpellRateLimiter
+
+
+@pytest.fixture
+def store_path(tmp_path) -> str:
+    return str(tmp_path / "rate_limit.db")
+
+
+def test_burst_requests_do_not_wait(store_path):
+    limiter = SpellRateLimiter(key="spell_default", rate=1, burst=5, path=store_path)
+
+    waited = [limiter.acquire() for _ in range(5)]
+
+    assert_that(sum(waited), equal_to(0))
+
+
+def test_requests_beyond_burst_wait_for_tokens(store_path):
+    limiter = SpellRateLimiter(key="spell_default", rate=20, burst=2, path=store_path)
+
+    start = default_timer()
+    for _ in range(6):
+        limiter.acquire()
+    duration = default_timer() - start
+
+    assert_that(duration, greater_than(0.15))
+    assert_that(limiter.total_wait, greater_than(0.15))
+
+
+def test_limiters_share_the_bucket_through_the_store(store_path):
+    first = SpellRateLimiter(key="spell_default", rate=20, burst=2, path=store_path)
+    second = SpellRateLimiter(key="spell_default", rate=20, burst=2, path=store_path)
+    other = SpellRateLimiter(key="spell_other", rate=20, burst=2, path=store_path)
+
+    first.acquire()
+    first.acquire()
+
+    assert_that(second.acquire(), greater_than(0))
+    assert_that(other.acquire(), equal_to(0))
+
+
+def test_wrapped_api_requests_take_tokens(store_path):
+    limiter = SpellRateLimiter(key="spell_default", rate=20, burst=1, path=store_path)
+    api = MagicMock()
+    request = api.request
+    limiter.wrap(api)
+
+    start = default_timer()
+    api.request("get", "runs/1")
+    api.request("get", "runs/1")
+
+    assert_that(request.call_count, equal_to(2))
+    assert_that(default_timer() - start, less_than(1))
+    assert_that(limiter.total_wait, greater_than(0))
@@ -0,0 +1,66 @@
+from precisely import assert_that, equal_to, mapping_includes, not_
+import pytest
+
+from airflow_spell.hooks.spell_run_cache import SpellRunCache
+
+
+@pytest.fixture
+def run_cache(tmp_path) -> SpellRunCache:
+    return SpellRunCache(path=str(tmp_path / "run_cache.db"), max_entries=2)
+
+
+def test_normalized_run_kwargs_hash_the_same():
+    key = SpellRunCache.run_key(
+        "spell_default",
+        None,
+        {"command": "train", "pip_packages": ["a", "b"], "envvars": {"X": 1, "Y": 2}},
+    )
+    same_key = SpellRunCache.run_key(
+        "spell_default",
+        None,
+        {
+            "envvars": {"Y": 2, "X": 1},
+            "pip_packages": ["b", "a"],
+            "command": "train",
+            "idempotent": True,
+            "description": None,
+        },
+    )
+
+    assert_that(same_key, equal_to(key))
+    assert_that(
+        SpellRunCache.run_key("spell_default", "team", {"command": "train"}),
+        not_(
+            equal_to(SpellRunCache.run_key("spell_default", None, {"command": "train"}))
+        ),
+    )
+
+
+def test_recorded_runs_are_hits(run_cache):
+    run_cache.record("key", 42, 120.0)
+
+    assert_that(run_cache.lookup("key"), equal_to((42, 120.0)))
+    assert_that(run_cache.lookup("other"), equal_to(None))
+    assert_that(
+        run_cache.stats(),
+        mapping_includes(
+            {"hits": 1, "misses": 1, "hit_rate": 0.5, "saved_seconds": 120.0}
+        ),
+    )
+
+
+def test_expired_runs_are_misses(run_cache):
+    run_cache.ttl = -1
+    run_cache.record("key", 42, 120.0)
+
+    assert_that(run_cache.lookup("key"), equal_to(None))
+
+
+def test_least_recently_used_runs_are_evicted(run_cache):
+    run_cache.record("first", 1, 10.0)
+    run_cache.record("second", 2, 10.0)
+    run_cache.lookup("first")
+    run_cache.record("third", 3, 10.0)
+
+    assert_that(run_cache.lookup("second"), equal_to(None))
+    assert_that(run_cache.lookup("first"), equal_to((1, 10.0)))
@@ -0,0 +1,111 @@
+import asyncio
+from threading import Timer, current_thread, main_thread
+from time import monotonic
+from typing import Iterator
+from unittest.mock import MagicMock
+from urllib.error import HTTPError
+
+from precisely import assert_that, equal_to, less_than, mapping_includes
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks.spell_polling import SpellPollingPolicy
+from airflow_spell.hooks.spell_webhooks import (
+    SpellRunEvents,
+    SpellWebhookReceiver,
+    send_run_event,
+)
+from airflow_spell.triggers.spell_run import SpellRunTrigger
+
+
+class SlowPollingPolicy(SpellPollingPolicy):
+    def next_delay(self, run, retries, elapsed) -> float:
+        return 600.0
+
+
+@pytest.fixture
+def events(monkeypatch, tmp_path) -> SpellRunEvents:
+    events = SpellRunEvents(path=str(tmp_path / "events.db"), check_interval=0.05)
+    monkeypatch.setitem(SpellRunEvents._instances, None, events)
+    return events
+
+
+@pytest.fixture
+def receiver(events) -> Iterator[SpellWebhookReceiver]:
+    receiver = SpellWebhookReceiver(events, port=0, secret="s3cret").start()
+    yield receiver
+    receiver.stop()
+
+
+def test_signed_notifications_are_recorded(events, receiver):
+    code = send_run_event(receiver.url, 42, RunsService.COMPLETE, secret="s3cret")
+
+    assert_that(code, equal_to(204))
+    assert_that(events.wait(42, 1.0, since=0), equal_to(RunsService.COMPLETE))
+
+
+def test_badly_signed_notifications_are_rejected(events, receiver):
+    with pytest.raises(HTTPError) as error:
+        send_run_event(receiver.url, 42, RunsService.COMPLETE, secret="guess")
+
+    assert_that(error.value.code, equal_to(401))
+    assert_that(events.received_since(42, 0), equal_to(None))
+
+
+def test_notification_wakes_the_status_polling(monkeypatch, events, receiver):
+    statuses = iter([RunsService.RUNNING, RunsService.COMPLETE])
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: MagicMock(status=next(statuses))
+    )
+    client = SpellClient(polling_policy=SlowPollingPolicy(), wait_for_webhooks=True)
+    sender = Timer(
+        0.2, send_run_event, (receiver.url, "test1", RunsService.COMPLETE, "s3cret")
+    )
+    sender.start()
+
+    started_at = monotonic()
+    client._poll_run_status("test1", RunsService.FINAL)
+
+    assert_that(monotonic() - started_at, less_than(5))
+    sender.join()
+
+
+def test_notification_wakes_the_trigger(monkeypatch, events):
+    statuses = iter([RunsService.RUNNING, RunsService.COMPLETE])
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: MagicMock(status=next(statuses))
+    )
+    trigger = SpellRunTrigger(run_id="test1", poll_interval=600, wait_for_webhooks=True)
+
+    async def collect():
+        asyncio.get_event_loop().call_later(
+            0.2, events.record, "test1", RunsService.COMPLETE
+        )
+        async for event in trigger.run():
+            return event
+
+    started_at = monotonic()
+    event = asyncio.run(collect())
+
+    assert_that(monotonic() - started_at, less_than(5))
+    assert_that(event.payload, mapping_includes({"run_status": RunsService.COMPLETE}))
+
+
+def test_async_wait_reads_the_store_off_the_event_loop(monkeypatch, events):
+    read = events._read
+    reading_threads = []
+
+    def mock_read():
+        reading_threads.append(current_thread())
+        read()
+
+    monkeypatch.setattr(events, "_read", mock_read)
+    events.record(42, RunsService.COMPLETE)
+
+    status = asyncio.run(events.async_wait(42, 1.0, since=0))
+
+    assert_that(status, equal_to(RunsService.COMPLETE))
+    assert_that(
+        [thread is main_thread() for thread in reading_threads], equal_to([False])
+    )
@@ -1,5 +1,25 @@
-from precisely import assert_that, has_attrs
+from datetime import datetime
+import json
+from unittest.mock import MagicMock
+
+from airflow import DAG
+from airflow.exceptions import AirflowException, TaskDeferred
+from precisely import assert_that, equal_to, has_attrs, is_instance
+import pytest
+from spell.client.runs import RunsService
+
 from airflow_spell import SpellRunOperator
+from airflow_spell.hooks.spell_admission import SpellAdmissionController
+from airflow_spell.hooks.spell_run_cache import SpellRunCache
+from airflow_spell.triggers.spell_run import SpellRunTrigger
+
+
+@pytest.fixture(autouse=True)
+def spell_connection(monkeypatch):
+    monkeypatch.setenv(
+        "AIRFLOW_CONN_TESTING-SPELL-RUN-OPERATOR",
+        json.dumps({"conn_type": "spell", "host": "owner", "password": "token"}),
+    )
 
 
 def test_run_operator_can_be_created():
@@ -15,3 +35,399 @@ def test_run_operator_can_be_created():
             task_id="testing-task-id",
         ),
     )
+
+
+def test_deferrable_run_operator_defers_to_trigger(monkeypatch):
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+        deferrable=True,
+        reattach=False,
+    )
+
+    def mock_submit_run(self, _):
+        self.spell_run_id = "test1"
+
+    monkeypatch.setattr(SpellRunOperator, "submit_run", mock_submit_run)
+
+    with pytest.raises(TaskDeferred) as deferred:
+        run_operator.execute({})
+
+    assert_that(deferred.value.trigger, is_instance(SpellRunTrigger))
+    assert_that(deferred.value.trigger, has_attrs(run_id="test1"))
+    assert_that(deferred.value.method_name, equal_to("execute_complete"))
+
+
+def test_deferred_run_hands_its_admission_slot_to_the_trigger(monkeypatch, tmp_path):
+    admission = SpellAdmissionController(
+        key="testing-spell-run-operator",
+        quotas={"GPU-V100": 1},
+        path=str(tmp_path / "admission.db"),
+    )
+    monkeypatch.setattr(
+        "airflow_spell.hooks.spell_client.SpellHook.get_admission_controller",
+        lambda _: admission,
+    )
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+        deferrable=True,
+        reattach=False,
+        machine_type="GPU-V100",
+    )
+    run_operator._client = MagicMock()
+    run_operator._client.runs.new.return_value = MagicMock(id="test1")
+
+    with pytest.raises(TaskDeferred) as deferred:
+        run_operator.execute({})
+
+    assert_that(
+        deferred.value.trigger,
+        has_attrs(
+            admission_ticket=run_operator._admission_ticket({}),
+            machine_type="GPU-V100",
+        ),
+    )
+
+
+@pytest.fixture
+def retried_run_operator(monkeypatch) -> SpellRunOperator:
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+    )
+    run_operator.cleared = []
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_get_task_state",
+        lambda _, __, name: "42" if name == "spell_run_id" else None,
+    )
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_clear_task_state",
+        lambda self, _, name: self.cleared.append(name),
+    )
+    return run_operator
+
+
+def mock_get_run(status, user_exit_code=None):
+    def mock_func(_, __):
+        return MagicMock(status=status, user_exit_code=user_exit_code)
+
+    return mock_func
+
+
+@pytest.mark.parametrize(
+    "status, user_exit_code",
+    [
+        ("machine_requested", None),
+        (RunsService.RUNNING, None),
+        (RunsService.COMPLETE, 0),
+    ],
+)
+def test_retried_task_reattaches_to_live_or_successful_run(
+    monkeypatch, retried_run_operator, status, user_exit_code
+):
+    monkeypatch.setattr(
+        SpellRunOperator, "_get_run", mock_get_run(status, user_exit_code)
+    )
+
+    assert_that(retried_run_operator.reattach_run({}), equal_to(True))
+    assert_that(retried_run_operator, has_attrs(spell_run_id="42"))
+
+
+@pytest.mark.parametrize(
+    "status, user_exit_code",
+    [
+        (RunsService.FAILED, None),
+        (RunsService.KILLED, None),
+        (RunsService.COMPLETE, 1),
+    ],
+)
+def test_retried_task_resubmits_after_failed_run(
+    monkeypatch, retried_run_operator, status, user_exit_code
+):
+    monkeypatch.setattr(
+        SpellRunOperator, "_get_run", mock_get_run(status, user_exit_code)
+    )
+
+    assert_that(retried_run_operator.reattach_run({}), equal_to(False))
+    assert_that(retried_run_operator.cleared, equal_to(["spell_run_id", "log_offset"]))
+
+
+def spell_api_error(status_code):
+    error = RuntimeError("HTTP %d" % status_code)
+    error.response = MagicMock(status_code=status_code, headers={})
+    return error
+
+
+def test_retried_task_resubmits_after_missing_run(monkeypatch, retried_run_operator):
+    def raise_not_found(_, __):
+        raise spell_api_error(404)
+
+    monkeypatch.setattr(SpellRunOperator, "_get_run", raise_not_found)
+
+    assert_that(retried_run_operator.reattach_run({}), equal_to(False))
+
+
+def test_retried_task_retries_transient_errors_before_reattaching(
+    monkeypatch, retried_run_operator
+):
+    responses = iter(
+        [
+            spell_api_error(503),
+            MagicMock(status=RunsService.RUNNING, user_exit_code=None),
+        ]
+    )
+
+    def flaky_get_run(_, __):
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(SpellRunOperator, "_get_run", flaky_get_run)
+    monkeypatch.setattr("airflow_spell.hooks.spell_client.sleep", lambda _: None)
+
+    assert_that(retried_run_operator.reattach_run({}), equal_to(True))
+
+
+def test_retried_task_fails_on_permanent_errors(monkeypatch, retried_run_operator):
+    def raise_forbidden(_, __):
+        raise spell_api_error(403)
+
+    monkeypatch.setattr(SpellRunOperator, "_get_run", raise_forbidden)
+
+    with pytest.raises(AirflowException):
+        retried_run_operator.reattach_run({})
+    assert_that(retried_run_operator.cleared, equal_to([]))
+
+
+def test_final_try_failure_clears_the_saved_run(monkeypatch, retried_run_operator):
+    ti = MagicMock()
+    ti.is_eligible_to_retry.return_value = False
+    event = {"status": "error", "spell_run_id": "42", "message": "spell is down"}
+
+    with pytest.raises(AirflowException):
+        retried_run_operator.execute_complete({"ti": ti}, event)
+
+    assert_that(retried_run_operator.cleared, equal_to(["spell_run_id", "log_offset"]))
+
+
+def test_reattached_run_resumes_log_streaming(monkeypatch):
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+        stream_logs=True,
+    )
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_get_task_state",
+        lambda _, __, name: {"spell_run_id": "42", "log_offset": 120}[name],
+    )
+    monkeypatch.setattr(SpellRunOperator, "_get_run", mock_get_run(RunsService.RUNNING))
+
+    run_operator.reattach_run({})
+
+    assert_that(run_operator, has_attrs(spell_run_id="42", log_offset=120))
+
+
+@pytest.fixture
+def cached_run_operator(tmp_path) -> SpellRunOperator:
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+        reattach=False,
+        run_cache=SpellRunCache(path=str(tmp_path / "run_cache.db")),
+        command="preprocess",
+    )
+    run_operator._client = MagicMock()
+    run_operator._client.runs.new.return_value = MagicMock(id=42)
+    return run_operator
+
+
+def test_cache_miss_submits_idempotent_run_and_records_it(
+    monkeypatch, cached_run_operator
+):
+    monkeypatch.setattr(SpellRunOperator, "monitor_run", lambda _, __: None)
+    monkeypatch.setattr(
+        SpellRunOperator, "_get_run", mock_get_run(RunsService.COMPLETE, 0)
+    )
+
+    assert_that(cached_run_operator.execute({}), equal_to(42))
+    cached_run_operator._client.runs.new.assert_called_once_with(
+        command="preprocess", idempotent=True
+    )
+    assert_that(
+        cached_run_operator.run_cache.lookup(cached_run_operator._run_cache_key()),
+        equal_to((42, 0.0)),
+    )
+
+
+def test_cache_hit_returns_earlier_run_without_submitting(cached_run_operator):
+    cached_run_operator.run_cache.record(cached_run_operator._run_cache_key(), 7, 60.0)
+
+    assert_that(cached_run_operator.execute({}), equal_to(7))
+    cached_run_operator._client.runs.new.assert_not_called()
+
+
+def test_run_is_submitted_once_admitted_and_releases_its_slot(monkeypatch, tmp_path):
+    admission = SpellAdmissionController(
+        key="testing-spell-run-operator",
+        quotas={"GPU-V100": 1},
+        path=str(tmp_path / "admission.db"),
+    )
+    monkeypatch.setattr(
+        SpellRunOperator, "monitor_run", lambda self, _: self.status_callback(None)
+    )
+    monkeypatch.setattr(
+        "airflow_spell.hooks.spell_client.SpellHook.get_admission_controller",
+        lambda _: admission,
+    )
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+        reattach=False,
+        command="train",
+        machine_type="GPU-V100",
+    )
+    run_operator._client = MagicMock()
+    run_operator._client.runs.new.return_value = MagicMock(id=42)
+
+    assert_that(run_operator.execute({}), equal_to(42))
+    assert_that(admission._try_acquire("next", "GPU-V100", 1, 0), equal_to(True))
+
+
+def test_killed_task_stops_its_run():
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+    )
+    run_operator._client = MagicMock()
+    run_operator.spell_run_id = 42
+
+    run_operator.on_kill()
+
+    run_operator._client.api.stop_run.assert_called_once_with(42)
+
+
+def test_upstream_run_outputs_are_attached():
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="evaluate",
+        upstream_outputs={"train": "/mnt/model"},
+        attached_resources={"uploads/data": "/mnt/data"},
+    )
+    ti = MagicMock()
+    ti.xcom_pull.side_effect = lambda task_ids: {"train": 42}.get(task_ids)
+
+    assert_that(
+        run_operator.upstream_run_kwargs({"ti": ti})["attached_resources"],
+        equal_to({"uploads/data": "/mnt/data", "runs/42": "/mnt/model"}),
+    )
+
+
+@pytest.fixture
+def chained_operators(monkeypatch):
+    task_state = {}
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_get_task_state",
+        lambda self, _, name, task_id=None: task_state.get(
+            (task_id or self.task_id, name)
+        ),
+    )
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_set_task_state",
+        lambda self, _, name, value, task_id=None: task_state.__setitem__(
+            (task_id or self.task_id, name), value
+        ),
+    )
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_clear_task_state",
+        lambda self, _, name, task_id=None: task_state.pop(
+            (task_id or self.task_id, name), None
+        ),
+    )
+    with DAG("testing-chain", start_date=datetime(2021, 1, 1)):
+        upstream = SpellRunOperator(
+            spell_conn_id="testing-spell-run-operator",
+            task_id="train",
+            reattach=False,
+            command="train",
+        )
+        downstream = SpellRunOperator(
+            spell_conn_id="testing-spell-run-operator",
+            task_id="evaluate",
+            upstream_outputs={"train": "/mnt/model"},
+            speculative=True,
+            command="evaluate",
+        )
+        upstream >> downstream
+    upstream._client = MagicMock()
+    upstream._client.runs.new.return_value = MagicMock(id=42)
+    downstream._client = MagicMock()
+    downstream._client.runs.new.return_value = MagicMock(id=43)
+    return upstream, downstream, task_state
+
+
+def test_downstream_run_is_submitted_while_upstream_saves(
+    monkeypatch, chained_operators
+):
+    upstream, downstream, task_state = chained_operators
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "monitor_run",
+        lambda self, _: self.status_callback(MagicMock(status=RunsService.SAVING)),
+    )
+
+    upstream.execute({"ti": MagicMock()})
+
+    downstream._client.runs.new.assert_called_once_with(
+        command="evaluate", attached_resources={"runs/42": "/mnt/model"}
+    )
+    assert_that(task_state, equal_to({("evaluate", "spell_run_id"): 43}))
+
+
+def test_downstream_run_is_stopped_when_upstream_fails(monkeypatch, chained_operators):
+    upstream, downstream, task_state = chained_operators
+
+    def mock_monitor_run(self, _):
+        self.status_callback(MagicMock(status=RunsService.SAVING))
+        raise AirflowException("Spell run (42) failed")
+
+    monkeypatch.setattr(SpellRunOperator, "monitor_run", mock_monitor_run)
+
+    with pytest.raises(AirflowException):
+        upstream.execute({"ti": MagicMock()})
+
+    downstream._client.api.stop_run.assert_called_once_with(43)
+    assert_that(task_state, equal_to({}))
+
+
+def test_deferred_log_offset_is_saved_for_retries(monkeypatch):
+    run_operator = SpellRunOperator(
+        spell_conn_id="testing-spell-run-operator",
+        task_id="testing-task-id",
+        stream_logs=True,
+    )
+    task_state = {}
+    monkeypatch.setattr(
+        SpellRunOperator,
+        "_set_task_state",
+        lambda _, __, name, value: task_state.__setitem__(name, value),
+    )
+    ti = MagicMock()
+    event = {
+        "status": "error",
+        "spell_run_id": "42",
+        "message": "spell is down",
+        "log_offset": 120,
+    }
+
+    with pytest.raises(AirflowException):
+        run_operator.execute_complete({"ti": ti}, event)
+
+    assert_that(task_state, equal_to({"log_offset": 120}))
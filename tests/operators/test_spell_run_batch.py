@@ -0,0 +1,130 @@
+from typing import Callable, Dict
+from unittest.mock import MagicMock
+
+from airflow.exceptions import AirflowException
+from precisely import assert_that, equal_to, is_instance, raises
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellRunBatchOperator
+
+
+RUN_SPECS = [{"command": "echo %d" % index} for index in range(5)]
+
+
+@pytest.fixture
+def batch_operator(monkeypatch) -> SpellRunBatchOperator:
+    monkeypatch.setattr(
+        "airflow_spell.operators.spell_run_batch._delay", lambda _: None
+    )
+    operator = SpellRunBatchOperator(
+        task_id="testing-batch-task-id", runs=RUN_SPECS, batch_polling=False
+    )
+    operator._client = MagicMock()
+    operator._client.runs.new.side_effect = lambda command: MagicMock(
+        id=command.split()[-1], status="machine_requested"
+    )
+    return operator
+
+
+def mock_get_run(final_status: Dict[str, str]) -> Callable:
+    polls: Dict[str, int] = {}
+
+    def mock_func(_, run_id):
+        polls[run_id] = polls.get(run_id, 0) + 1
+        if polls[run_id] < 2:
+            return MagicMock(status=RunsService.RUNNING, user_exit_code=None)
+        status = final_status.get(run_id, RunsService.COMPLETE)
+        return MagicMock(status=status, user_exit_code=0)
+
+    return mock_func
+
+
+def test_all_runs_are_submitted_and_monitored(monkeypatch, batch_operator):
+    monkeypatch.setattr(SpellRunBatchOperator, "_get_run", mock_get_run({}))
+
+    outcomes = batch_operator.execute({})
+
+    assert_that(
+        [outcome["spell_run_id"] for outcome in outcomes],
+        equal_to(["0", "1", "2", "3", "4"]),
+    )
+    assert_that(all(outcome["succeeded"] for outcome in outcomes), equal_to(True))
+    assert_that(batch_operator._client.runs.new.call_count, equal_to(5))
+
+
+def test_fail_fast_stops_remaining_runs(monkeypatch, batch_operator):
+    monkeypatch.setattr(
+        SpellRunBatchOperator, "_get_run", mock_get_run({"0": RunsService.FAILED})
+    )
+
+    assert_that(
+        lambda: batch_operator.execute({}), raises(is_instance(AirflowException))
+    )
+    assert_that(batch_operator._client.api.stop_run.call_count, equal_to(4))
+
+
+def test_wait_for_all_reports_every_failure(monkeypatch, batch_operator):
+    batch_operator.fail_fast = False
+    monkeypatch.setattr(
+        SpellRunBatchOperator,
+        "_get_run",
+        mock_get_run({"0": RunsService.FAILED, "3": RunsService.KILLED}),
+    )
+
+    assert_that(
+        lambda: batch_operator.execute({}), raises(is_instance(AirflowException))
+    )
+    outcomes = batch_operator.monitor_runs({}, batch_operator.submit_runs({}))
+    assert_that(
+        [outcome["succeeded"] for outcome in outcomes],
+        equal_to([False, True, True, False, True]),
+    )
+    assert_that(batch_operator._client.api.stop_run.call_count, equal_to(0))
+
+
+def test_shared_run_arguments_apply_to_every_run():
+    operator = SpellRunBatchOperator(
+        task_id="testing-batch-task-id",
+        runs=[{"command": "echo 0"}, {"command": "echo 1", "machine_type": "CPU"}],
+        machine_type="GPU-V100",
+    )
+
+    assert_that(
+        operator.runs,
+        equal_to(
+            [
+                {"command": "echo 0", "machine_type": "GPU-V100"},
+                {"command": "echo 1", "machine_type": "CPU"},
+            ]
+        ),
+    )
+
+
+def test_failed_batch_pushes_its_outcomes(monkeypatch, batch_operator):
+    monkeypatch.setattr(
+        SpellRunBatchOperator, "_get_run", mock_get_run({"0": RunsService.FAILED})
+    )
+    ti = MagicMock()
+
+    assert_that(
+        lambda: batch_operator.execute({"ti": ti}),
+        raises(is_instance(AirflowException)),
+    )
+    outcomes = ti.xcom_push.call_args[1]["value"]
+    assert_that(len(outcomes), equal_to(5))
+    assert_that(outcomes[0]["status"], equal_to(RunsService.FAILED))
+
+
+def test_runs_are_stopped_after_max_retries(monkeypatch, batch_operator):
+    monkeypatch.setattr(
+        SpellRunBatchOperator,
+        "_get_run",
+        lambda _, __: MagicMock(status=RunsService.RUNNING, user_exit_code=None),
+    )
+    monkeypatch.setattr(SpellRunBatchOperator, "MAX_RETRIES", 2)
+
+    assert_that(
+        lambda: batch_operator.execute({}), raises(is_instance(AirflowException))
+    )
+    assert_that(batch_operator._client.api.stop_run.call_count, equal_to(5))
@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+import io
+import json
+import tarfile
+from types import SimpleNamespace
+from typing import Dict, List
+
+from airflow.exceptions import AirflowException
+from precisely import assert_that, equal_to, is_instance, raises
+import pytest
+
+from airflow_spell import SpellRunOutputsOperator
+from airflow_spell.hooks.spell_outputs import MANIFEST_NAME
+
+
+class FakeResourcesApi:
+    """
+    Run outputs served the way the spell API does: ``get_ls`` lists one
+    directory, ``tar_of_path`` streams a tar of one path
+    """
+
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+        self.copied: List[str] = []
+        self.failures = 0
+
+    def get_ls(self, resource):
+        prefix = resource.split("/", 2)[2] + "/" if resource.count("/") > 1 else ""
+        names = {}
+        for path, content in self.files.items():
+            if path.startswith(prefix):
+                name, _, rest = path[len(prefix) :].partition("/")
+                names[name] = None if rest else len(content)
+        for name, size in sorted(names.items()):
+            yield SimpleNamespace(path=name, size=size, link_target=None)
+        yield {"resource_link": "runs"}
+
+    @contextmanager
+    def tar_of_path(self, path):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        self.copied.append(path)
+        content = self.files[path.split("/", 2)[2]]
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            member = tarfile.TarInfo(path.rsplit("/", 1)[-1])
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+        buffer.seek(0)
+        with tarfile.open(fileobj=buffer, mode="r|*") as tar:
+            yield tar
+
+
+FILES = {
+    "metrics.json": b'{"loss": 0.1}',
+    "models/best.pt": b"x" * 5000,
+    "models/last.pt": b"y" * 5000,
+    "logs/train.log": b"epoch 1\n",
+}
+
+
+@pytest.fixture
+def api() -> FakeResourcesApi:
+    return FakeResourcesApi(dict(FILES))
+
+
+def outputs_operator(api, tmp_path, **kwargs) -> SpellRunOutputsOperator:
+    operator = SpellRunOutputsOperator(
+        task_id="testing-outputs-task-id",
+        spell_run_id="42",
+        destination=str(tmp_path),
+        **kwargs
+    )
+    operator._client = SimpleNamespace(api=api)
+    return operator
+
+
+def test_matching_outputs_are_downloaded(api, tmp_path):
+    operator = outputs_operator(api, tmp_path, patterns=["models/*.pt", "metrics.json"])
+
+    result = operator.execute({})
+
+    assert_that(
+        sorted(result["downloaded"]),
+        equal_to(["metrics.json", "models/best.pt", "models/last.pt"]),
+    )
+    assert_that((tmp_path / "models" / "best.pt").read_bytes(), equal_to(b"x" * 5000))
+    assert_that((tmp_path / "logs").exists(), equal_to(False))
+
+
+def test_current_local_copies_are_skipped(api, tmp_path):
+    outputs_operator(api, tmp_path).execute({})
+    api.copied.clear()
+    (tmp_path / "models" / "last.pt").write_bytes(b"y" * 10)
+
+    result = outputs_operator(api, tmp_path).execute({})
+
+    assert_that(result["downloaded"], equal_to(["models/last.pt"]))
+    assert_that(api.copied, equal_to(["runs/42/models/last.pt"]))
+
+
+def test_changed_local_copies_fail_the_checksum(api, tmp_path):
+    outputs_operator(api, tmp_path).execute({})
+    (tmp_path / "models" / "best.pt").write_bytes(b"z" * 5000)
+
+    result = outputs_operator(api, tmp_path, verify_checksum=True).execute({})
+
+    assert_that(result["downloaded"], equal_to(["models/best.pt"]))
+    assert_that((tmp_path / "models" / "best.pt").read_bytes(), equal_to(b"x" * 5000))
+
+
+def test_failed_download_resumes_from_the_files_left(monkeypatch, api, tmp_path):
+    monkeypatch.setattr("airflow_spell.hooks.spell_outputs.sleep", lambda _: None)
+    api.failures = 3
+    operator = outputs_operator(api, tmp_path, max_workers=1)
+
+    assert_that(lambda: operator.execute({}), raises(is_instance(AirflowException)))
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+    assert_that(len(manifest), equal_to(len(FILES) - 1))
+
+    result = outputs_operator(api, tmp_path).execute({})
+
+    assert_that(len(result["downloaded"]), equal_to(1))
+    assert_that(len(result["skipped"]), equal_to(len(FILES) - 1))
@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+from unittest.mock import MagicMock
+
+from airflow.exceptions import AirflowException
+from precisely import assert_that, equal_to, is_instance, mapping_includes, raises
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellRunSweepOperator
+from airflow_spell.operators.spell_run_sweep import sweep_params, sweep_run_spec
+
+
+def test_grid_is_expanded_into_run_specs():
+    operator = SpellRunSweepOperator(
+        task_id="testing-sweep-task-id",
+        run_spec={
+            "command": "python train.py --lr {lr} --depth {depth}",
+            "envvars": {"LR": "{lr}"},
+        },
+        grid={"lr": [0.1, 0.01], "depth": [2, 4]},
+    )
+
+    assert_that(len(operator.runs), equal_to(4))
+    assert_that(
+        operator.runs[0],
+        equal_to(
+            {"command": "python train.py --lr 0.1 --depth 2", "envvars": {"LR": "0.1"}}
+        ),
+    )
+
+
+def test_only_grid_placeholders_are_filled_in():
+    run_spec = sweep_run_spec(
+        {"command": "python train.py --lr {lr} --cache ${HOME} --opts '{\"a\": 1}'"},
+        {"lr": 0.1},
+    )
+
+    assert_that(
+        run_spec["command"],
+        equal_to("python train.py --lr 0.1 --cache ${HOME} --opts '{\"a\": 1}'"),
+    )
+
+
+def test_run_spec_needs_a_command():
+    assert_that(
+        lambda: sweep_run_spec({"machine_type": "V100"}, {"lr": 0.1}),
+        raises(is_instance(AirflowException)),
+    )
+
+
+def test_random_sweep_samples_the_grid():
+    params = sweep_params(
+        {"lr": [0.1, 0.01, 0.001], "depth": [2, 4]}, samples=3, seed=1
+    )
+
+    assert_that(len(params), equal_to(3))
+    assert_that(
+        params,
+        equal_to(
+            sweep_params({"lr": [0.1, 0.01, 0.001], "depth": [2, 4]}, samples=3, seed=1)
+        ),
+    )
+
+
+# the val_loss each run reports per check: run 2 diverges
+METRICS = {
+    "0": [1.0, 0.8, 0.6, 0.5],
+    "1": [1.0, 0.7, 0.5, 0.4],
+    "2": [1.0, 1.5, 2.0, 3.0],
+}
+
+
+def mock_get_run_metrics(api_calls: List[str]) -> Callable:
+    reported: Dict[str, int] = {}
+
+    def mock_func(run_id, metric_name, follow, offset):
+        api_calls.append(run_id)
+        reported[run_id] = reported.get(run_id, 0) + 1
+        start = datetime(2021, 1, 1)
+        for index, value in enumerate(METRICS[run_id][: reported[run_id]]):
+            timestamp = start + timedelta(seconds=index)
+            if offset is None or timestamp > offset:
+                yield timestamp, index, value
+
+    return mock_func
+
+
+def mock_get_run(stopped: List[str]) -> Callable:
+    polls: Dict[str, int] = {}
+
+    def mock_func(_, run_id):
+        polls[run_id] = polls.get(run_id, 0) + 1
+        if run_id in stopped:
+            return MagicMock(status=RunsService.STOPPED, user_exit_code=None)
+        if polls[run_id] < 5:
+            return MagicMock(status=RunsService.RUNNING, user_exit_code=None)
+        return MagicMock(status=RunsService.COMPLETE, user_exit_code=0)
+
+    return mock_func
+
+
+@pytest.fixture
+def sweep_operator(monkeypatch) -> SpellRunSweepOperator:
+    monkeypatch.setattr(
+        "airflow_spell.operators.spell_run_batch._delay", lambda _: None
+    )
+    operator = SpellRunSweepOperator(
+        task_id="testing-sweep-task-id",
+        run_spec={"command": "python train.py --lr {lr}"},
+        grid={"lr": [0.1, 0.01, 10]},
+        metric="val_loss",
+        early_stop_margin=0.5,
+        early_stop_min_reports=2,
+        metric_interval=0,
+        batch_polling=False,
+    )
+    operator._client = MagicMock()
+    operator._client.runs.new.side_effect = lambda command: MagicMock(
+        id=str(["0.1", "0.01", "10"].index(command.split()[-1])),
+        status="machine_requested",
+    )
+    stopped: List[str] = []
+    operator._client.api.stop_run.side_effect = stopped.append
+    operator._client.api.get_run_metrics.side_effect = mock_get_run_metrics([])
+    monkeypatch.setattr(SpellRunSweepOperator, "_get_run", mock_get_run(stopped))
+    return operator
+
+
+def test_clearly_worse_runs_are_stopped_early(sweep_operator):
+    outcomes = sweep_operator.execute({})
+
+    sweep_operator._client.api.stop_run.assert_called_once_with("2")
+    assert_that(
+        [outcome["stopped_early"] for outcome in outcomes],
+        equal_to([False, False, True]),
+    )
+
+
+def test_best_run_is_pushed_as_xcom(sweep_operator):
+    ti = MagicMock()
+
+    sweep_operator.execute({"ti": ti})
+
+    ti.xcom_push.assert_called_once_with(
+        key="best_run",
+        value={"spell_run_id": "1", "params": {"lr": 0.01}, "metric": 0.4},
+    )
+    assert_that(sweep_operator.outcomes[1], mapping_includes({"params": {"lr": 0.01}}))
+
+
+def test_metrics_are_read_once_per_metric_interval(sweep_operator):
+    api_calls: List[str] = []
+    sweep_operator._client.api.get_run_metrics.side_effect = mock_get_run_metrics(
+        api_calls
+    )
+    sweep_operator.metric_interval = 3600
+
+    sweep_operator.execute({})
+
+    # the first status check of each run, and the final read of the best run
+    assert_that(sorted(api_calls), equal_to(["0", "0", "1", "1", "2", "2"]))
+
+
+def test_runs_stopped_early_are_stopped_once(sweep_operator):
+    outcomes = [
+        {"spell_run_id": run_id, "status": "running", "stopped_early": False}
+        for run_id in METRICS
+    ]
+    running = [(outcome, None) for outcome in outcomes]
+    sweep_operator.metric_values = {
+        run_id: list(values) for run_id, values in METRICS.items()
+    }
+    sweep_operator._client.api.get_run_metrics.side_effect = lambda *_, **__: (
+        metric for metric in []
+    )
+
+    sweep_operator.check_runs(running)
+    sweep_operator.check_runs(running)
+
+    sweep_operator._client.api.stop_run.assert_called_once_with("2")
+
+
+def test_metric_stream_is_closed_when_reading_fails(sweep_operator):
+    metrics = MagicMock()
+    metrics.__iter__.return_value = iter([(datetime(2021, 1, 1), 0, "nan?")])
+    sweep_operator._client.api.get_run_metrics.side_effect = None
+    sweep_operator._client.api.get_run_metrics.return_value = metrics
+
+    sweep_operator.read_metric({"spell_run_id": "0", "metric": None})
+
+    metrics.close.assert_called_once_with()
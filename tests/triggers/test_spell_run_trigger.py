@@ -0,0 +1,166 @@
+import asyncio
+from typing import Callable
+from unittest.mock import MagicMock
+
+from precisely import assert_that, equal_to, mapping_includes
+import pytest
+from spell.client.runs import RunsService
+
+from airflow_spell import SpellClient
+from airflow_spell.hooks.spell_admission import SpellAdmissionController
+from airflow_spell.hooks.spell_store import connect
+from airflow_spell.triggers.spell_run import SpellRunTrigger
+
+
+@pytest.fixture
+def trigger() -> SpellRunTrigger:
+    return SpellRunTrigger(
+        run_id="test1", spell_conn_id="testing-spell-trigger", poll_interval=0
+    )
+
+
+def mock_changing_get_run(statuses) -> Callable:
+    statuses = iter(statuses)
+
+    def mock_func(_, __):
+        return MagicMock(status=next(statuses))
+
+    return mock_func
+
+
+async def first_event_async(trigger: SpellRunTrigger):
+    async for event in trigger.run():
+        return event
+
+
+def first_event(trigger: SpellRunTrigger):
+    return asyncio.run(first_event_async(trigger))
+
+
+def cancel_while_running(trigger: SpellRunTrigger):
+    async def cancel():
+        task = asyncio.ensure_future(first_event_async(trigger))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+
+
+def test_trigger_serializes_its_arguments(trigger):
+    classpath, kwargs = trigger.serialize()
+
+    assert_that(classpath, equal_to("airflow_spell.triggers.spell_run.SpellRunTrigger"))
+    assert_that(SpellRunTrigger(**kwargs).serialize(), equal_to((classpath, kwargs)))
+
+
+def test_final_status_fires_success_event(monkeypatch, trigger):
+    monkeypatch.setattr(
+        SpellClient,
+        "_get_run",
+        mock_changing_get_run(
+            ["machine_requested", RunsService.RUNNING, RunsService.FAILED]
+        ),
+    )
+
+    assert_that(
+        first_event(trigger).payload,
+        mapping_includes(
+            {
+                "status": "success",
+                "spell_run_id": "test1",
+                "run_status": RunsService.FAILED,
+            }
+        ),
+    )
+
+
+def test_status_error_fires_error_event(monkeypatch, trigger):
+    def raise_error(_, __):
+        raise RuntimeError("spell is down")
+
+    monkeypatch.setattr(SpellClient, "_get_run", raise_error)
+
+    assert_that(
+        first_event(trigger).payload,
+        mapping_includes(
+            {"status": "error", "spell_run_id": "test1", "message": "spell is down"}
+        ),
+    )
+
+
+def test_admission_slot_is_held_until_the_run_ends(monkeypatch, tmp_path):
+    admission = SpellAdmissionController(
+        key="testing-spell-trigger",
+        quotas={"GPU-V100": 1},
+        path=str(tmp_path / "admission.db"),
+    )
+    monkeypatch.setattr(
+        "airflow_spell.hooks.spell_client.SpellHook.get_admission_controller",
+        lambda _: admission,
+    )
+
+    def held_slots():
+        with connect(admission.path) as db:
+            return [t for t, in db.execute("SELECT ticket FROM admission_slots")]
+
+    checks = []
+
+    def mock_get_run(_, __):
+        checks.append(held_slots())
+        return MagicMock(status=RunsService.COMPLETE if checks[1:] else "running")
+
+    monkeypatch.setattr(SpellClient, "_get_run", mock_get_run)
+    trigger = SpellRunTrigger(
+        run_id="test1",
+        spell_conn_id="testing-spell-trigger",
+        poll_interval=0,
+        admission_ticket="ticket",
+        machine_type="GPU-V100",
+    )
+
+    assert_that(first_event(trigger).payload, mapping_includes({"status": "success"}))
+    assert_that(checks, equal_to([[], ["ticket"]]))
+    assert_that(held_slots(), equal_to([]))
+
+
+def test_run_exceeding_a_status_timeout_is_stopped(monkeypatch):
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: MagicMock(status="building")
+    )
+    stop_run = MagicMock(return_value=True)
+    monkeypatch.setattr(SpellClient, "stop_run", stop_run)
+    trigger = SpellRunTrigger(
+        run_id="test1", poll_interval=0, status_timeouts={"building": 0}
+    )
+
+    assert_that(first_event(trigger).payload, mapping_includes({"status": "error"}))
+    stop_run.assert_called_once()
+
+
+def test_cancelled_trigger_stops_the_run_of_a_task_no_longer_deferred(monkeypatch):
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: MagicMock(status="running")
+    )
+    stop_run = MagicMock(return_value=True)
+    monkeypatch.setattr(SpellClient, "stop_run", stop_run)
+    trigger = SpellRunTrigger(run_id="test1", poll_interval=60)
+
+    cancel_while_running(trigger)
+
+    stop_run.assert_called_once_with("test1", "the Airflow task is no longer deferred")
+
+
+def test_cancelled_trigger_leaves_the_run_of_a_deferred_task(monkeypatch):
+    monkeypatch.setattr(
+        SpellClient, "_get_run", lambda _, __: MagicMock(status="running")
+    )
+    monkeypatch.setattr(SpellRunTrigger, "_task_deferred", lambda _: True)
+    stop_run = MagicMock(return_value=True)
+    monkeypatch.setattr(SpellClient, "stop_run", stop_run)
+    trigger = SpellRunTrigger(run_id="test1", poll_interval=60)
+
+    cancel_while_running(trigger)
+
+    stop_run.assert_not_called()